@@ -9,6 +9,9 @@
 # @date 03 Sep 2025
 # @version 0.1.0
 #
+# mcp-param: cloud-provider: aws|azure|gcp, required - Cloud provider.
+# mcp-param: action: analyze|recommend, required - Action to perform.
+#
 ################################################################################
 
 set -o errexit
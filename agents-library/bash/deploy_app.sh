@@ -9,6 +9,13 @@
 # @date 02 Sep 2025
 # @version 0.1.0
 #
+# mcp-param: app-name: string, required - Name of the application to deploy.
+# mcp-param: version: string, required - Version of the application (e.g., Docker image tag).
+# mcp-param: environment: string, required - Deployment environment (e.g., dev, staging, prod).
+# mcp-param: cloud-provider: aws|azure|gcp, required - Cloud provider.
+# mcp-param: region: string - Cloud region for deployment. Defaults to provider's default.
+# mcp-param: config-file: string - Path to an environment-specific configuration file.
+#
 ################################################################################
 
 set -o errexit
@@ -9,6 +9,13 @@
 # @date 03 Sep 2025
 # @version 0.1.0
 #
+# mcp-param: cloud-provider: aws|azure|gcp, required - Cloud provider.
+# mcp-param: resource-type: string, required - Type of resource (e.g., ec2-instance, load-balancer, database).
+# mcp-param: resource-name: string, required - Name of the resource to check.
+# mcp-param: check-type: string, required - Type of health check (e.g., http, tcp, database).
+# mcp-param: endpoint: string - URL for HTTP checks.
+# mcp-param: port: integer, min=1, max=65535 - Port for TCP checks.
+#
 ################################################################################
 
 set -o errexit
@@ -9,6 +9,14 @@
 # @date 02 Sep 2025
 # @version 0.1.0
 #
+# mcp-param: resource-type: string, required - Type of resource (e.g., s3-bucket, ec2-instance, rds-database).
+# mcp-param: action: create|delete|update, required - Action to perform.
+# mcp-param: resource-name: string, required - Name of the resource.
+# mcp-param: cloud-provider: aws|azure|gcp, required - Cloud provider.
+# mcp-param: region: string - Cloud region. Defaults to provider's default.
+# mcp-param: config-file: string - Path to a resource-specific configuration file.
+# mcp-param: tags: string - Comma-separated key=value pairs for resource tags.
+#
 ################################################################################
 
 set -o errexit
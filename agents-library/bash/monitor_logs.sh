@@ -9,6 +9,13 @@
 # @date 03 Sep 2025
 # @version 0.1.0
 #
+# mcp-param: cloud-provider: aws|azure|gcp, required - Cloud provider.
+# mcp-param: app-name: string, required - Name of the application or service to monitor logs for.
+# mcp-param: log-group: string - Specific log group or stream to query.
+# mcp-param: start-time: string - Start time for log retrieval (e.g., '2025-09-01T00:00:00Z').
+# mcp-param: end-time: string - End time for log retrieval.
+# mcp-param: filter: string - Filter pattern for log messages.
+#
 ################################################################################
 
 set -o errexit
@@ -0,0 +1,256 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+
+import httpx
+from authlib.jose import JsonWebKey, JsonWebToken
+from authlib.jose.errors import JoseError
+
+from app.metrics import AUTH_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALGORITHMS = ("RS256", "ES256")
+# A token signed with a key the JWKS does not hold triggers a refresh, at most
+# this often, to pick up rotated keys without letting bogus tokens hammer the
+# issuer
+MIN_REFRESH_INTERVAL = 10.0
+FETCH_TIMEOUT = 10.0
+
+
+class AuthError(Exception):
+    """A request without a valid bearer token."""
+
+
+class AuthUnavailableError(Exception):
+    """The signing keys could not be fetched from the issuer."""
+
+
+class JwksCache:
+    """Holds the signing keys of the issuer and refreshes them in the background.
+
+    The keys are fetched on first use. Once they are older than
+    refresh_interval, requests keep using them while one refresh runs in the
+    background. A key ID that is not in the set is looked up again right away,
+    at most every MIN_REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str | None = None,
+        issuer: str | None = None,
+        refresh_interval: float = 300.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        if not jwks_url and not issuer:
+            raise ValueError("Either jwks_url or issuer is required.")
+        self.jwks_url = jwks_url
+        self.issuer = issuer
+        self.refresh_interval = refresh_interval
+        self.transport = transport
+        self.fetches = 0
+        self._keys: dict[str | None, Any] = {}
+        self._fetched_at: float | None = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+
+    async def get(self, kid: str | None) -> Any:
+        """Returns the key with the given ID.
+
+        Raises:
+            AuthError: The issuer has no such key.
+            AuthUnavailableError: The keys could not be fetched.
+        """
+        if self._fetched_at is None:
+            await self.refresh()
+        elif time.monotonic() - self._fetched_at > self.refresh_interval and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_in_background())
+        key = self._find(kid)
+        if key is None and time.monotonic() - self._fetched_at >= MIN_REFRESH_INTERVAL:
+            await self.refresh()
+            key = self._find(kid)
+        if key is None:
+            raise AuthError(f"Unknown signing key {kid!r}.")
+        return key
+
+    def _find(self, kid: str | None) -> Any:
+        """Looks up a key, a token without a key ID matches a set with a single key."""
+        if kid is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        return self._keys.get(kid)
+
+    async def refresh(self) -> None:
+        """Fetches the keys unless a concurrent call just did."""
+        started = time.monotonic()
+        async with self._lock:
+            if self._fetched_at is not None and self._fetched_at >= started:
+                return
+            try:
+                key_set = await self._fetch()
+            except (httpx.HTTPError, ValueError, JoseError) as e:
+                if self._fetched_at is None:
+                    raise AuthUnavailableError(f"Could not fetch the signing keys: {e}") from e
+                logger.warning("Could not refresh the signing keys, keeping the old ones: %s", e)
+                self._fetched_at = time.monotonic()
+                return
+            self._keys = {key.kid: key for key in key_set.keys}
+            self._fetched_at = time.monotonic()
+            self.fetches += 1
+            logger.info("Loaded %d signing keys from %s", len(self._keys), self.jwks_url)
+
+    async def _refresh_in_background(self) -> None:
+        try:
+            await self.refresh()
+        finally:
+            self._refresh_task = None
+
+    async def _fetch(self) -> Any:
+        """Downloads the key set, discovering its URL from the issuer if needed."""
+        async with httpx.AsyncClient(transport=self.transport, timeout=FETCH_TIMEOUT) as client:
+            if not self.jwks_url:
+                response = await client.get(f"{self.issuer.rstrip('/')}/.well-known/openid-configuration")
+                response.raise_for_status()
+                self.jwks_url = response.json()["jwks_uri"]
+            response = await client.get(self.jwks_url)
+            response.raise_for_status()
+            return JsonWebKey.import_key_set(response.json())
+
+
+class TokenValidator:
+    """Validates bearer JWTs locally against the keys of the issuer.
+
+    Verified tokens are kept in an LRU keyed by their SHA-256 hash, so a client
+    that sends the same token on every call pays for the signature check once.
+    Entries expire with the token, and after refresh_interval at the latest so
+    that tokens signed with a withdrawn key stop working once the keys are
+    refreshed.
+    """
+
+    def __init__(
+        self,
+        jwks: JwksCache,
+        *,
+        issuer: str | None = None,
+        audience: str | None = None,
+        algorithms: tuple[str, ...] | list[str] = DEFAULT_ALGORITHMS,
+        leeway: int = 30,
+        max_entries: int = 1024,
+    ) -> None:
+        self.jwks = jwks
+        self.jwt = JsonWebToken(list(algorithms))
+        self.claims_options: dict[str, dict] = {"exp": {"essential": True}}
+        if issuer:
+            self.claims_options["iss"] = {"essential": True, "value": issuer}
+        if audience:
+            self.claims_options["aud"] = {"essential": True, "value": audience}
+        self.leeway = leeway
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def validate(self, token: str) -> dict:
+        """Returns the claims of a valid token.
+
+        Raises:
+            AuthError: The token is malformed, expired or not signed by the issuer.
+            AuthUnavailableError: The keys could not be fetched.
+        """
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        cached = self._entries.get(digest)
+        if cached is not None:
+            expires, claims = cached
+            if now < expires:
+                self._entries.move_to_end(digest)
+                AUTH_REQUESTS.inc("cached")
+                return claims
+            del self._entries[digest]
+
+        key = await self.jwks.get(_header(token).get("kid"))
+        try:
+            claims = self.jwt.decode(token, key, claims_options=self.claims_options)
+            claims.validate(now=int(now), leeway=self.leeway)
+        except JoseError as e:
+            raise AuthError(e.description or e.error) from None
+        AUTH_REQUESTS.inc("verified")
+        self._entries[digest] = (min(claims["exp"] + self.leeway, now + self.jwks.refresh_interval), dict(claims))
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return dict(claims)
+
+
+def _header(token: str) -> dict:
+    """Decodes the JOSE header of a compact JWT without verifying it."""
+    segment = token.split(".", 1)[0]
+    try:
+        header = json.loads(base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4)))
+    except (binascii.Error, ValueError):
+        raise AuthError("Malformed token.") from None
+    if not isinstance(header, dict):
+        raise AuthError("Malformed token.")
+    return header
+
+
+def bearer_token(headers: list[tuple[bytes, bytes]]) -> str | None:
+    """Returns the token of an Authorization: Bearer header, if any."""
+    for name, value in headers:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token.strip():
+                return token.strip()
+    return None
+
+
+class BearerAuthMiddleware:
+    """Requires a valid bearer JWT on the protected paths.
+
+    The claims of the token are put into the request state as claims. Other
+    paths, e.g. /health and /metrics, pass through untouched.
+    """
+
+    def __init__(self, app: Any, validator: TokenValidator, paths: list[str]) -> None:
+        self.app = app
+        self.validator = validator
+        self.paths = {path.rstrip("/") or "/" for path in paths}
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        """Handles an ASGI call."""
+        if scope["type"] != "http" or (scope["path"].rstrip("/") or "/") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        token = bearer_token(scope["headers"])
+        if token is None:
+            AUTH_REQUESTS.inc("rejected")
+            await _reject(send, 401, "Bearer token required.", 'Bearer realm="mcp"')
+            return
+        try:
+            claims = await self.validator.validate(token)
+        except AuthError as e:
+            AUTH_REQUESTS.inc("rejected")
+            error = str(e).replace('"', "'")
+            await _reject(send, 401, str(e), f'Bearer realm="mcp", error="invalid_token", error_description="{error}"')
+            return
+        except AuthUnavailableError as e:
+            logger.error("%s", e)
+            await _reject(send, 503, "Authentication is unavailable.")
+            return
+        scope.setdefault("state", {})["claims"] = claims
+        await self.app(scope, receive, send)
+
+
+async def _reject(send: Any, status: int, detail: str, challenge: str | None = None) -> None:
+    """Sends a JSON error response."""
+    body = json.dumps({"detail": detail}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if challenge is not None:
+        headers.append((b"www-authenticate", challenge.encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
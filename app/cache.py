@@ -0,0 +1,182 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any
+
+from mcp.types import TextContent
+from starlette.responses import Response
+
+from app.compression import Codec, compress_body
+from app.library import ChangeSet
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONTENT_TYPE = "text/markdown"
+
+
+@dataclass(frozen=True)
+class CachedDocument:
+    """A document together with its pre-encoded get_agents_instructions payload.
+
+    The payload is either text or, for documents loaded from a snapshot, a
+    UTF-8 slice of the mapped snapshot file that is served without a copy.
+    """
+
+    name: str
+    content: str
+    digest: str
+    payload: str | memoryview
+    # Compressed bodies by content coding, filled on first request
+    variants: dict[str, bytes] = field(default_factory=dict, compare=False, repr=False)
+
+    @property
+    def etag(self) -> str:
+        """The strong HTTP entity tag of the document."""
+        return f'"{self.digest}"'
+
+    @cached_property
+    def text(self) -> str:
+        """The payload as text for MCP responses."""
+        return self.payload if isinstance(self.payload, str) else str(self.payload, "utf-8")
+
+    @cached_property
+    def body(self) -> bytes | memoryview:
+        """The UTF-8 encoded payload for plain HTTP responses."""
+        return self.payload.encode("utf-8") if isinstance(self.payload, str) else self.payload
+
+    async def compressed(self, codec: Codec, level: int) -> bytes:
+        """The body compressed with a codec, compressed once and reused afterwards."""
+        body = self.variants.get(codec.name)
+        if body is None:
+            body = self.variants[codec.name] = await compress_body(codec, self.body, level)
+        return body
+
+    @cached_property
+    def text_content(self) -> TextContent:
+        """The payload as an MCP content block, built once and reused."""
+        return TextContent(type="text", text=self.text)
+
+    def matches(self, if_none_match: str | None) -> bool:
+        """Whether an If-None-Match value refers to this version of the document."""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+            tag = tag.removeprefix("W/").strip('"')
+            if tag == self.digest:
+                return True
+        return False
+
+    def not_modified(self) -> TextContent:
+        """The small reply sent instead of the document when the client copy is current."""
+        return TextContent(type="text", text=encode({"not_modified": True, "etag": self.etag}))
+
+
+def encode(payload: dict | list) -> str:
+    """Serializes a response payload as compact JSON."""
+    if orjson is not None:
+        return orjson.dumps(payload).decode("utf-8")
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_bytes(payload: dict | list) -> bytes:
+    """Serializes a response payload as compact UTF-8 JSON for HTTP responses."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_members(members: dict[str, str]) -> str:
+    """Serializes a JSON object whose values are already serialized."""
+    return "{" + ",".join(f"{json.dumps(key, ensure_ascii=False)}:{value}" for key, value in members.items()) + "}"
+
+
+class JoinedResponse(Response):
+    """A response whose body is sent in parts instead of being joined into one copy.
+
+    Used to wrap pre-serialized JSON, e.g. the cached payload of a document,
+    in an envelope.
+    """
+
+    def __init__(
+        self,
+        parts: list[bytes | memoryview],
+        status_code: int = 200,
+        headers: dict[str, str] | None = None,
+        media_type: str | None = None,
+    ) -> None:
+        self.parts = parts
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.headers["content-length"] = str(sum(len(part) for part in parts))
+
+    async def __call__(self, _scope: dict, _receive: Any, send: Any) -> None:
+        """Sends the parts as consecutive body chunks."""
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        last = len(self.parts) - 1
+        for i, part in enumerate(self.parts):
+            await send({"type": "http.response.body", "body": part, "more_body": i < last})
+
+
+def document_digest(content: str) -> str:
+    """Returns the SHA-256 hex digest of a document, which is also its ETag."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def encode_document(content: str, digest: str) -> str:
+    """Serializes the get_agents_instructions payload of a document."""
+    return encode({"content": content, "content_type": CONTENT_TYPE, "etag": f'"{digest}"'})
+
+
+class DocumentCache:
+    """Caches the serialized get_agents_instructions payload of each document.
+
+    An entry is rebuilt only when the document string it was built from is
+    replaced. The library does not replace documents rewritten with
+    identical content, so their entries and compressed bodies stay.
+    """
+
+    def __init__(self, documents: dict[str, str]) -> None:
+        self.documents = documents
+        self._entries: dict[str, CachedDocument] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, name: str) -> CachedDocument | None:
+        """Returns the cached payload for a document, or None if it does not exist."""
+        content = self.documents.get(name)
+        if content is None:
+            self._entries.pop(name, None)
+            return None
+        entry = self._entries.get(name)
+        if entry is None or entry.content is not content:
+            entry = self._entries[name] = self._build(name, content)
+        return entry
+
+    def invalidate(self, changes: ChangeSet) -> None:
+        """Drops the entries of changed and removed documents."""
+        for name in (*changes.changed, *changes.removed):
+            self._entries.pop(name, None)
+
+    def preload(self, name: str, content: str, digest: str, payload: memoryview) -> None:
+        """Adds an entry whose payload was encoded ahead of time.
+
+        The entry is only used while content is the current document.
+        """
+        if self.documents.get(name) is content:
+            self._entries[name] = CachedDocument(name=name, content=content, digest=digest, payload=payload)
+
+    def clear(self) -> None:
+        """Drops every entry."""
+        self._entries.clear()
+
+    @staticmethod
+    def _build(name: str, content: str) -> CachedDocument:
+        digest = document_digest(content)
+        return CachedDocument(name=name, content=content, digest=digest, payload=encode_document(content, digest))
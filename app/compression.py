@@ -0,0 +1,224 @@
+import asyncio
+import zlib
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies smaller than this are sent as they are, the framing overhead eats
+# most of the saving
+DEFAULT_MINIMUM_SIZE = 1024
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+# Bodies from this size on are compressed on a worker thread, gzip takes
+# several milliseconds for them
+THREAD_MINIMUM_SIZE = 64 * 1024
+# Media types worth compressing, event streams are left alone so that every
+# event reaches the client as soon as it is sent
+COMPRESSIBLE_TYPES = ("text/markdown", "text/plain", "application/json")
+
+
+class StreamCompressor(Protocol):
+    """Compresses a body that is sent in several chunks."""
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses a chunk, returning whatever output is ready."""
+        ...
+
+    def flush(self) -> bytes:
+        """Ends the stream and returns the remaining output."""
+        ...
+
+
+@dataclass(frozen=True)
+class Codec:
+    """A content coding with one-shot and streaming compression."""
+
+    name: str
+    compress: Callable[[bytes | memoryview, int], bytes]
+    compressobj: Callable[[int], StreamCompressor]
+
+
+class _BrotliStream:
+    """Adapts brotli.Compressor to the StreamCompressor protocol."""
+
+    def __init__(self, level: int) -> None:
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses a chunk."""
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        """Ends the stream."""
+        return self._compressor.finish()
+
+
+def _codecs() -> dict[str, Codec]:
+    """Returns the codecs available in this environment, by content coding."""
+    codecs = {
+        "gzip": Codec(
+            "gzip",
+            lambda data, level: zlib.compress(data, level, wbits=31),
+            lambda level: zlib.compressobj(level, zlib.DEFLATED, 31),
+        )
+    }
+    if brotli is not None:
+        codecs["br"] = Codec("br", lambda data, level: brotli.compress(data, quality=level), _BrotliStream)
+    if zstandard is not None:
+        codecs["zstd"] = Codec(
+            "zstd",
+            lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+            lambda level: zstandard.ZstdCompressor(level=level).compressobj(),
+        )
+    return codecs
+
+
+CODECS = _codecs()
+
+
+def negotiate(accept_encoding: str | None, encodings: list[str]) -> str | None:
+    """Picks the content coding for a response from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: The header value, may be None.
+        encodings: The codings the server offers, most preferred first.
+
+    Returns:
+        The coding with the highest quality value, the server preference
+        breaking ties, or None to send the body as it is.
+    """
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for coding in encodings:
+        weight = weights.get(coding, wildcard)
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+async def compress_body(codec: Codec, body: bytes | memoryview, level: int) -> bytes:
+    """Compresses a whole body without stalling the event loop on large ones."""
+    if len(body) < THREAD_MINIMUM_SIZE:
+        return codec.compress(body, level)
+    return await asyncio.to_thread(codec.compress, body, level)
+
+
+def compressible(headers: Headers) -> bool:
+    """Whether a response with these headers may be compressed."""
+    if "content-encoding" in headers:
+        return False
+    media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    return media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Compresses HTTP responses in the coding negotiated with the client.
+
+    Responses that are already encoded, e.g. the pre-compressed documents of
+    the /agents endpoint, and event streams pass through untouched.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        encodings: list[str],
+        minimum_size: int = DEFAULT_MINIMUM_SIZE,
+        levels: dict[str, int] | None = None,
+    ) -> None:
+        self.app = app
+        self.encodings = [encoding for encoding in encodings if encoding in CODECS]
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        """Handles an ASGI call."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingSender(send, CODECS[encoding], self.levels[encoding], self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+class _CompressingSender:
+    """Wraps the ASGI send callable of one response."""
+
+    def __init__(self, send: Any, codec: Codec, level: int, minimum_size: int) -> None:
+        self.send = send
+        self.codec = codec
+        self.level = level
+        self.minimum_size = minimum_size
+        self.start: dict | None = None
+        self.compressor: StreamCompressor | None = None
+
+    async def __call__(self, message: dict) -> None:
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows whether to compress
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        if self.start is not None:
+            await self._begin(message)
+        elif self.compressor is not None:
+            body = self.compressor.compress(message.get("body", b""))
+            if not message.get("more_body", False):
+                body += self.compressor.flush()
+            await self.send({**message, "body": body})
+        else:
+            await self.send(message)
+
+    async def _begin(self, message: dict) -> None:
+        """Sends the held response start together with the first body chunk."""
+        start, self.start = self.start, None
+        headers = MutableHeaders(raw=list(start["headers"]))
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if (
+            not compressible(headers)
+            or start["status"] in (204, 304)
+            or (not more_body and len(body) < self.minimum_size)
+        ):
+            await self.send(start)
+            await self.send(message)
+            return
+        headers["Content-Encoding"] = self.codec.name
+        headers.add_vary_header("Accept-Encoding")
+        if more_body:
+            del headers["Content-Length"]
+            self.compressor = self.codec.compressobj(self.level)
+            body = self.compressor.compress(body)
+        else:
+            body = await compress_body(self.codec, body, self.level)
+            headers["Content-Length"] = str(len(body))
+        await self.send({**start, "headers": headers.raw})
+        await self.send({**message, "body": body})
@@ -0,0 +1,53 @@
+import functools
+import logging
+import os
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+
+def load_config() -> dict:
+    """Loads configuration from config.yaml and overrides with environment variables."""
+    with open("config.yaml") as f:
+        cfg = yaml.safe_load(f)
+
+    # Override config with environment variables
+    def _override_config_with_env(current_config: dict, prefix: str = "") -> dict:
+        for key, value in current_config.items():
+            env_var_name = f"{prefix}{key}".upper()
+            if isinstance(value, dict):
+                _override_config_with_env(value, f"{env_var_name}_")
+            elif env_var_name in os.environ:
+                # Attempt to convert environment variable to the same type as the config value
+                try:
+                    # bool is a subclass of int, so it has to be checked first
+                    if isinstance(value, bool):
+                        current_config[key] = os.environ[env_var_name].lower() in (
+                            "true",
+                            "1",
+                            "t",
+                            "y",
+                            "yes",
+                        )
+                    elif isinstance(value, int):
+                        current_config[key] = int(os.environ[env_var_name])
+                    elif isinstance(value, float):
+                        current_config[key] = float(os.environ[env_var_name])
+                    else:
+                        current_config[key] = os.environ[env_var_name]
+                except ValueError:
+                    logger.warning(
+                        "Could not convert environment variable %s to type of %s. Using default.",
+                        env_var_name,
+                        key,
+                    )
+        return current_config
+
+    return _override_config_with_env(cfg)
+
+
+@functools.cache
+def get_config() -> dict:
+    """Returns the configuration of this process, loading it on first use."""
+    return load_config()
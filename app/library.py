@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable, Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Protocol, TypeVar
+
+from app.metrics import LIBRARY_REFRESH
+from app.storage import FileSignature, FileStorage, LibraryStorage, Signature
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PreloadedDocument(Protocol):
+    """A document whose content was read ahead of time, e.g. from a snapshot.
+
+    It is used instead of reading the file while the file still has the
+    recorded modification time and size.
+    """
+
+    mtime_ns: int
+    size: int
+
+    @property
+    def content(self) -> str:
+        """The document text."""
+        ...
+
+
+@dataclass
+class ChangeSet:
+    """The documents that were added, changed or removed by a refresh."""
+
+    added: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+class AgentsLibrary:
+    """Keeps a documents dict in sync with the documents in a storage backend.
+
+    Each refresh only scans the signatures of the stored documents, e.g. the
+    mtime, size and inode of the AGENTS.md files, compares them against the
+    recorded ones and then reads the documents that were added or changed.
+    The collected changes are applied to the documents dict in a single
+    synchronous step, so coroutines on the event loop never see a half-applied
+    refresh.
+
+    All storage I/O runs on a bounded thread pool so that a slow volume never
+    blocks the event loop.
+    """
+
+    def __init__(
+        self,
+        documents: dict[str, str],
+        root: Path | None = None,
+        io_workers: int = 8,
+        storage: LibraryStorage | None = None,
+    ) -> None:
+        self.documents = documents
+        self.io_workers = io_workers
+        self.storage = storage if storage is not None or root is None else FileStorage(root)
+        self._executor: ThreadPoolExecutor | None = None
+        self._signatures: dict[str, Signature] = {}
+        # Revision of the storage as of the last full refresh
+        self._revision: int | None = None
+        self._listeners: list[Callable[[ChangeSet], None]] = []
+        self._lock = asyncio.Lock()
+
+    @property
+    def markdown_dir(self) -> Path | None:
+        """The directory holding the AGENTS.md files when the documents are files."""
+        return self.storage.markdown_dir if isinstance(self.storage, FileStorage) else None
+
+    def signature(self, name: str) -> Signature | None:
+        """Returns the signature of a document as of the last refresh or write."""
+        return self._signatures.get(name)
+
+    async def run_io(self, func: Callable[..., T], *args: Any) -> T:
+        """Runs a blocking function on the library's I/O thread pool."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="agents-io")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def close(self) -> None:
+        """Shuts down the I/O thread pool and closes the storage. Both are reopened on the next use."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self.storage is not None:
+            self.storage.close()
+
+    def subscribe(self, listener: Callable[[ChangeSet], None]) -> None:
+        """Registers a callback that is invoked with every non-empty change set.
+
+        Listeners run synchronously right after the documents dict is updated,
+        so derived state never lags behind the documents.
+        """
+        self._listeners.append(listener)
+
+    async def load(
+        self, source: Path | LibraryStorage, preloaded: Mapping[str, PreloadedDocument] | None = None
+    ) -> ChangeSet:
+        """Sets the storage and loads every document from it.
+
+        Args:
+            source: The storage, or an agents library root whose AGENTS.md
+                files hold the documents.
+            preloaded: Documents read ahead of time. Only the files that
+                changed since are read from disk.
+        """
+        self.storage = FileStorage(source) if isinstance(source, Path) else source
+        self._revision = None
+        if not await self.run_io(self.storage.exists):
+            logger.warning("Directory not found: %s", self.storage.location)
+            return ChangeSet()
+        start = time.perf_counter()
+        changes = await self.refresh(preloaded=preloaded)
+        if logger.isEnabledFor(logging.DEBUG):
+            for name in changes.added:
+                logger.debug("Loaded document %s", name)
+        logger.info(
+            "Loaded %d documents from %s in %.1f ms",
+            len(changes.added),
+            self.storage.location,
+            (time.perf_counter() - start) * 1000,
+        )
+        return changes
+
+    async def refresh(
+        self, names: Iterable[str] | None = None, *, preloaded: Mapping[str, PreloadedDocument] | None = None
+    ) -> ChangeSet:
+        """Picks up changes made to the storage and applies them to the documents dict.
+
+        A refresh of all documents is skipped when the storage keeps a
+        revision and it has not changed since the last one.
+
+        Args:
+            names: Restrict the refresh to these documents. All documents are
+                checked when omitted.
+            preloaded: Documents read ahead of time, used instead of reading
+                files whose modification time and size still match.
+        """
+        storage = self.storage
+        if storage is None:
+            return ChangeSet()
+        names = None if names is None else set(names)
+        async with self._lock:
+            start = time.perf_counter()
+            revision = None
+            if names is None:
+                # Read before the scan, so a write in between is caught by the next refresh
+                revision = await self.run_io(storage.revision)
+                if revision is not None and revision == self._revision:
+                    return ChangeSet()
+                current = await self.run_io(storage.scan)
+                known = self._signatures
+            else:
+                current = await self.run_io(storage.scan, names)
+                known = {n: s for n, s in self._signatures.items() if n in names}
+            stale = [n for n, signature in current.items() if known.get(n) != signature or n not in self.documents]
+            read = _preloaded_contents(stale, current, preloaded) if preloaded else {}
+            unread = [name for name in stale if name not in read] if read else stale
+            if preloaded and names is None:
+                logger.info("Took %d AGENTS.md files from the snapshot, reading %d", len(read), len(unread))
+            # Read in batches so a large cold start does not pay one future per document
+            size = storage.read_batch_size
+            batches = [unread[i : i + size] for i in range(0, len(unread), size)]
+            results = [
+                content
+                for batch in await asyncio.gather(*(self.run_io(storage.read, b) for b in batches))
+                for content in batch
+            ]
+            read.update(zip(unread, results, strict=True))
+
+            changes = ChangeSet()
+            contents: dict[str, str] = {}
+            signatures: dict[str, Signature] = {}
+            for name in stale:
+                content = read[name]
+                if content is None:
+                    continue
+                signatures[name] = current[name]
+                if name not in self.documents:
+                    changes.added.append(name)
+                elif self.documents[name] != content:
+                    changes.changed.append(name)
+                else:
+                    # Touched but identical, only the signature needs recording
+                    continue
+                contents[name] = content
+            checked = set(known) | (set(self.documents) if names is None else names & set(self.documents))
+            changes.removed = sorted(checked - set(current))
+            self._apply(changes, contents, signatures)
+            if names is None:
+                self._revision = revision
+            LIBRARY_REFRESH.observe(time.perf_counter() - start)
+        return changes
+
+    async def write(self, name: str, content: str) -> ChangeSet:
+        """Atomically stores a document and applies it to the documents dict.
+
+        The written content is taken as the document with the signature the
+        storage returned, so it is not read back.
+        """
+        if self.storage is None:
+            raise RuntimeError("Agents library storage is not set.")
+        async with self._lock:
+            signature = await self.run_io(self.storage.write, name, content)
+            return self._written(name, content, signature)
+
+    async def update(self, name: str, change: Callable[[str | None], str]) -> ChangeSet:
+        """Rewrites a document from its stored content, see LibraryStorage.update.
+
+        The check and the write are atomic across every process writing to
+        the storage, so change may raise to reject an update that was made
+        against content another process has replaced since.
+        """
+        if self.storage is None:
+            raise RuntimeError("Agents library storage is not set.")
+        async with self._lock:
+            content, signature = await self.run_io(self.storage.update, name, change)
+            return self._written(name, content, signature)
+
+    def _written(self, name: str, content: str, signature: Signature) -> ChangeSet:
+        """Applies a document this process stored, which is not read back."""
+        changes = ChangeSet()
+        if name not in self.documents:
+            changes.added.append(name)
+        elif self.documents[name] != content:
+            changes.changed.append(name)
+        self._apply(changes, {name: content}, {name: signature})
+        return changes
+
+    def _apply(self, changes: ChangeSet, contents: dict[str, str], signatures: dict[str, Signature]) -> None:
+        """Applies a collected change set without yielding to the event loop."""
+        for name in changes.removed:
+            self.documents.pop(name, None)
+            self._signatures.pop(name, None)
+        for name in (*changes.added, *changes.changed):
+            self.documents[name] = contents[name]
+        self._signatures.update(signatures)
+        if changes:
+            for listener in self._listeners:
+                listener(changes)
+
+
+class LibrarySize:
+    """Tracks the number and total UTF-8 size of the documents in the library.
+
+    Sizes are updated from change sets, so scrapes never walk the documents.
+    """
+
+    def __init__(self, documents: dict[str, str]) -> None:
+        self.documents = documents
+        self._sizes: dict[str, int] = {}
+        self.total_bytes = 0
+
+    def apply(self, changes: ChangeSet) -> None:
+        """Updates the sizes of added, changed and removed documents."""
+        for name in changes.removed:
+            self.total_bytes -= self._sizes.pop(name, 0)
+        for name in (*changes.added, *changes.changed):
+            content = self.documents[name]
+            size = len(content) if content.isascii() else len(content.encode("utf-8"))
+            self.total_bytes += size - self._sizes.get(name, 0)
+            self._sizes[name] = size
+
+
+def _preloaded_contents(
+    names: list[str], current: dict[str, Signature], preloaded: Mapping[str, PreloadedDocument]
+) -> dict[str, str | None]:
+    """Returns the preloaded contents of the files that did not change since."""
+    contents: dict[str, str | None] = {}
+    for name in names:
+        document = preloaded.get(name)
+        signature = current[name]
+        if (
+            document is not None
+            and isinstance(signature, FileSignature)
+            and document.mtime_ns == signature.mtime_ns
+            and document.size == signature.size
+        ):
+            contents[name] = document.content
+    return contents
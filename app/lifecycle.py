@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any
+
+from app.logs import log_event
+from app.metrics import DRAIN_ABANDONED, DRAIN_DURATION, DRAIN_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Seconds a client is asked to wait before retrying a refused request
+RETRY_AFTER = 1
+
+
+class State(Enum):
+    """The phases of the server from startup to shutdown."""
+
+    STARTING = "starting"
+    READY = "ready"
+    DRAINING = "draining"
+    STOPPED = "stopped"
+
+
+class Lifecycle:
+    """Tracks whether the server takes work and the work that is in flight.
+
+    The server is ready once the library is loaded and warm. Draining stops
+    new work from being accepted and waits for the tracked work to finish,
+    requests and script runs alike, up to a deadline. on_deadline is called
+    when work is still in flight then, to kill the scripts that hold it up.
+    """
+
+    def __init__(self, drain_timeout: float = 30.0, on_deadline: Callable[[], Awaitable[None]] | None = None) -> None:
+        self.drain_timeout = drain_timeout
+        self.on_deadline = on_deadline
+        self.state = State.STARTING
+        self.in_flight: Counter[str] = Counter()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._drain: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether new work is accepted."""
+        return self.state is State.READY
+
+    def mark_ready(self) -> None:
+        """Starts accepting work, unless the server is already shutting down."""
+        if self.state is State.STARTING:
+            self.state = State.READY
+
+    @contextmanager
+    def track(self, kind: str) -> Iterator[None]:
+        """Counts a unit of work as in flight until the block exits."""
+        self.in_flight[kind] += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight[kind] -= 1
+            if not self.in_flight[kind]:
+                del self.in_flight[kind]
+            if not self.in_flight:
+                self._idle.set()
+
+    async def drain(self) -> bool:
+        """Stops accepting work and waits up to drain_timeout seconds for the work in flight.
+
+        Calling it again waits for the drain that is already under way.
+
+        Returns:
+            Whether everything in flight finished before the deadline.
+        """
+        if self._drain is None:
+            self.state = State.DRAINING
+            self._drain = asyncio.ensure_future(self._wait())
+        return await asyncio.shield(self._drain)
+
+    def stop(self) -> None:
+        """Marks the end of the shutdown."""
+        self.state = State.STOPPED
+
+    async def _wait(self) -> bool:
+        start = time.perf_counter()
+        pending = sum(self.in_flight.values())
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.drain_timeout)
+            drained = True
+        except TimeoutError:
+            drained = False
+        abandoned = dict(self.in_flight)
+        for kind, count in abandoned.items():
+            DRAIN_ABANDONED.inc(kind, amount=count)
+        if not drained and self.on_deadline is not None:
+            await self.on_deadline()
+        duration = time.perf_counter() - start
+        DRAIN_DURATION.observe(duration, "drained" if drained else "timeout")
+        log_event(
+            logger,
+            "drain",
+            "Drained in-flight work" if drained else "Drain deadline passed with work in flight",
+            level=logging.INFO if drained else logging.WARNING,
+            pending=pending,
+            abandoned=abandoned,
+            duration_ms=round(duration * 1000, 1),
+        )
+        return drained
+
+
+# The lifecycles of the apps served by this process, drained by the launcher
+# before uvicorn stops listening
+LIFECYCLES: set[Lifecycle] = set()
+
+
+async def drain_all() -> None:
+    """Drains the lifecycles of the apps served by this process."""
+    await asyncio.gather(*(lifecycle.drain() for lifecycle in list(LIFECYCLES)))
+
+
+class DrainMiddleware:
+    """Refuses work while the server is starting or draining and counts the requests in flight.
+
+    Only POST requests to the given paths carry work. Everything else, e.g.
+    health checks, metrics and closing MCP sessions, is always served.
+    """
+
+    def __init__(self, app: Any, lifecycle: Lifecycle, paths: list[str]) -> None:
+        self.app = app
+        self.lifecycle = lifecycle
+        self.paths = {path.rstrip("/") or "/" for path in paths}
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        """Handles an ASGI call."""
+        if scope["type"] != "http" or scope["method"] != "POST" or (scope["path"].rstrip("/") or "/") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        if not self.lifecycle.ready:
+            await _refuse(send, self.lifecycle.state)
+            return
+        with self.lifecycle.track("request"):
+            await self.app(scope, receive, send)
+
+
+async def _refuse(send: Any, state: State) -> None:
+    """Sends a 503 asking the client to retry, on another connection when draining."""
+    DRAIN_REJECTED.inc(state.value)
+    body = json.dumps({"detail": f"The server is {state.value}, retry later."}).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(RETRY_AFTER).encode()),
+    ]
+    if state is not State.STARTING:
+        headers.append((b"connection", b"close"))
+    await send({"type": "http.response.start", "status": 503, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,205 @@
+import base64
+import binascii
+import bisect
+import fnmatch
+import functools
+import re
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from app.cache import DocumentCache
+from app.library import AgentsLibrary, ChangeSet
+from app.sections import OutlineStore, parse_outline
+from app.storage import SqliteStorage
+
+# Above this many added and removed documents the sorted names are rebuilt in
+# one sort rather than updated one by one
+BULK_UPDATE = 64
+# Names fetched per query when a glob filters the names listed by the storage
+STORAGE_BATCH = 500
+GLOB_SPECIAL = re.compile(r"[*?\[]")
+
+
+@dataclass(frozen=True, slots=True)
+class DocumentInfo:
+    """The listing metadata of a document, computed once per version."""
+
+    size: int
+    modified: float | None
+    headings: tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class ListingPage:
+    """One page of a listing and the cursor of the next one."""
+
+    names: list[str]
+    next_cursor: str | None
+
+
+class ListingIndex:
+    """Keeps the document names sorted and their listing metadata ready.
+
+    The index is updated from change sets, so a listing only bisects to the
+    cursor and walks one page instead of sorting every name. Pages are keyed
+    by the last name of the previous page, which keeps them stable while
+    documents are added or removed between requests. Hashes are taken from
+    the document cache, which the server fills at startup.
+
+    On the SQLite storage, fetch pages through the name index of the
+    database instead, which other servers write to as well. Documents they
+    added are refreshed into the library before they are listed.
+    """
+
+    def __init__(
+        self, library: AgentsLibrary, outlines: OutlineStore | None = None, cache: DocumentCache | None = None
+    ) -> None:
+        self.library = library
+        self.documents = library.documents
+        self.outlines = outlines
+        self.cache = cache
+        self._names: list[str] = []
+        self._info: dict[str, DocumentInfo] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def apply(self, changes: ChangeSet) -> None:
+        """Updates the names and metadata of the documents of a change set."""
+        removed = [name for name in changes.removed if self._info.pop(name, None) is not None]
+        added = [name for name in changes.added if name not in self._info]
+        if len(removed) + len(added) > BULK_UPDATE:
+            gone = set(removed)
+            self._names = sorted([*(name for name in self._names if name not in gone), *added])
+        else:
+            for name in removed:
+                del self._names[bisect.bisect_left(self._names, name)]
+            for name in added:
+                bisect.insort(self._names, name)
+        for name in (*added, *changes.changed):
+            self._info[name] = self._describe(name)
+
+    def _describe(self, name: str) -> DocumentInfo:
+        outline = self.outlines.get(name) if self.outlines is not None else None
+        if outline is None:
+            outline = parse_outline(self.documents[name])
+        signature = self.library.signature(name)
+        return DocumentInfo(
+            size=outline.size,
+            modified=signature.modified if signature is not None else None,
+            headings=tuple(section.title for section in outline.sections if section.level),
+        )
+
+    def page(
+        self, cursor: str | None = None, limit: int | None = None, prefix: str = "", glob: str = ""
+    ) -> ListingPage:
+        """Returns the names after a cursor that start with prefix and match a glob pattern.
+
+        Args:
+            cursor: The next_cursor of the previous page, None for the first page.
+            limit: The maximum number of names, all remaining names when None.
+            prefix: Only list names that start with it.
+            glob: A shell-style pattern the names must match, e.g. "py*_rules".
+
+        Raises:
+            ValueError: If the cursor is invalid.
+        """
+        after, prefix, match = _range(cursor, prefix, glob)
+        if prefix is None:
+            return ListingPage([], None)
+        names = self._names
+        position = max(bisect.bisect_right(names, after), bisect.bisect_left(names, prefix))
+        found: list[str] = []
+        for i in range(position, len(names)):
+            name = names[i]
+            if not name.startswith(prefix):
+                break
+            if match is not None and match(name) is None:
+                continue
+            if limit is not None and len(found) == limit:
+                return ListingPage(found, encode_cursor(found[-1]))
+            found.append(name)
+        return ListingPage(found, None)
+
+    async def fetch(
+        self, cursor: str | None = None, limit: int | None = None, prefix: str = "", glob: str = ""
+    ) -> ListingPage:
+        """Returns the same page as page, from the name index of the storage when it has one.
+
+        Raises:
+            ValueError: If the cursor is invalid.
+        """
+        storage = self.library.storage
+        if not isinstance(storage, SqliteStorage):
+            return self.page(cursor, limit, prefix, glob)
+        after, prefix, match = _range(cursor, prefix, glob)
+        if prefix is None:
+            return ListingPage([], None)
+        # One more name than the page tells whether there is a next one
+        batch_size = limit + 1 if limit is not None and match is None else STORAGE_BATCH
+        found: list[str] = []
+        next_cursor = None
+        while next_cursor is None:
+            batch = await self.library.run_io(storage.list_names, after, batch_size, prefix)
+            for name in batch:
+                if match is not None and match(name) is None:
+                    continue
+                if limit is not None and len(found) == limit:
+                    next_cursor = encode_cursor(found[-1])
+                    break
+                found.append(name)
+            if len(batch) < batch_size:
+                break
+            after = batch[-1]
+        unknown = [name for name in found if name not in self._info]
+        if unknown:
+            await self.library.refresh(unknown)
+            found = [name for name in found if name in self._info]
+        return ListingPage(found, next_cursor)
+
+    def describe(self, name: str) -> dict:
+        """Returns the listing entry of a document with its metadata."""
+        info = self._info[name]
+        entry: dict = {"name": name, "size": info.size, "modified": info.modified, "headings": list(info.headings)}
+        cached = self.cache.get(name) if self.cache is not None else None
+        if cached is not None:
+            entry["etag"] = cached.etag
+        return entry
+
+
+def _range(cursor: str | None, prefix: str, glob: str) -> tuple[str, str | None, Callable[[str], Any] | None]:
+    """Returns the name after which a page starts, the prefix of its names and the glob matcher.
+
+    The literal start of the pattern narrows the range like a prefix. The
+    prefix is None when no name can match both.
+    """
+    after = decode_cursor(cursor) if cursor else ""
+    literal = GLOB_SPECIAL.split(glob, maxsplit=1)[0] if glob else ""
+    if literal.startswith(prefix):
+        prefix = literal
+    elif not prefix.startswith(literal):
+        return after, None, None
+    return after, prefix, _compile(glob).match if glob else None
+
+
+def encode_cursor(name: str) -> str:
+    """Turns the last name of a page into an opaque cursor."""
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> str:
+    """Returns the name a cursor was made from.
+
+    Raises:
+        ValueError: If the cursor was not made by encode_cursor.
+    """
+    try:
+        return base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}.") from None
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(glob: str) -> re.Pattern:
+    return re.compile(fnmatch.translate(glob))
@@ -0,0 +1,109 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from typing import Any
+
+# Logger of the server components, every module logs to a child of it
+ROOT_LOGGER = "app"
+
+# Share of the records of each high-volume event that is written, by event name
+_sample_rates: dict[str, float] = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line.
+
+    Structured fields passed through log_event become top-level keys.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Serializes a record."""
+        entry: dict[str, Any] = {
+            "time": _timestamp(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry["event"] = event
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _timestamp(record: logging.LogRecord) -> str:
+    """Returns the record time as an ISO 8601 UTC timestamp with milliseconds."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+
+
+def log_event(logger: logging.Logger, event: str, message: str, *, level: int = logging.INFO, **fields: Any) -> None:
+    """Logs a structured record, sampling high-volume events.
+
+    Records below WARNING are dropped at the sample rate configured for the
+    event before a record is even created. Kept records of sampled events
+    carry the rate so that counts can be scaled back up.
+    """
+    if level < logging.WARNING:
+        rate = _sample_rates.get(event)
+        if rate is not None and rate < 1.0:
+            if random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"event": event, "fields": fields})
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Puts records on the queue as they are.
+
+    The stock handler formats the message and drops the exception on the
+    calling thread to make records picklable, which a thread queue does not
+    need.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Returns the record unchanged."""
+        return record
+
+
+def configure_logging(settings: dict) -> logging.handlers.QueueListener:
+    """Routes the server logs through a queue to a background writer thread.
+
+    Log calls on the event loop only put the record on an in-memory queue,
+    formatting and writing to stdout happens on the listener thread.
+
+    Args:
+        settings: The logging section of the configuration with the root
+            level, the output format, per-component levels and sample rates.
+
+    Returns:
+        The started listener, stop it on shutdown to flush pending records.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    if settings["format"] == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger(ROOT_LOGGER)
+    for previous in list(root.handlers):
+        root.removeHandler(previous)
+    root.addHandler(_QueueHandler(records))
+    root.setLevel(settings["level"].upper())
+    root.propagate = False
+    for name, level in (settings.get("levels") or {}).items():
+        logging.getLogger(name).setLevel(str(level).upper())
+
+    _sample_rates.clear()
+    _sample_rates.update({event: float(rate) for event, rate in (settings.get("sample_rates") or {}).items()})
+
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    return listener
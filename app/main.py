@@ -0,0 +1,79 @@
+"""Starts the server with the configured port and number of workers.
+
+Usage:
+    python -m app.main
+
+The launcher only loads the configuration and uvicorn. The app is created by
+the factory in the process that serves it, so with several workers the
+supervisor does not import the server stack it never uses.
+
+On SIGTERM or SIGINT every worker first drains: it refuses new tool calls,
+reports itself as not ready and waits for the calls and scripts in flight,
+while it still answers health checks and metrics scrapes. Only then does it
+stop listening and shut the app down.
+"""
+
+import socket
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from app.config import get_config
+from app.lifecycle import drain_all
+
+APP_FACTORY = "app.server:create_app"
+PROFILED_APP_FACTORY = "app.startup:create_profiled_app"
+
+
+class DrainingServer(uvicorn.Server):
+    """A uvicorn server that drains the apps it serves before it stops listening."""
+
+    async def shutdown(self, sockets: list[socket.socket] | None = None) -> None:
+        """Drains the in-flight work, then shuts down as uvicorn does."""
+        if not self.force_exit:
+            await drain_all()
+        await super().shutdown(sockets)
+
+
+def server_config(factory: str, port: int, workers: int, drain_timeout: float) -> uvicorn.Config:
+    """Returns the uvicorn configuration shared by both ways of running the server."""
+    # Connections still open once the work has drained, e.g. idle MCP event
+    # streams, are closed after the same timeout
+    return uvicorn.Config(
+        factory,
+        factory=True,
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        timeout_graceful_shutdown=max(1, round(drain_timeout)),
+    )
+
+
+def serve_workers(config: uvicorn.Config) -> None:
+    """Runs the server in several uvicorn worker processes sharing one socket.
+
+    uvicorn binds the shared socket without a protocol number, so asyncio
+    leaves Nagle's algorithm on for the connections the workers accept and
+    small keep-alive responses stall on delayed ACKs for 40 ms. Accepted
+    connections inherit TCP_NODELAY from the listening socket.
+    """
+    # Every worker process creates the app itself
+    server = DrainingServer(config)
+    sock = config.bind_socket()
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    Multiprocess(config, target=server.run, sockets=[sock]).run()
+
+
+def main() -> None:
+    """Runs the server with the configured port and number of workers."""
+    settings = get_config()["server"]
+    factory = PROFILED_APP_FACTORY if settings["profile_startup"] else APP_FACTORY
+    config = server_config(factory, int(settings["port"]), settings["workers"], settings["drain_timeout"])
+    if settings["workers"] > 1:
+        serve_workers(config)
+    else:
+        DrainingServer(config).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import bisect
+import functools
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from typing import Any
+
+from app.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond tool calls to long scripts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+ToolHandler = Callable[..., Awaitable[Any]]
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Adds to the count of a label combination."""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        """Returns the count of a label combination."""
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterator[str]:
+        """Yields the lines of the text exposition format."""
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class Gauge:
+    """A value read from a callback at scrape time, so updating it costs nothing."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], float | dict[tuple[str, ...], float]],
+        labels: tuple[str, ...] = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.collect = collect
+
+    def samples(self) -> Iterator[str]:
+        """Yields the lines of the text exposition format."""
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """Counts observations in fixed buckets, optionally split by labels.
+
+    An observation is one bisect and two additions, buckets are only made
+    cumulative when the metrics are scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = (*sorted(buckets), math.inf)
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Records one observation."""
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * len(self.buckets)
+            self._sums[labels] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        """Returns the number of observations of a label combination."""
+        return sum(self._counts.get(labels, ()))
+
+    def samples(self) -> Iterator[str]:
+        """Yields the lines of the text exposition format."""
+        for labels, counts in sorted(self._counts.items()):
+            total = 0
+            for bound, count in zip(self.buckets, counts, strict=True):
+                total += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {total}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(self._sums[labels])}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {total}"
+
+
+Metric = Counter | Gauge | Histogram
+
+
+class Registry:
+    """Holds the metrics of the server and renders them for Prometheus."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Adds a metric, replacing a previous metric of the same name."""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TOOL_CALLS = REGISTRY.register(
+    Counter("mcp_tool_calls_total", "MCP tool calls by tool and outcome.", ("tool", "outcome"))
+)
+TOOL_DURATION = REGISTRY.register(Histogram("mcp_tool_duration_seconds", "Time spent in MCP tool handlers.", ("tool",)))
+SCRIPT_RUNS = REGISTRY.register(
+    Counter("mcp_script_runs_total", "Script resource reads by script and outcome.", ("script", "outcome"))
+)
+SCRIPT_DURATION = REGISTRY.register(
+    Histogram("mcp_script_duration_seconds", "Time to serve a script resource, queueing included.", ("script",))
+)
+SCRIPT_SPAWN = REGISTRY.register(
+    Histogram("mcp_script_spawn_seconds", "Time to start a bash process for a script or a pool worker.")
+)
+SCRIPT_EXIT = REGISTRY.register(
+    Histogram("mcp_script_exit_seconds", "Time from the start of a script process until it exited.", ("script",))
+)
+SCRIPT_QUEUE_WAIT = REGISTRY.register(
+    Histogram("mcp_script_queue_wait_seconds", "Time script runs waited for a free slot.", ("script",))
+)
+SCRIPT_REJECTED = REGISTRY.register(
+    Counter(
+        "mcp_script_rejected_total",
+        "Script runs refused by the scheduler by reason: queue_full or queue_timeout.",
+        ("reason",),
+    )
+)
+LIBRARY_REFRESH = REGISTRY.register(
+    Histogram("mcp_library_refresh_seconds", "Duration of agents library loads and refreshes.")
+)
+RATE_LIMITED = REGISTRY.register(
+    Counter("mcp_rate_limited_total", "Requests rejected by the per-client rate limiter by budget.", ("budget",))
+)
+AUTH_REQUESTS = REGISTRY.register(
+    Counter("mcp_auth_requests_total", "Bearer token checks by result: cached, verified or rejected.", ("result",))
+)
+DRAIN_REJECTED = REGISTRY.register(
+    Counter("mcp_drain_rejected_total", "Requests refused while the server was starting or draining.", ("state",))
+)
+DRAIN_DURATION = REGISTRY.register(
+    Histogram("mcp_drain_duration_seconds", "Time spent draining in-flight work on shutdown.", ("outcome",))
+)
+DRAIN_ABANDONED = REGISTRY.register(
+    Counter("mcp_drain_abandoned_total", "Work still in flight when the drain deadline passed, by kind.", ("kind",))
+)
+
+
+def instrument_tool(name: str) -> Callable[[ToolHandler], ToolHandler]:
+    """Counts and times the calls of an async MCP tool handler and logs one record per call.
+
+    The wrapper keeps the signature of the handler, so FastMCP builds the
+    same input schema for it.
+    """
+
+    def decorator(func: ToolHandler) -> ToolHandler:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                duration = time.perf_counter() - start
+                TOOL_DURATION.observe(duration, name)
+                TOOL_CALLS.inc(name, outcome)
+                log_event(
+                    logger,
+                    "tool_call",
+                    "Tool call",
+                    level=logging.INFO if outcome == "ok" else logging.WARNING,
+                    tool=name,
+                    outcome=outcome,
+                    duration_ms=round(duration * 1000, 3),
+                )
+
+        return wrapper
+
+    return decorator
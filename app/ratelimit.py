@@ -0,0 +1,275 @@
+import json
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import Any
+
+from app.metrics import RATE_LIMITED
+
+# JSON-RPC error code of throttled MCP requests, in the range reserved for
+# implementation-defined server errors
+RATE_LIMITED_CODE = -32029
+SCRIPT_URI_PREFIX = "resource://scripts/"
+
+
+@dataclass(slots=True)
+class Bucket:
+    """The tokens of one client, refilled lazily when it is next used."""
+
+    tokens: float
+    updated: float
+
+
+class RateLimiter:
+    """A token bucket per client.
+
+    Every client starts with burst tokens and regains rate tokens per second
+    up to burst. Buckets are kept in least recently used order. A bucket that
+    was idle long enough to refill completely is indistinguishable from a new
+    one, so those are dropped from the front as new clients arrive, and the
+    least recently used bucket is dropped beyond max_clients. Every call does
+    a constant amount of work, apart from dropping idle buckets, which is paid
+    for by the calls that created them.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1.")
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # Seconds after which an unused bucket is full again
+        self.refill_time = burst / rate
+        self._buckets: OrderedDict[str, Bucket] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: str, cost: float = 1.0, now: float | None = None) -> float:
+        """Takes cost tokens from the bucket of a client.
+
+        Returns:
+            0.0 when the request may proceed, otherwise the seconds until the
+            bucket holds enough tokens again, infinite when cost exceeds burst.
+        """
+        retry_after = self.wait(key, cost, now)
+        if not retry_after:
+            self._buckets[key].tokens -= cost
+        return retry_after
+
+    def wait(self, key: str, cost: float = 1.0, now: float | None = None) -> float:
+        """Returns what acquire would return without taking any tokens."""
+        if cost > self.burst:
+            return math.inf
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._evict(now)
+            bucket = self._buckets[key] = Bucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        if bucket.tokens >= cost:
+            return 0.0
+        return (cost - bucket.tokens) / self.rate
+
+    def _evict(self, now: float) -> None:
+        """Drops the buckets that are full again and, beyond max_clients, the least recently used one."""
+        buckets = self._buckets
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest.updated < self.refill_time:
+                break
+            buckets.popitem(last=False)
+        if len(buckets) >= self.max_clients:
+            buckets.popitem(last=False)
+
+
+def client_key(scope: dict, session: str | None = None) -> str:
+    """Identifies the client of a request.
+
+    The authenticated subject comes first, then the MCP session, which the
+    caller only passes once the transport has issued it, and finally the
+    address of the peer.
+    """
+    claims = scope.get("state", {}).get("claims")
+    if claims and claims.get("sub"):
+        return f"sub:{claims['sub']}"
+    if session is not None:
+        return f"session:{session}"
+    client = scope.get("client")
+    return f"addr:{client[0]}" if client else "addr:unknown"
+
+
+def session_id(headers: list[tuple[bytes, bytes]]) -> str | None:
+    """Returns the Mcp-Session-Id header of a request or response."""
+    for name, value in headers:
+        if name == b"mcp-session-id":
+            return value.decode("latin-1")
+    return None
+
+
+def classify(body: bytes) -> tuple[int, int, Any]:
+    """Counts the tool calls and script reads in an MCP request body.
+
+    Returns:
+        The number of tool calls, the number of script reads and the ID of the
+        first request, to answer throttled JSON-RPC requests in kind.
+    """
+    try:
+        message = json.loads(body)
+    except ValueError:
+        return 0, 0, None
+    messages = message if isinstance(message, list) else [message]
+    tools = scripts = 0
+    request_id = None
+    for item in messages:
+        if not isinstance(item, dict):
+            continue
+        method = item.get("method")
+        params = item.get("params") if isinstance(item.get("params"), dict) else {}
+        if method == "tools/call":
+            tools += 1
+        elif method == "resources/read" and str(params.get("uri", "")).startswith(SCRIPT_URI_PREFIX):
+            scripts += 1
+        else:
+            continue
+        if request_id is None:
+            request_id = item.get("id")
+    return tools, scripts, request_id
+
+
+class RateLimitMiddleware:
+    """Throttles tool calls and script runs per client before any work is done.
+
+    Requests to the MCP endpoint are classified from their JSON-RPC method,
+    script resource reads draw from the scripts budget and tool calls from
+    the tools budget. /test/call_tool always draws from the tools budget.
+    A request is only charged when every budget it draws from can pay.
+    Throttled requests get a 429 with a Retry-After header right away, or
+    without one when the request costs more than a full bucket.
+
+    The Mcp-Session-Id header is chosen by the client, so it only identifies
+    a client when sessions are on and the transport issued that session ID
+    in a response seen here. Otherwise a throttled client could start over
+    with a new bucket by sending a made-up ID.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        tools: RateLimiter,
+        scripts: RateLimiter,
+        mcp_path: str,
+        tool_paths: list[str],
+        *,
+        sessions: bool = False,
+    ) -> None:
+        self.app = app
+        self.tools = tools
+        self.scripts = scripts
+        self.mcp_path = mcp_path.rstrip("/") or "/"
+        self.tool_paths = {path.rstrip("/") or "/" for path in tool_paths}
+        self.sessions = sessions
+        # Session IDs issued by the transport, least recently used first
+        self._issued: OrderedDict[str, None] = OrderedDict()
+        self.max_sessions = tools.max_clients
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        """Handles an ASGI call."""
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"].rstrip("/") or "/"
+        if path == self.mcp_path and self.sessions:
+            send = self._recording(send)
+        if path in self.tool_paths:
+            retry_after = self.tools.acquire(client_key(scope))
+            if retry_after:
+                await _throttle(send, "tools", retry_after)
+                return
+            await self.app(scope, receive, send)
+            return
+        if path != self.mcp_path:
+            await self.app(scope, receive, send)
+            return
+
+        # The JSON-RPC method is in the body, which is read here and replayed
+        messages = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            messages.append(message)
+            more_body = message["type"] == "http.request" and message.get("more_body", False)
+        tools, scripts, request_id = classify(b"".join(m.get("body", b"") for m in messages))
+        key = client_key(scope, self._session(scope))
+        charges = [
+            (budget, limiter, cost)
+            for budget, limiter, cost in (("scripts", self.scripts, scripts), ("tools", self.tools, tools))
+            if cost
+        ]
+        for budget, limiter, cost in charges:
+            retry_after = limiter.wait(key, cost)
+            if retry_after:
+                await _throttle(send, budget, retry_after, request_id)
+                return
+        for _, limiter, cost in charges:
+            limiter.acquire(key, cost)
+
+        async def _replay() -> dict:
+            return messages.pop(0) if messages else await receive()
+
+        await self.app(scope, _replay, send)
+
+    def _session(self, scope: dict) -> str | None:
+        """Returns the session of a request if the transport issued it."""
+        if not self.sessions:
+            return None
+        session = session_id(scope["headers"])
+        if session is None or session not in self._issued:
+            return None
+        self._issued.move_to_end(session)
+        return session
+
+    def _recording(self, send: Any) -> Any:
+        """Wraps send to remember the session IDs the transport issues."""
+
+        async def _send(message: dict) -> None:
+            if message["type"] == "http.response.start" and message["status"] < HTTPStatus.BAD_REQUEST:
+                session = session_id(message.get("headers", []))
+                if session is not None and session not in self._issued:
+                    self._issued[session] = None
+                    if len(self._issued) > self.max_sessions:
+                        self._issued.popitem(last=False)
+            await send(message)
+
+        return _send
+
+
+async def _throttle(send: Any, budget: str, retry_after: float, request_id: Any = None) -> None:
+    """Sends a 429, as a JSON-RPC error when the request was one.
+
+    A request that costs more than the budget holds can never succeed, its
+    429 has no Retry-After.
+    """
+    RATE_LIMITED.inc(budget)
+    hint: dict = {}
+    if math.isinf(retry_after):
+        detail = f"Request exceeds the rate limit for {budget}."
+    else:
+        detail = f"Rate limit for {budget} exceeded, retry after {retry_after:.2f} seconds."
+        hint["retry_after"] = retry_after
+    if request_id is not None:
+        error = {"code": RATE_LIMITED_CODE, "message": detail, "data": hint}
+        payload: dict = {"jsonrpc": "2.0", "id": request_id, "error": error}
+    else:
+        payload = {"detail": detail, **hint}
+    body = json.dumps(payload).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if hint:
+        headers.append((b"retry-after", str(math.ceil(retry_after)).encode()))
+    await send({"type": "http.response.start", "status": 429, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.scripts import OutputCallback, ScriptResult, ScriptRunner
+
+
+@dataclass
+class CacheStats:
+    """Counters of the script result cache."""
+
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+
+
+class ScriptResultCache:
+    """Caches the results of read-only scripts and coalesces identical concurrent runs.
+
+    Only scripts with a TTL are cached. Results are keyed by script and
+    arguments, kept for the TTL of the script and evicted least recently used
+    first once max_entries is reached. Failed runs are not cached. While a
+    run is in flight, identical runs wait for it and share its result instead
+    of starting their own process. Other scripts go straight to the runner.
+    """
+
+    def __init__(self, runner: ScriptRunner, ttls: dict[str, float] | None = None, max_entries: int = 256) -> None:
+        self.runner = runner
+        self.ttls = dict(ttls or {})
+        # TTLs from the configuration win over the ones scripts declare
+        self._configured = frozenset(self.ttls)
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries: OrderedDict[tuple, tuple[float, ScriptResult]] = OrderedDict()
+        self._in_flight: dict[tuple, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set_ttl(self, script: str, ttl: float | None) -> None:
+        """Sets or clears the TTL a script declares unless the configuration sets one."""
+        if script in self._configured:
+            return
+        if ttl:
+            self.ttls[script] = ttl
+        else:
+            self.ttls.pop(script, None)
+
+    def snapshot(self) -> dict:
+        """Describes the cache for the stats endpoint."""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "in_flight": len(self._in_flight),
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "coalesced": self.stats.coalesced,
+            "ttls": dict(sorted(self.ttls.items())),
+        }
+
+    async def run(
+        self, script_path: Path, args: list[str], script_timeout: float, *, on_output: OutputCallback | None = None
+    ) -> ScriptResult:
+        """Returns a cached result, joins an identical run in flight or runs the script.
+
+        The output of cached scripts is shared between callers and not streamed.
+        """
+        ttl = self.ttls.get(script_path.stem)
+        if not ttl:
+            return await self.runner.run(script_path, args, script_timeout, on_output=on_output)
+
+        key = (str(script_path), *args)
+        cached = self._entries.get(key)
+        if cached is not None:
+            expires, result = cached
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return result
+            del self._entries[key]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.stats.misses += 1
+            # The run gets its own task so that a caller that goes away does
+            # not cancel it for the others waiting on it
+            task = asyncio.create_task(self._run(key, ttl, script_path, args, script_timeout))
+            self._in_flight[key] = task
+        else:
+            self.stats.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _run(
+        self, key: tuple, ttl: float, script_path: Path, args: list[str], script_timeout: float
+    ) -> ScriptResult:
+        try:
+            result = await self.runner.run(script_path, args, script_timeout)
+        finally:
+            del self._in_flight[key]
+        if result.returncode == 0:
+            self._entries[key] = (time.monotonic() + ttl, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        """Drops every cached result."""
+        self._entries.clear()
+
+    async def close(self) -> None:
+        """Closes the wrapped runner, which kills the runs in flight, and waits for them to end."""
+        await self.runner.close()
+        await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+        self._entries.clear()
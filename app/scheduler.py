@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from app.metrics import SCRIPT_QUEUE_WAIT, SCRIPT_REJECTED
+from app.scripts import OutputCallback, ScriptResult, ScriptRunner
+
+
+class ScriptRejectedError(Exception):
+    """Raised when a script run is refused because the scheduler is saturated."""
+
+
+@dataclass
+class SchedulerStats:
+    """Counters describing how busy the script scheduler is."""
+
+    started: int = 0
+    rejected: int = 0
+    queue_timeouts: int = 0
+    waits: int = 0
+    wait_seconds_total: float = 0.0
+    max_wait_seconds: float = 0.0
+    max_queue_depth: int = 0
+
+    def record_wait(self, seconds: float) -> None:
+        """Adds the queue wait of a run that got a slot."""
+        self.waits += 1
+        self.wait_seconds_total += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+
+@dataclass(eq=False)
+class _Waiter:
+    script: str
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class ScriptScheduler:
+    """Bounds how many scripts run at once, in total and per script.
+
+    A run that finds no free slot waits in a bounded FIFO queue for at most
+    queue_timeout seconds. Once the queue holds max_queued runs, new runs are
+    rejected right away instead of piling up. A freed slot is handed to the
+    oldest waiter that may run, so a script at its own limit does not hold up
+    the runs of other scripts queued behind it.
+    """
+
+    def __init__(
+        self,
+        runner: ScriptRunner,
+        *,
+        max_concurrent: int = 8,
+        max_concurrent_per_script: int = 2,
+        max_queued: int = 64,
+        queue_timeout: float = 30.0,
+        script_limits: dict[str, int] | None = None,
+    ) -> None:
+        self.runner = runner
+        self.max_concurrent = max_concurrent
+        self.max_concurrent_per_script = max_concurrent_per_script
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.script_limits = dict(script_limits or {})
+        self.stats = SchedulerStats()
+        self._running: Counter[str] = Counter()
+        self._waiters: list[_Waiter] = []
+
+    @property
+    def running(self) -> int:
+        """The number of scripts running right now."""
+        return self._running.total()
+
+    @property
+    def queued(self) -> int:
+        """The number of runs waiting for a slot."""
+        return len(self._waiters)
+
+    def limit_for(self, script: str) -> int:
+        """Returns how many runs of a script may run at once."""
+        return self.script_limits.get(script, self.max_concurrent_per_script)
+
+    def snapshot(self) -> dict:
+        """Describes the current load and the counters collected so far."""
+        queued = Counter(waiter.script for waiter in self._waiters)
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "scripts": {
+                script: {"running": self._running[script], "queued": queued[script], "limit": self.limit_for(script)}
+                for script in sorted(self._running.keys() | queued.keys())
+            },
+            "started": self.stats.started,
+            "rejected": self.stats.rejected,
+            "queue_timeouts": self.stats.queue_timeouts,
+            "waits": self.stats.waits,
+            "wait_seconds_total": round(self.stats.wait_seconds_total, 6),
+            "max_wait_seconds": round(self.stats.max_wait_seconds, 6),
+            "max_queue_depth": self.stats.max_queue_depth,
+        }
+
+    async def run(
+        self, script_path: Path, args: list[str], script_timeout: float, *, on_output: OutputCallback | None = None
+    ) -> ScriptResult:
+        """Runs a script once a slot is free.
+
+        Raises:
+            ScriptRejectedError: If the queue is full or the run waited longer
+                than queue_timeout for a slot.
+            TimeoutError: If the script itself timed out.
+        """
+        script = script_path.stem
+        await self._acquire(script)
+        try:
+            return await self.runner.run(script_path, args, script_timeout, on_output=on_output)
+        finally:
+            self._release(script)
+
+    async def close(self) -> None:
+        """Closes the wrapped runner."""
+        await self.runner.close()
+
+    def _can_start(self, script: str) -> bool:
+        return self.running < self.max_concurrent and self._running[script] < self.limit_for(script)
+
+    def _start(self, script: str) -> None:
+        self._running[script] += 1
+        self.stats.started += 1
+
+    async def _acquire(self, script: str) -> None:
+        # Slots are handed to waiters as soon as they free up, so a free slot
+        # means nobody queued ahead could have used it
+        if self._can_start(script):
+            self._start(script)
+            self.stats.record_wait(0.0)
+            SCRIPT_QUEUE_WAIT.observe(0.0, script)
+            return
+        if len(self._waiters) >= self.max_queued:
+            self.stats.rejected += 1
+            SCRIPT_REJECTED.inc("queue_full")
+            raise ScriptRejectedError(
+                f"Too many scripts are running or queued ({self.running} running, {self.queued} queued), "
+                "try again later."
+            )
+
+        waiter = _Waiter(script)
+        self._waiters.append(waiter)
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, len(self._waiters))
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except BaseException as e:
+            if waiter.future.done():
+                # The slot was handed over just as the wait ended, give it back
+                self._release(script)
+            else:
+                waiter.future.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, TimeoutError):
+                self.stats.queue_timeouts += 1
+                SCRIPT_REJECTED.inc("queue_timeout")
+                raise ScriptRejectedError(
+                    f"Script '{script}' waited more than {self.queue_timeout} seconds for a free slot."
+                ) from None
+            raise
+        waited = time.perf_counter() - queued_at
+        self.stats.record_wait(waited)
+        SCRIPT_QUEUE_WAIT.observe(waited, script)
+
+    def _release(self, script: str) -> None:
+        self._running[script] -= 1
+        if not self._running[script]:
+            del self._running[script]
+        for waiter in list(self._waiters):
+            if self.running >= self.max_concurrent:
+                break
+            if self._can_start(waiter.script):
+                self._waiters.remove(waiter)
+                self._start(waiter.script)
+                waiter.future.set_result(None)
@@ -0,0 +1,355 @@
+"""Parameters declared in the header comments of the bash scripts.
+
+A script declares each parameter on its own header line:
+
+    # mcp-param: app-name: string, required - Name of the application to deploy.
+    # mcp-param: environment: dev|staging|prod, required - Deployment environment.
+    # mcp-param: port: integer, default=443, min=1, max=65535 - Port for TCP checks.
+    # mcp-param: dry-run: boolean - Print the plan without applying it.
+
+The type is string, integer, number, boolean or a list of allowed values
+separated by "|". It may be followed by required, default=<value>, min=<n>
+and max=<n>, and a description after " - ". Scripts that declare parameters
+only accept those, plus script_timeout. Scripts without any keep accepting
+arbitrary arguments.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+from app.library import ChangeSet
+from app.storage import FileSignature
+
+logger = logging.getLogger(__name__)
+
+PARAM_HEADER_RE = re.compile(r"^#\s*mcp-param:\s*(.*)$")
+# A script opts into result caching with a comment such as "# mcp-cache-ttl: 5"
+CACHE_HEADER_RE = re.compile(r"^#\s*mcp-cache-ttl:\s*(\d+(?:\.\d+)?)\s*$")
+PARAM_NAME_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_-]*$")
+# Lines of a script read at most while looking for the end of its header
+HEADER_MAX_LINES = 200
+TYPES = ("string", "integer", "number", "boolean")
+BOOLEANS = {"true": True, "1": True, "yes": True, "false": False, "0": False, "no": False}
+DEFAULT_TIMEOUT = 60
+
+
+class ScriptHeaderError(ValueError):
+    """Raised when a parameter declaration in a script header is malformed."""
+
+
+class ScriptArgumentError(ValueError):
+    """Raised when the arguments of a script call do not match its parameters."""
+
+    def __init__(self, errors: list[str]) -> None:
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+@dataclass(frozen=True, slots=True)
+class ScriptParam:
+    """A parameter of a script, passed to it as --<name> <value>."""
+
+    name: str
+    type: str = "string"
+    required: bool = False
+    default: Any = None
+    choices: tuple[str, ...] | None = None
+    minimum: float | None = None
+    maximum: float | None = None
+    description: str = ""
+
+    def schema(self) -> dict:
+        """Returns the JSON schema of the parameter."""
+        schema: dict[str, Any] = {"type": self.type}
+        if self.choices is not None:
+            schema["enum"] = list(self.choices)
+        if self.minimum is not None:
+            schema["minimum"] = self.minimum
+        if self.maximum is not None:
+            schema["maximum"] = self.maximum
+        if self.default is not None:
+            schema["default"] = self.default
+        if self.description:
+            schema["description"] = self.description
+        return schema
+
+    def coerce(self, value: Any) -> Any:
+        """Converts a value, which may come as a string from a URI, to the type of the parameter.
+
+        Raises:
+            ValueError: If the value does not fit the parameter.
+        """
+        if self.type == "boolean":
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str) and value.lower() in BOOLEANS:
+                return BOOLEANS[value.lower()]
+            raise ValueError("must be a boolean")
+        if self.type in ("integer", "number"):
+            converted = _number(value, integer=self.type == "integer")
+            if self.minimum is not None and converted < self.minimum:
+                raise ValueError(f"must be at least {self.minimum:g}")
+            if self.maximum is not None and converted > self.maximum:
+                raise ValueError(f"must be at most {self.maximum:g}")
+            return converted
+        if not isinstance(value, str):
+            raise ValueError("must be a string")
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"must be one of {', '.join(self.choices)}")
+        return value
+
+
+SCRIPT_TIMEOUT = ScriptParam(
+    "script_timeout",
+    "integer",
+    default=DEFAULT_TIMEOUT,
+    minimum=1,
+    description=f"Timeout for script execution in seconds (default: {DEFAULT_TIMEOUT}).",
+)
+
+
+@dataclass(frozen=True)
+class ScriptSpec:
+    """What the header of a script declares, read once per version of the script."""
+
+    name: str
+    path: Path
+    params: tuple[ScriptParam, ...] | None = None
+    cache_ttl: float | None = None
+    _by_name: dict[str, ScriptParam] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "_by_name", {param.name: param for param in self.params or ()})
+
+    @property
+    def strict(self) -> bool:
+        """Whether the script declares its parameters and accepts only those."""
+        return self.params is not None
+
+    @property
+    def description(self) -> str:
+        """Describes the script and its parameters for resource listings."""
+        text = f"Executes the {self.name}.sh script and returns its output."
+        if self.params:
+            declared = ", ".join(f"{p.name}{'' if p.required else '?'}: {p.type}" for p in self.params)
+            text += f" Arguments go in the query string, e.g. resource://scripts/{self.name}?name=value: {declared}."
+        return text
+
+    def schema(self) -> dict:
+        """Returns the JSON schema of the arguments of the script."""
+        params = (*(self.params or ()), SCRIPT_TIMEOUT)
+        return {
+            "type": "object",
+            "properties": {param.name: param.schema() for param in params},
+            "required": [param.name for param in params if param.required],
+            "additionalProperties": not self.strict,
+        }
+
+    def validate(self, arguments: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        """Checks and converts the arguments of a call before anything is spawned.
+
+        Returns:
+            The arguments to pass to the script, with defaults filled in, and
+            the timeout of the run.
+
+        Raises:
+            ScriptArgumentError: With every problem found.
+        """
+        errors = []
+        timeout = DEFAULT_TIMEOUT
+        if "script_timeout" in arguments:
+            try:
+                timeout = SCRIPT_TIMEOUT.coerce(arguments["script_timeout"])
+            except ValueError as e:
+                errors.append(f"script_timeout {e}")
+        values: dict[str, Any] = {}
+        for name, value in arguments.items():
+            if name == "script_timeout":
+                continue
+            param = self._by_name.get(name)
+            if param is None:
+                if self.strict:
+                    errors.append(f"unknown argument {name!r}")
+                else:
+                    values[name] = value
+                continue
+            try:
+                values[name] = param.coerce(value)
+            except ValueError as e:
+                errors.append(f"{name} {e}")
+        for param in self.params or ():
+            if param.name in values:
+                continue
+            if param.required:
+                errors.append(f"missing required argument {param.name!r}")
+            elif param.default is not None:
+                values[param.name] = param.default
+        if errors:
+            raise ScriptArgumentError(errors)
+        return values, timeout
+
+
+def parse_param(declaration: str) -> ScriptParam:
+    """Parses the text after "mcp-param:" of a header line.
+
+    Raises:
+        ScriptHeaderError: If the declaration is malformed.
+    """
+    spec, _, description = declaration.partition(" - ")
+    name, separator, options = spec.partition(":")
+    name = name.strip()
+    if not separator or not PARAM_NAME_RE.match(name) or name == SCRIPT_TIMEOUT.name:
+        raise ScriptHeaderError(f"Invalid parameter declaration: {declaration!r}.")
+    kind, *tokens = (token.strip() for token in options.split(","))
+    fields: dict[str, Any] = {"name": name, "description": description.strip()}
+    if "|" in kind:
+        fields["choices"] = tuple(choice.strip() for choice in kind.split("|"))
+    elif kind in TYPES:
+        fields["type"] = kind
+    else:
+        raise ScriptHeaderError(f"Unknown type {kind!r} of parameter {name!r}.")
+    default = None
+    for token in tokens:
+        key, _, value = token.partition("=")
+        if token == "required":
+            fields["required"] = True
+        elif key in ("min", "max") and value:
+            try:
+                fields["minimum" if key == "min" else "maximum"] = _number(value, integer=False)
+            except ValueError:
+                raise ScriptHeaderError(f"Invalid {key} of parameter {name!r}: {value!r}.") from None
+        elif key == "default" and value:
+            default = value
+        else:
+            raise ScriptHeaderError(f"Unknown option {token!r} of parameter {name!r}.")
+    param = ScriptParam(**fields)
+    if default is not None:
+        try:
+            param = ScriptParam(**fields, default=param.coerce(default))
+        except ValueError as e:
+            raise ScriptHeaderError(f"Default of parameter {name!r} {e}.") from None
+    return param
+
+
+def read_spec(path: Path) -> ScriptSpec:
+    """Reads the header of a script.
+
+    Raises:
+        ScriptHeaderError: If a parameter declaration is malformed.
+    """
+    params: list[ScriptParam] = []
+    cache_ttl = None
+    with path.open(encoding="utf-8", errors="replace") as f:
+        for line in islice(f, HEADER_MAX_LINES):
+            line = line.strip()
+            # The header ends at the first line that is neither a comment nor blank
+            if line and not line.startswith("#"):
+                break
+            if match := PARAM_HEADER_RE.match(line):
+                params.append(parse_param(match.group(1)))
+            elif match := CACHE_HEADER_RE.match(line):
+                cache_ttl = float(match.group(1))
+    names = [param.name for param in params]
+    if len(set(names)) != len(names):
+        raise ScriptHeaderError(f"A parameter of {path.name} is declared twice.")
+    return ScriptSpec(name=path.stem, path=path, params=tuple(params) if params else None, cache_ttl=cache_ttl)
+
+
+class ScriptCatalog:
+    """Keeps the specs of the scripts in a directory in sync with their headers.
+
+    Like the agents library, a refresh only stats the scripts and reads the
+    headers of the ones that were added or changed, then hands the change
+    set to the listeners. A script whose header is malformed is left out
+    until it is fixed.
+    """
+
+    def __init__(self, directory: Path, run_io: Callable[..., Awaitable[Any]]) -> None:
+        self.directory = directory
+        self.run_io = run_io
+        self.specs: dict[str, ScriptSpec] = {}
+        self._signatures: dict[str, FileSignature] = {}
+        self._listeners: list[Callable[[ChangeSet], None]] = []
+        self._lock = asyncio.Lock()
+
+    def get(self, name: str) -> ScriptSpec | None:
+        """Returns the spec of a script, or None if there is no such script."""
+        return self.specs.get(name)
+
+    def subscribe(self, listener: Callable[[ChangeSet], None]) -> None:
+        """Registers a callback that is invoked with every non-empty change set."""
+        self._listeners.append(listener)
+
+    async def refresh(self) -> ChangeSet:
+        """Picks up added, changed and removed scripts."""
+        async with self._lock:
+            start = time.perf_counter()
+            current, specs = await self.run_io(self._scan, dict(self._signatures))
+            changes = ChangeSet(
+                added=sorted(name for name in specs if name not in self.specs),
+                changed=sorted(name for name in specs if name in self.specs),
+                # Scripts that are gone or whose header no longer parses
+                removed=sorted(
+                    name
+                    for name in self.specs
+                    if name not in current or (name not in specs and self._signatures.get(name) != current[name])
+                ),
+            )
+            for name in changes.removed:
+                del self.specs[name]
+            self.specs.update(specs)
+            self._signatures = current
+            if changes:
+                logger.debug("Refreshed scripts in %.1f ms: %s", (time.perf_counter() - start) * 1000, changes)
+                for listener in self._listeners:
+                    listener(changes)
+        return changes
+
+    def _scan(self, known: dict[str, FileSignature]) -> tuple[dict[str, FileSignature], dict[str, ScriptSpec]]:
+        """Stats the scripts and reads the headers of the new and changed ones."""
+        current: dict[str, FileSignature] = {}
+        specs: dict[str, ScriptSpec] = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".sh") or not entry.is_file():
+                        continue
+                    name = entry.name[: -len(".sh")]
+                    current[name] = signature = FileSignature.from_stat(entry.stat())
+                    if known.get(name) == signature:
+                        continue
+                    try:
+                        specs[name] = read_spec(Path(entry.path))
+                    except (OSError, ScriptHeaderError):
+                        logger.exception("Error loading %s", entry.path)
+        except FileNotFoundError:
+            pass
+        return current, specs
+
+
+def _number(value: Any, integer: bool) -> int | float:
+    """Converts a number or a numeric string, refusing booleans and non-finite numbers."""
+    if isinstance(value, bool):
+        raise ValueError("must be an integer" if integer else "must be a number")
+    if integer:
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str) and re.fullmatch(r"[+-]?\d+", value.strip()):
+            return int(value)
+        raise ValueError("must be an integer")
+    try:
+        number = float(value) if isinstance(value, str | int | float) else math.nan
+    except ValueError:
+        number = math.nan
+    if not math.isfinite(number):
+        raise ValueError("must be a number")
+    return number
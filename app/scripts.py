@@ -0,0 +1,124 @@
+import asyncio
+import contextlib
+import os
+import signal
+import subprocess
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+from app.metrics import SCRIPT_EXIT, SCRIPT_SPAWN
+
+# Receives the stdout of a script chunk by chunk while it runs
+OutputCallback = Callable[[bytes], Awaitable[None]]
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_OUTPUT = 1024 * 1024
+
+
+class ScriptResult(NamedTuple):
+    """The outcome of a script run."""
+
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    truncated: bool = False
+
+
+class ScriptRunner(Protocol):
+    """Runs bash scripts for the script resources."""
+
+    async def run(
+        self, script_path: Path, args: list[str], script_timeout: float, *, on_output: OutputCallback | None = None
+    ) -> ScriptResult:
+        """Runs a script with command line arguments.
+
+        Runners that can stream pass stdout to on_output as it is produced,
+        others ignore it.
+
+        Raises:
+            TimeoutError: If the script did not finish within the timeout. The
+                script has been killed when this is raised.
+        """
+        ...
+
+    async def close(self) -> None:
+        """Releases the resources held by the runner."""
+        ...
+
+
+def build_args(kwargs: dict) -> list[str]:
+    """Turns resource parameters into --key value command line arguments."""
+    args = []
+    for key, value in kwargs.items():
+        args.append(f"--{key}")
+        args.append(str(value).lower() if isinstance(value, bool) else str(value))
+    return args
+
+
+class SubprocessRunner:
+    """Runs every script in a fresh bash process.
+
+    Output is read incrementally and at most max_output bytes of stdout and of
+    stderr are kept, the rest is read and dropped so the script is never
+    blocked on a full pipe. Every script runs in its own process group, so
+    killing it also kills the processes it started.
+    """
+
+    def __init__(self, max_output: int = DEFAULT_MAX_OUTPUT) -> None:
+        self.max_output = max_output
+        self._processes: set[asyncio.subprocess.Process] = set()
+
+    async def run(
+        self, script_path: Path, args: list[str], script_timeout: float, *, on_output: OutputCallback | None = None
+    ) -> ScriptResult:
+        """Runs a script in a new bash process."""
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            "bash", str(script_path), *args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True
+        )
+        SCRIPT_SPAWN.observe(time.perf_counter() - start)
+        self._processes.add(process)
+        try:
+            async with asyncio.timeout(script_timeout):
+                (stdout, stdout_truncated), (stderr, stderr_truncated) = await asyncio.gather(
+                    self._read(process.stdout, on_output), self._read(process.stderr)
+                )
+                await process.wait()
+        except BaseException:
+            _kill_group(process)
+            await process.wait()
+            raise
+        finally:
+            self._processes.discard(process)
+            SCRIPT_EXIT.observe(time.perf_counter() - start, script_path.stem)
+        return ScriptResult(process.returncode, stdout, stderr, stdout_truncated or stderr_truncated)
+
+    async def _read(self, stream: asyncio.StreamReader, on_output: OutputCallback | None = None) -> tuple[bytes, bool]:
+        """Reads a stream to its end, keeping and forwarding at most max_output bytes."""
+        output = bytearray()
+        truncated = False
+        while chunk := await stream.read(CHUNK_SIZE):
+            if truncated:
+                continue
+            room = self.max_output - len(output)
+            if len(chunk) > room:
+                chunk = chunk[:room]
+                truncated = True
+            output += chunk
+            if on_output is not None and chunk:
+                await on_output(chunk)
+        return bytes(output), truncated
+
+    async def close(self) -> None:
+        """Kills the scripts that are still running, run reaps them."""
+        for process in list(self._processes):
+            _kill_group(process)
+
+
+def _kill_group(process: asyncio.subprocess.Process) -> None:
+    """Kills a script and everything it started, if it is still running."""
+    if process.returncode is None:
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGKILL)
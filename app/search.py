@@ -0,0 +1,273 @@
+import heapq
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from operator import itemgetter
+
+from app.library import ChangeSet
+from app.sections import DocumentOutline, OutlineStore, parse_outline
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+STOPWORDS = frozenset(
+    {
+        "a",
+        "an",
+        "and",
+        "are",
+        "as",
+        "at",
+        "be",
+        "but",
+        "by",
+        "for",
+        "from",
+        "has",
+        "have",
+        "if",
+        "in",
+        "into",
+        "is",
+        "it",
+        "its",
+        "of",
+        "on",
+        "or",
+        "so",
+        "such",
+        "that",
+        "the",
+        "their",
+        "then",
+        "there",
+        "these",
+        "they",
+        "this",
+        "to",
+        "was",
+        "were",
+        "will",
+        "with",
+        "you",
+        "your",
+    }
+)
+
+# Terms found in more than this share of all passages do not select
+# passages when the query has rarer terms, they only add to the scores of the
+# passages the rarer terms selected
+COMMON_TERM_RATIO = 0.5
+SNIPPET_LENGTH = 160
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits text into lower-cased search terms without stopwords."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+@dataclass(frozen=True, slots=True)
+class Passage:
+    """A section of a document as stored in the index."""
+
+    name: str
+    heading: str
+    start: int
+    end: int
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    """A ranked section of a document."""
+
+    name: str
+    section: str
+    score: float
+    snippet: str
+
+
+class SearchIndex:
+    """An in-memory BM25 inverted index over the sections of the agents library.
+
+    Every section of every document is indexed as its own passage, so hits
+    point at the heading that matched rather than just the file.
+    """
+
+    def __init__(
+        self, documents: dict[str, str], outlines: OutlineStore | None = None, k1: float = 1.2, b: float = 0.75
+    ) -> None:
+        self.documents = documents
+        self.outlines = outlines
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, int]] = {}
+        self._passages: dict[int, Passage] = {}
+        self._lengths: dict[int, int] = {}
+        self._terms: dict[int, tuple[str, ...]] = {}
+        self._by_document: dict[str, list[int]] = {}
+        self._total_length = 0
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._passages)
+
+    def build(self) -> None:
+        """Indexes every document from scratch."""
+        for name in list(self._by_document):
+            self.remove(name)
+        for name, content in self.documents.items():
+            self.update(name, content)
+
+    def apply(self, changes: ChangeSet) -> None:
+        """Re-indexes the documents of a change set."""
+        for name in changes.removed:
+            self.remove(name)
+        for name in (*changes.added, *changes.changed):
+            self.update(name, self.documents[name])
+
+    def update(self, name: str, content: str) -> None:
+        """Indexes a document, replacing any previous version of it."""
+        self.remove(name)
+        ids = []
+        for section in self._outline(name, content).sections:
+            counts = Counter(tokenize(content[section.start : section.body_end]))
+            if not counts:
+                continue
+            passage_id = self._next_id
+            self._next_id += 1
+            self._passages[passage_id] = Passage(name, section.title, section.start, section.body_end)
+            self._lengths[passage_id] = length = sum(counts.values())
+            self._terms[passage_id] = tuple(counts)
+            self._total_length += length
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[passage_id] = tf
+            ids.append(passage_id)
+        self._by_document[name] = ids
+
+    def _outline(self, name: str, content: str) -> DocumentOutline:
+        """Returns the outline of a document, shared with the outline store when possible."""
+        if self.outlines is not None and self.documents.get(name) is content:
+            return self.outlines.get(name)
+        return parse_outline(content)
+
+    def remove(self, name: str) -> None:
+        """Removes a document from the index."""
+        for passage_id in self._by_document.pop(name, ()):
+            del self._passages[passage_id]
+            self._total_length -= self._lengths.pop(passage_id)
+            for term in self._terms.pop(passage_id):
+                postings = self._postings[term]
+                del postings[passage_id]
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, limit: int = 10) -> list[SearchHit]:
+        """Returns the best matching sections for a query, best first.
+
+        Every returned passage has its full BM25 score over all query terms.
+        When the query has terms that are rare enough, only the passages
+        containing one of them are candidates, so a passage that matches
+        nothing but common terms is not returned even if its score would be
+        higher. Its common terms alone are worth little next to a rare one.
+        A query made only of common terms is ranked over all passages.
+        """
+        count = len(self._passages)
+        terms = [t for t in dict.fromkeys(tokenize(query)) if t in self._postings]
+        if not count or not terms or limit < 1:
+            return []
+
+        rare = [t for t in terms if len(self._postings[t]) <= count * COMMON_TERM_RATIO]
+        # Without rarer terms every term selects passages
+        common = [t for t in terms if t not in rare] if rare else []
+        terms = rare or terms
+
+        # Score the rarest terms first. Once the limit-th best score exceeds
+        # the most the remaining and the common terms could add, no passage
+        # that has not been seen yet can make it into the results, so the
+        # remaining terms only update the passages already scored instead of
+        # walking their postings.
+        terms.sort(key=lambda t: len(self._postings[t]))
+        idfs = [self._idf(len(self._postings[t]), count) for t in terms]
+        common_idfs = [self._idf(len(self._postings[t]), count) for t in common]
+        common_bound = sum(common_idfs)
+        max_impact = self.k1 + 1
+        base = self.k1 * (1 - self.b)
+        per_length = self.k1 * self.b * count / self._total_length
+        lengths = self._lengths
+        scores: dict[int, float] = {}
+        for i, term in enumerate(terms):
+            postings = self._postings[term]
+            weight = idfs[i] * max_impact
+            bound = (sum(idfs[i:]) + common_bound) * max_impact
+            if len(scores) >= limit and bound < heapq.nlargest(limit, scores.values())[-1]:
+                self._add_to_scored(scores, postings, weight, base, per_length)
+                continue
+            for passage_id, tf in postings.items():
+                scores[passage_id] = scores.get(passage_id, 0.0) + weight * tf / (
+                    tf + base + per_length * lengths[passage_id]
+                )
+        # Common terms never add candidates, but they do change the ranking
+        for term, idf in zip(common, common_idfs, strict=True):
+            self._add_to_scored(scores, self._postings[term], idf * max_impact, base, per_length)
+
+        best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [self._hit(self._passages[passage_id], score, terms + common) for passage_id, score in best]
+
+    def _add_to_scored(
+        self, scores: dict[int, float], postings: dict[int, int], weight: float, base: float, per_length: float
+    ) -> None:
+        """Adds the score of a term to the passages that are already scored."""
+        lengths = self._lengths
+        if len(postings) < len(scores):
+            for passage_id, tf in postings.items():
+                score = scores.get(passage_id)
+                if score is not None:
+                    scores[passage_id] = score + weight * tf / (tf + base + per_length * lengths[passage_id])
+            return
+        for passage_id, score in scores.items():
+            tf = postings.get(passage_id)
+            if tf:
+                scores[passage_id] = score + weight * tf / (tf + base + per_length * lengths[passage_id])
+
+    @staticmethod
+    def _idf(df: int, count: int) -> float:
+        return math.log(1 + (count - df + 0.5) / (df + 0.5))
+
+    def _hit(self, passage: Passage, score: float, terms: list[str]) -> SearchHit:
+        text = self.documents.get(passage.name, "")[passage.start : passage.end]
+        return SearchHit(
+            name=passage.name,
+            section=passage.heading,
+            score=round(score, 4),
+            snippet=_snippet(text, terms),
+        )
+
+
+def document_hit(name: str, outline: DocumentOutline, score: float, terms: list[str]) -> SearchHit:
+    """Builds a hit for a document that was ranked as a whole, e.g. by the SQLite storage.
+
+    The hit points at the section with the first occurrence of a query term.
+    """
+    content = outline.content
+    lowered = content.lower()
+    positions = [p for t in terms if (p := lowered.find(t)) >= 0]
+    position = min(positions) if positions else 0
+    for section in outline.sections:
+        if section.start <= position < section.body_end:
+            text = content[section.start : section.body_end]
+            return SearchHit(name=name, section=section.title, score=round(score, 4), snippet=_snippet(text, terms))
+    return SearchHit(name=name, section="", score=round(score, 4), snippet=_snippet(content, terms))
+
+
+def _snippet(text: str, terms: list[str]) -> str:
+    """Returns a short window of text around the first query term."""
+    lowered = text.lower()
+    positions = [p for t in terms if (p := lowered.find(t)) >= 0]
+    center = min(positions) if positions else 0
+    start = max(0, center - SNIPPET_LENGTH // 3)
+    end = min(len(text), start + SNIPPET_LENGTH)
+    snippet = " ".join(text[start:end].split())
+    if start > 0:
+        snippet = f"…{snippet}"
+    if end < len(text):
+        snippet = f"{snippet}…"
+    return snippet
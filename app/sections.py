@@ -0,0 +1,264 @@
+import bisect
+import re
+from array import array
+from dataclasses import dataclass
+
+from app.library import ChangeSet
+
+HEADING_RE = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+FENCE_RE = re.compile(r"^[ \t]*(?:```|~~~)", re.MULTILINE)
+NEWLINE_RE = re.compile(r"\n")
+PATH_SEPARATOR = " > "
+
+
+@dataclass(frozen=True, slots=True)
+class Section:
+    """A heading of a markdown document and the text it spans.
+
+    Offsets are character offsets into the document. A section spans its
+    subsections, body_end marks where its own text ends.
+    """
+
+    title: str
+    level: int
+    path: tuple[str, ...]
+    start: int
+    body_end: int
+    end: int
+    byte_start: int
+    byte_end: int
+    first_line: int
+    last_line: int
+
+    @property
+    def size(self) -> int:
+        """The size of the section in UTF-8 bytes."""
+        return self.byte_end - self.byte_start
+
+    def to_dict(self) -> dict:
+        """Describes the section for the outline of a document."""
+        return {
+            "title": self.title,
+            "level": self.level,
+            "path": PATH_SEPARATOR.join(self.path),
+            "size": self.size,
+            "bytes": [self.byte_start, self.byte_end],
+            "lines": [self.first_line, self.last_line],
+        }
+
+
+@dataclass(frozen=True)
+class DocumentOutline:
+    """The heading tree of a document, parsed once per document version."""
+
+    content: str
+    sections: tuple[Section, ...]
+    size: int
+    line_offsets: array
+
+    @property
+    def line_count(self) -> int:
+        """The number of lines in the document."""
+        return len(self.line_offsets)
+
+    def find(self, name: str) -> list[Section]:
+        """Returns the sections whose title or path matches a name, ignoring case.
+
+        A path is the titles from the top-level heading down, joined with " > ".
+        """
+        key = " ".join(name.split()).casefold()
+        return [
+            s
+            for s in self.sections
+            if s.level and (s.title.casefold() == key or PATH_SEPARATOR.join(s.path).casefold() == key)
+        ]
+
+    def byte_slice(self, start: int, end: int) -> str:
+        """Returns the text between two UTF-8 byte offsets, end exclusive.
+
+        Characters cut in half by the offsets are dropped.
+        """
+        if self.size == len(self.content):
+            return self.content[start:end]
+        return self.content.encode("utf-8")[start:end].decode("utf-8", errors="ignore")
+
+    def line_slice(self, first: int, last: int) -> str:
+        """Returns the lines first to last, 1-based and inclusive."""
+        first = max(first, 1)
+        if first > self.line_count or last < first:
+            return ""
+        start = self.line_offsets[first - 1]
+        end = self.line_offsets[last] if last < self.line_count else len(self.content)
+        return self.content[start:end]
+
+
+def select_sections(outline: DocumentOutline, names: list[str]) -> tuple[list[Section], list[str]]:
+    """Looks up sections by title or path.
+
+    Returns:
+        The matching sections in document order, without sections that are
+        already part of another selected section, and the names that did not
+        match anything.
+    """
+    found: dict[int, Section] = {}
+    missing = []
+    for name in names:
+        matches = outline.find(name)
+        if not matches:
+            missing.append(name)
+        for section in matches:
+            found[section.start] = section
+    selected: list[Section] = []
+    for section in sorted(found.values(), key=lambda s: (s.start, -s.end)):
+        if selected and section.end <= selected[-1].end:
+            continue
+        selected.append(section)
+    return selected, missing
+
+
+def extract(
+    outline: DocumentOutline,
+    sections: list[str] | None = None,
+    byte_range: list[int] | None = None,
+    line_range: list[int] | None = None,
+) -> dict:
+    """Returns part of a document selected by sections, a byte range or a line range.
+
+    Byte ranges are 0-based and end exclusive, line ranges are 1-based and
+    inclusive. Exactly one selector must be given.
+
+    Raises:
+        ValueError: If the selectors or ranges are invalid.
+        LookupError: If none of the requested sections exist.
+    """
+    if sum(selector is not None for selector in (sections, byte_range, line_range)) != 1:
+        raise ValueError("Pass exactly one of sections, byte_range or line_range.")
+    if sections is not None:
+        selected, missing = select_sections(outline, sections)
+        if not selected:
+            raise LookupError(f"Section(s) {', '.join(repr(n) for n in missing)} not found.")
+        return {
+            "content": "".join(outline.content[s.start : s.end] for s in selected),
+            "sections": [PATH_SEPARATOR.join(s.path) for s in selected],
+            "missing_sections": missing,
+        }
+    if byte_range is not None:
+        start, end = _bounds(byte_range, 0, "byte_range must be [start, end] with 0 <= start <= end.")
+        start, end = min(start, outline.size), min(end, outline.size)
+        return {"content": outline.byte_slice(start, end), "byte_range": [start, end], "size": outline.size}
+    first, last = _bounds(line_range, 1, "line_range must be [first, last] with 1 <= first <= last.")
+    last = min(last, outline.line_count)
+    return {"content": outline.line_slice(first, last), "line_range": [first, last], "lines": outline.line_count}
+
+
+def _bounds(value: list[int], minimum: int, message: str) -> tuple[int, int]:
+    """Validates a [start, end] pair."""
+    try:
+        start, end = value
+    except ValueError:
+        raise ValueError(message) from None
+    if not minimum <= start <= end:
+        raise ValueError(message)
+    return start, end
+
+
+def parse_outline(content: str) -> DocumentOutline:
+    """Parses the heading tree of a markdown document.
+
+    Headings inside fenced code blocks are ignored. Text before the first
+    heading becomes a level 0 section with an empty title.
+    """
+    fences = [m.start() for m in FENCE_RE.finditer(content)]
+    headings: list[tuple[int, str, int]] = []
+    for match in HEADING_RE.finditer(content):
+        # A heading is inside a code block when an odd number of fences precede it
+        if bisect.bisect_left(fences, match.start()) % 2:
+            continue
+        headings.append((len(match.group(1)), match.group(2).strip(), match.start()))
+    if not headings or headings[0][2] > 0:
+        headings.insert(0, (0, "", 0))
+
+    line_offsets = array("L", [0])
+    line_offsets.extend(m.end() for m in NEWLINE_RE.finditer(content) if m.end() < len(content))
+    byte_offsets = _byte_offsets(content, [start for _, _, start in headings])
+    size = byte_offsets[-1]
+
+    sections: list[Section] = []
+    path: list[tuple[int, str]] = []
+    count = len(headings)
+    for i, (level, title, start) in enumerate(headings):
+        # A section ends at the next heading of the same or a higher level,
+        # the level 0 preamble ends at the first heading
+        end_index = i + 1
+        while level and end_index < count and headings[end_index][0] > level:
+            end_index += 1
+        end = headings[end_index][2] if end_index < count else len(content)
+        body_end = headings[i + 1][2] if i + 1 < count else len(content)
+        while path and path[-1][0] >= level:
+            path.pop()
+        if level:
+            path.append((level, title))
+        sections.append(
+            Section(
+                title=title,
+                level=level,
+                path=tuple(t for _, t in path),
+                start=start,
+                body_end=body_end,
+                end=end,
+                byte_start=byte_offsets[i],
+                byte_end=byte_offsets[end_index],
+                first_line=bisect.bisect_right(line_offsets, start),
+                last_line=bisect.bisect_right(line_offsets, max(start, end - 1)),
+            )
+        )
+    sections = [s for s in sections if s.level or content[s.start : s.end].strip()]
+    return DocumentOutline(content=content, sections=tuple(sections), size=size, line_offsets=line_offsets)
+
+
+def _byte_offsets(content: str, offsets: list[int]) -> list[int]:
+    """Converts sorted character offsets to UTF-8 byte offsets.
+
+    The byte length of the whole content is appended as the last entry.
+    """
+    if content.isascii():
+        return [*offsets, len(content)]
+    result = []
+    position = 0
+    byte_position = 0
+    for offset in [*offsets, len(content)]:
+        byte_position += len(content[position:offset].encode("utf-8"))
+        position = offset
+        result.append(byte_position)
+    return result
+
+
+class OutlineStore:
+    """Keeps the parsed outline of every document of the library.
+
+    Outlines are parsed when documents are added or changed and looked up by
+    document name afterwards, a document that was replaced without a change
+    notification is parsed again on access.
+    """
+
+    def __init__(self, documents: dict[str, str]) -> None:
+        self.documents = documents
+        self._outlines: dict[str, DocumentOutline] = {}
+
+    def get(self, name: str) -> DocumentOutline | None:
+        """Returns the outline of a document, or None if it does not exist."""
+        content = self.documents.get(name)
+        if content is None:
+            self._outlines.pop(name, None)
+            return None
+        outline = self._outlines.get(name)
+        if outline is None or outline.content is not content:
+            outline = self._outlines[name] = parse_outline(content)
+        return outline
+
+    def apply(self, changes: ChangeSet) -> None:
+        """Parses added and changed documents and forgets removed ones."""
+        for name in changes.removed:
+            self._outlines.pop(name, None)
+        for name in (*changes.added, *changes.changed):
+            self.get(name)
@@ -1,176 +1,340 @@
-import asyncio
+import codecs
+import importlib
 import json
+import logging
 import os
-import subprocess
-from collections.abc import AsyncIterator, Callable
+import time
+import urllib.parse
+from collections.abc import AsyncIterator, Awaitable, Callable
 from contextlib import asynccontextmanager
+from dataclasses import asdict
+from http import HTTPStatus
 from pathlib import Path
 from typing import Any
 
-import uvicorn
-import yaml
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from mcp.server import FastMCP
 from mcp.server.fastmcp.exceptions import ResourceError, ToolError
 from mcp.server.fastmcp.resources import FunctionResource
 from mcp.types import TextContent
 
-
-# Configuration
-def load_config() -> dict:
-    """Loads configuration from config.yaml and overrides with environment variables."""
-    with open("config.yaml") as f:
-        cfg = yaml.safe_load(f)
-
-    # Override config with environment variables
-    def _override_config_with_env(current_config: dict, prefix: str = "") -> dict:
-        for key, value in current_config.items():
-            env_var_name = f"{prefix}{key}".upper()
-            if isinstance(value, dict):
-                _override_config_with_env(value, f"{env_var_name}_")
-            elif env_var_name in os.environ:
-                # Attempt to convert environment variable to the same type as the config value
-                try:
-                    if isinstance(value, int):
-                        current_config[key] = int(os.environ[env_var_name])
-                    elif isinstance(value, bool):
-                        current_config[key] = os.environ[env_var_name].lower() in (
-                            "true",
-                            "1",
-                            "t",
-                            "y",
-                            "yes",
-                        )
-                    else:
-                        current_config[key] = os.environ[env_var_name]
-                except ValueError:
-                    print(
-                        f"Warning: Could not convert environment variable "
-                        f"{env_var_name} to type of {key}. Using default."
-                    )
-        return current_config
-
-    return _override_config_with_env(cfg)
-
-
-config = load_config()
-SERVER_PORT = int(config["server"]["port"])
-AGENTS_LIBRARY_PATH = Path(config["server"]["agents_library_path"])
+from app.cache import CONTENT_TYPE, DocumentCache, JoinedResponse, encode, encode_bytes, encode_members
+from app.compression import CODECS, DEFAULT_LEVELS, CompressionMiddleware, negotiate
+from app.config import get_config
+from app.library import AgentsLibrary, ChangeSet, LibrarySize
+from app.lifecycle import LIFECYCLES, DrainMiddleware, Lifecycle, State
+from app.listing import ListingIndex
+from app.logs import configure_logging, log_event
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.metrics import REGISTRY, SCRIPT_DURATION, SCRIPT_RUNS, Gauge, instrument_tool
+from app.ratelimit import RateLimiter, RateLimitMiddleware
+from app.result_cache import ScriptResultCache
+from app.scheduler import ScriptRejectedError, ScriptScheduler
+from app.script_catalog import DEFAULT_TIMEOUT, ScriptArgumentError, ScriptCatalog
+from app.scripts import OutputCallback, SubprocessRunner, build_args
+from app.search import SearchIndex, document_hit, tokenize
+from app.sections import OutlineStore, extract
+from app.shared import SharedGeneration, SharedStateMiddleware
+from app.snapshot import Snapshot
+from app.startup import StartupProfiler
+from app.storage import LibraryStorage, SqliteStorage, document_name
+from app.versions import ConflictError, PatchError, VersionStore, apply_patch, check_etag, make_patch
+from app.watcher import PollingWatcher, create_watcher
+from app.workers import BashWorkerPool
+
+logger = logging.getLogger(__name__)
 
 
 # A dictionary to store the contents of our AGENTS.md files
 agents_data: dict[str, str] = {}
 
 
+# Tools whose text content is serialized JSON already, /test/call_tool embeds
+# it in its response as it is
+JSON_TEXT_TOOLS = frozenset({"get_agents_instructions", "get_agents_instructions_batch", "get_agents_history"})
+
+
 def convert_text_content_to_str(data: Any) -> Any:
-    """Converts TextContent objects within a data structure to strings."""
+    """Converts TextContent objects within a data structure to strings.
+
+    Dicts and lists without TextContent inside are returned as they are,
+    only the containers on the way to a converted item are copied.
+    """
     if isinstance(data, TextContent):
         return data.text
     if isinstance(data, dict):
-        return {k: convert_text_content_to_str(v) for k, v in data.items()}
+        converted = None
+        for key, value in data.items():
+            item = convert_text_content_to_str(value)
+            if item is not value:
+                converted = converted or dict(data)
+                converted[key] = item
+        return data if converted is None else converted
     if isinstance(data, list):
-        return [convert_text_content_to_str(item) for item in data]
+        converted = None
+        for i, value in enumerate(data):
+            item = convert_text_content_to_str(value)
+            if item is not value:
+                converted = converted or list(data)
+                converted[i] = item
+        return data if converted is None else converted
     return data
 
 
-def create_app() -> FastAPI:
-    """Creates and configures a FastAPI application."""
+def _register_gauges(
+    library_size: LibrarySize, scheduler: ScriptScheduler, result_cache: ScriptResultCache, lifecycle: Lifecycle
+) -> None:
+    """Registers the gauges that are read from the server state at scrape time."""
+    REGISTRY.register(
+        Gauge("mcp_library_documents", "AGENTS.md documents held in memory.", lambda: len(library_size.documents))
+    )
+    REGISTRY.register(
+        Gauge(
+            "mcp_library_bytes",
+            "UTF-8 size of the AGENTS.md documents held in memory.",
+            lambda: library_size.total_bytes,
+        )
+    )
+    REGISTRY.register(Gauge("mcp_scripts_running", "Scripts running right now.", lambda: scheduler.running))
+    REGISTRY.register(Gauge("mcp_scripts_queued", "Script runs waiting for a free slot.", lambda: scheduler.queued))
+    REGISTRY.register(
+        Gauge(
+            "mcp_script_cache_requests",
+            "Script result cache lookups by result.",
+            lambda: {
+                ("hit",): result_cache.stats.hits,
+                ("miss",): result_cache.stats.misses,
+                ("coalesced",): result_cache.stats.coalesced,
+            },
+            labels=("result",),
+        )
+    )
+    REGISTRY.register(
+        Gauge(
+            "mcp_lifecycle_state",
+            "1 for the current phase of the server: starting, ready, draining or stopped.",
+            lambda: {(state.value,): int(lifecycle.state is state) for state in State},
+            labels=("state",),
+        )
+    )
+    REGISTRY.register(
+        Gauge(
+            "mcp_in_flight",
+            "Requests and script runs in flight by kind.",
+            lambda: {(kind,): lifecycle.in_flight[kind] for kind in ("request", "script")},
+            labels=("kind",),
+        )
+    )
+
+
+def stateless_http(setting: bool | str, workers: int) -> bool:
+    """Resolves the stateless_http setting.
+
+    Streamable HTTP sessions live in the memory of the worker that created
+    them, so with several workers every request is served on its own unless
+    sessions are pinned explicitly, e.g. behind a load balancer that routes
+    on the Mcp-Session-Id header.
+    """
+    if isinstance(setting, bool):
+        return setting
+    if setting.lower() == "auto":
+        return workers > 1
+    return setting.lower() in ("true", "1", "t", "y", "yes")
+
+
+def create_app(config: dict | None = None, profiler: StartupProfiler | None = None) -> FastAPI:
+    """Creates and configures a FastAPI application.
+
+    Args:
+        config: The configuration, defaults to the one of this process.
+        profiler: Logs the import and startup phase timings it holds, together
+            with the lifespan phases, once the server is ready to serve.
+    """
+    created = time.perf_counter()
+    config = config if config is not None else get_config()
+    profile = profiler is not None
+    profiler = profiler or StartupProfiler()
+    workers = config["server"]["workers"]
+    stateless = stateless_http(config["mcp_server"]["stateless_http"], workers)
     mcp_server = FastMCP(
         name=config["mcp_server"]["name"],
         streamable_http_path=config["mcp_server"]["streamable_http_path"],
         json_response=config["mcp_server"]["json_response"],
+        stateless_http=stateless,
     )
 
-    async def _load_agents_data(agents_library_path: Path) -> None:
-        """Loads all AGENTS.md files into memory."""
-        if not agents_library_path.is_dir():
-            print(f"Directory not found: {agents_library_path}")
-            return
-
-        for file_path in agents_library_path.glob("markdown/*.agents.md"):
-            try:
-                content = file_path.read_text(encoding="utf-8")
-                # Use the filename (without extension) as the tool name
-                tool_name = file_path.stem.replace(".agents", "")
-                agents_data[tool_name] = content
-                print(f"Loaded AGENTS.md file: {file_path.name} as tool '{tool_name}'")
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
-
-    async def _load_bash_scripts(agents_library_path: Path) -> None:
-        """Loads all .sh files as resources."""
-        if not agents_library_path.is_dir():
-            print(f"Directory not found: {agents_library_path}")
-            return
-
-        def create_run_script_callable(script_path: Path) -> Callable:
-            async def _run_script(script_timeout: int = 60, **kwargs: Any) -> str:
-                try:
-                    print(f"Running script with timeout: {script_timeout}")
-                    command_args = ["bash", str(script_path)]
-                    for key, value in kwargs.items():
-                        command_args.append(f"--{key}")
-                        command_args.append(str(value))
-
-                    print(f"Command args: {command_args}")
-
-                    process = await asyncio.create_subprocess_exec(
-                        *command_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                    )
-                    stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=script_timeout)
-                    if process.returncode != 0:
-                        print(f"Error running script {script_path.name}: {stderr.decode().strip()}")
-                        raise HTTPException(
-                            status_code=500,
-                            detail=f"Script execution failed: {stderr.decode().strip()}",
-                        ) from None
-                    return stdout.decode().strip()
-                except TimeoutError:
-                    process.kill()
-                    await process.wait()
-                    print(f"Error running script {script_path.name}: Timeout after {script_timeout} seconds.")
-                    raise ResourceError(f"Script execution timed out after {script_timeout} seconds.") from None
-
-            return _run_script
-
-        for file_path in agents_library_path.glob("bash/*.sh"):
+    library = AgentsLibrary(agents_data, io_workers=config["agents_library"]["io_workers"])
+    document_cache = DocumentCache(agents_data)
+    library.subscribe(document_cache.invalidate)
+    scripts_config = config["scripts"]
+    max_output = scripts_config["max_output_bytes"]
+    worker_pool = None
+    if scripts_config["mode"] == "pool":
+        worker_pool = BashWorkerPool(
+            size=scripts_config["pool_size"], max_runs=scripts_config["max_runs_per_worker"], max_output=max_output
+        )
+    scheduler = ScriptScheduler(
+        worker_pool or SubprocessRunner(max_output=max_output),
+        max_concurrent=scripts_config["max_concurrent"],
+        max_concurrent_per_script=scripts_config["max_concurrent_per_script"],
+        max_queued=scripts_config["max_queued"],
+        queue_timeout=scripts_config["queue_timeout"],
+        script_limits=scripts_config["script_limits"],
+    )
+    script_runner = ScriptResultCache(
+        scheduler, ttls=scripts_config["cache_ttls"], max_entries=scripts_config["cache_max_entries"]
+    )
+    outlines = OutlineStore(agents_data)
+    library.subscribe(outlines.apply)
+    search_index = SearchIndex(agents_data, outlines)
+    # The SQLite storage ranks documents with its own full-text index
+    if config["agents_library"]["backend"] == "files":
+        library.subscribe(search_index.apply)
+    listing = ListingIndex(library, outlines, document_cache)
+    library.subscribe(listing.apply)
+    versions = VersionStore(agents_data, history=config["agents_library"]["history"])
+    library.subscribe(versions.apply)
+    # Several workers each hold a copy of the library and tell each other
+    # about the documents they update
+    shared = SharedGeneration(Path(config["server"]["shared_state_dir"])) if workers > 1 else None
+    library_size = LibrarySize(agents_data)
+    library.subscribe(library_size.apply)
+    # Scripts that outlive the drain are killed with their process groups
+    lifecycle = Lifecycle(drain_timeout=config["server"]["drain_timeout"], on_deadline=script_runner.close)
+    _register_gauges(library_size, scheduler, script_runner, lifecycle)
+    # The directory is set at startup, from AGENTS_LIBRARY_PATH if it is set
+    scripts = ScriptCatalog(Path(config["server"]["agents_library_path"]) / "bash", library.run_io)
+    script_resources: dict[str, FunctionResource] = {}
+
+    def _output_forwarder() -> OutputCallback | None:
+        """Returns a callback that sends script output to the client as progress notifications.
+
+        Returns None when streaming is disabled or the client did not ask for
+        progress notifications.
+        """
+        if not scripts_config["stream_output"]:
+            return None
+        context = mcp_server.get_context()
+        try:
+            meta = context.request_context.meta
+        except ValueError:
+            return None
+        if meta is None or meta.progressToken is None:
+            return None
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        received = 0
+
+        async def _forward(chunk: bytes) -> None:
+            nonlocal received
+            received += len(chunk)
+            text = decoder.decode(chunk)
+            if text:
+                await context.report_progress(received, message=text)
+
+        return _forward
+
+    async def _run_script(script_name: str, arguments: dict[str, Any]) -> str:
+        """Validates the arguments of a script and runs it."""
+        spec = scripts.get(script_name)
+        if spec is None:
+            raise ResourceError(f"Unknown script: {script_name}")
+        start = time.perf_counter()
+        outcome = "error"
+        returncode = None
+        script_timeout = DEFAULT_TIMEOUT
+        try:
             try:
-                script_name = file_path.stem
-                resource_uri = f"resource://scripts/{script_name}"
-
-                mcp_server.add_resource(
-                    FunctionResource(
-                        fn=create_run_script_callable(file_path),
-                        uri=resource_uri,
-                        name=script_name,
-                        description=f"Executes the {script_name}.sh script and returns its output.",
-                        mime_type="text/plain",
-                        schema={
-                            "type": "object",
-                            "properties": {
-                                "project_name": {
-                                    "type": "string",
-                                    "description": "The name of the new project.",
-                                },
-                                "mcp_server_url": {
-                                    "type": "string",
-                                    "description": "The URL of the MCP server (e.g., http://localhost:8080).",
-                                },
-                                "script_timeout": {
-                                    "type": "integer",
-                                    "description": "Timeout for script execution in seconds (default: 60).",
-                                    "default": 60,
-                                },
-                            },
-                            "required": [],
-                            "additionalProperties": True,
-                        },
-                    )
+                values, script_timeout = spec.validate(arguments)
+            except ScriptArgumentError as e:
+                # Rejected before anything is spawned
+                outcome = "invalid"
+                raise ResourceError(f"Invalid arguments for {script_name}: {e}") from None
+            with lifecycle.track("script"):
+                result = await script_runner.run(
+                    spec.path, build_args(values), script_timeout, on_output=_output_forwarder()
+                )
+            returncode = result.returncode
+            if result.returncode != 0:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Script execution failed: {result.stderr.decode(errors='replace').strip()}",
+                ) from None
+            output = result.stdout.decode(errors="replace").strip()
+            if result.truncated:
+                output += f"\n[output truncated after {max_output} bytes]"
+            outcome = "ok"
+            return output
+        except TimeoutError:
+            outcome = "timeout"
+            raise ResourceError(f"Script execution timed out after {script_timeout} seconds.") from None
+        except ScriptRejectedError as e:
+            outcome = "rejected"
+            raise HTTPException(status_code=503, detail=str(e)) from None
+        finally:
+            duration = time.perf_counter() - start
+            SCRIPT_DURATION.observe(duration, script_name)
+            SCRIPT_RUNS.inc(script_name, outcome)
+            log_event(
+                logger,
+                "script_run",
+                "Script run",
+                level=logging.INFO if outcome == "ok" else logging.WARNING,
+                script=script_name,
+                outcome=outcome,
+                returncode=returncode,
+                duration_ms=round(duration * 1000, 3),
+                timeout=script_timeout,
+                args=len(arguments),
+            )
+
+    def _script_resource(script_name: str) -> Callable[[], Awaitable[str]]:
+        async def _run() -> str:
+            return await _run_script(script_name, {})
+
+        return _run
+
+    def _register_scripts(changes: ChangeSet) -> None:
+        """Keeps the script resources in line with the catalog."""
+        for name in (*changes.added, *changes.changed):
+            spec = scripts.specs[name]
+            script_runner.set_ttl(name, spec.cache_ttl)
+            uri = f"resource://scripts/{name}"
+            resource = script_resources.get(name)
+            if resource is None:
+                script_resources[name] = resource = FunctionResource(
+                    fn=_script_resource(name),
+                    uri=uri,
+                    name=name,
+                    description=spec.description,
+                    mime_type="text/plain",
                 )
-                print(f"Loaded bash script: {file_path.name} as resource '{resource_uri}'")
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
+                mcp_server.add_resource(resource)
+                logger.debug("Loaded bash script %s as resource '%s'", spec.path.name, uri)
+            else:
+                resource.description = spec.description
+        for name in changes.removed:
+            script_runner.set_ttl(name, None)
+            # The SDK cannot unregister resources, reading one fails from now on
+            if (resource := script_resources.get(name)) is not None:
+                resource.description = f"The {name}.sh script was removed."
+
+    scripts.subscribe(_register_scripts)
+
+    @mcp_server.resource(
+        "resource://scripts/{invocation}",
+        name="script",
+        description="Runs a bash script with arguments, e.g. resource://scripts/deploy_app?app-name=web&version=1.0.",
+        mime_type="text/plain",
+    )
+    async def run_script_with_arguments(invocation: str) -> str:
+        """Runs the script named before the "?" with the arguments of the query string."""
+        script_name, _, query = invocation.partition("?")
+        pairs = urllib.parse.parse_qsl(query, keep_blank_values=True)
+        arguments = dict(pairs)
+        if len(arguments) != len(pairs):
+            raise ResourceError(f"Invalid arguments for {script_name}: an argument is given more than once")
+        return await _run_script(script_name, arguments)
 
     @asynccontextmanager
     async def lifespan(app: FastAPI) -> AsyncIterator[None]:
@@ -178,18 +342,144 @@ def create_app() -> FastAPI:
 
         Handles startup and shutdown events.
         """
-        # Get AGENTS_LIBRARY_PATH from environment variable during lifespan startup
-        agents_library_path = Path(os.environ.get("AGENTS_LIBRARY_PATH", "/app/agents-library"))
-        await _load_agents_data(agents_library_path)
-        await _load_bash_scripts(agents_library_path)
+        started = time.perf_counter()
+        with profiler.phase("logging"):
+            log_listener = configure_logging(config["logging"])
+        # AGENTS_LIBRARY_PATH takes precedence over the configured path
+        agents_library_path = Path(os.environ.get("AGENTS_LIBRARY_PATH", config["server"]["agents_library_path"]))
+        library_config = config["agents_library"]
+        snapshot = None
+        source: Path | LibraryStorage = agents_library_path
+        if library_config["backend"] == "sqlite":
+            source = await library.run_io(SqliteStorage, agents_library_path / library_config["sqlite_path"])
+        elif library_config["snapshot"]:
+            with profiler.phase("snapshot"):
+                snapshot = await library.run_io(Snapshot.open, agents_library_path / library_config["snapshot"])
+        with profiler.phase("library"):
+            await library.load(source, preloaded=snapshot.entries if snapshot is not None else None)
+            if snapshot is not None:
+                # Serve the payloads encoded by the build step straight from the mapping
+                for entry in snapshot.entries.values():
+                    document_cache.preload(entry.name, entry.content, entry.digest, entry.payload)
+        with profiler.phase("scripts"):
+            scripts.directory = agents_library_path / "bash"
+            if await library.run_io(scripts.directory.is_dir):
+                await scripts.refresh()
+                logger.info("Loaded %d bash scripts as resources", len(scripts.specs))
+            else:
+                logger.warning("Directory not found: %s", scripts.directory)
+        if worker_pool is not None:
+            with profiler.phase("worker_pool"):
+                await worker_pool.start()
+            logger.info("Started %d bash workers for script resources", worker_pool.size)
+        with profiler.phase("warm"):
+            # Encode every payload now rather than in the first request for it
+            for name in list(agents_data):
+                document_cache.get(name)
+
+        # Pick up out-of-band edits to the library without a restart
+        watcher = None
+        markdown_dir = library.markdown_dir
+        if library_config["watch"] and (markdown_dir is None or await library.run_io(markdown_dir.is_dir)):
+            with profiler.phase("watcher"):
+                watcher = create_watcher(
+                    library,
+                    mode=library_config["watch_mode"],
+                    poll_interval=library_config["poll_interval"],
+                )
+            logger.info("Watching %s for changes (%s)", library.storage.location, watcher.mode)
+        # Scripts are few, a stat of each is cheap enough to poll for header changes
+        script_watcher = None
+        if library_config["watch"]:
+            script_watcher = PollingWatcher(scripts, poll_interval=library_config["poll_interval"])
+            script_watcher.start()
+
         mcp_app = mcp_server.streamable_http_app()
-        async with mcp_server.session_manager.run():
-            app.mount("/", mcp_app)
-            print("MCP server started and ready to serve.")
-            yield
-        # Clean up / shutdown events can go here if needed
+        try:
+            async with mcp_server.session_manager.run():
+                app.mount("/", mcp_app)
+                lifecycle.mark_ready()
+                LIFECYCLES.add(lifecycle)
+                fields = profiler.report() if profile else {}
+                log_event(
+                    logger,
+                    "startup",
+                    "MCP server started and ready to serve",
+                    duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                    **fields,
+                )
+                yield
+                # The launcher drains before it stops listening, this only
+                # waits when the server was started some other way
+                await lifecycle.drain()
+        finally:
+            LIFECYCLES.discard(lifecycle)
+            if watcher is not None:
+                await watcher.stop()
+            if script_watcher is not None:
+                await script_watcher.stop()
+            await script_runner.close()
+            library.close()
+            if snapshot is not None:
+                # Preloaded payloads are views into the mapping
+                document_cache.clear()
+                snapshot.close()
+            lifecycle.stop()
+            log_listener.stop()
 
     app = FastAPI(lifespan=lifespan)
+    if shared is not None:
+        app.add_middleware(SharedStateMiddleware, library=library, shared=shared)
+    compression_config = config["compression"]
+    # Codings whose library is not installed are skipped
+    encodings = [e for e in compression_config["encodings"] if e in CODECS] if compression_config["enabled"] else []
+    compression_levels = {**DEFAULT_LEVELS, **compression_config["levels"]}
+    if encodings:
+        app.add_middleware(
+            CompressionMiddleware,
+            encodings=encodings,
+            minimum_size=compression_config["minimum_size"],
+            levels=compression_levels,
+        )
+    rate_config = config["rate_limit"]
+    if rate_config["enabled"]:
+        app.add_middleware(
+            RateLimitMiddleware,
+            tools=RateLimiter(**rate_config["tools"], max_clients=rate_config["max_clients"]),
+            scripts=RateLimiter(**rate_config["scripts"], max_clients=rate_config["max_clients"]),
+            mcp_path=config["mcp_server"]["streamable_http_path"],
+            tool_paths=["/test/call_tool"],
+            sessions=not stateless,
+        )
+    auth_config = config["auth"]
+    if auth_config["enabled"]:
+        # Imported only when enabled, authlib and cryptography take about 80 ms
+        auth = importlib.import_module("app.auth")
+        jwks = auth.JwksCache(
+            jwks_url=auth_config["jwks_url"] or None,
+            issuer=auth_config["issuer"] or None,
+            refresh_interval=auth_config["jwks_refresh_interval"],
+        )
+        validator = auth.TokenValidator(
+            jwks,
+            issuer=auth_config["issuer"] or None,
+            audience=auth_config["audience"] or None,
+            algorithms=auth_config["algorithms"],
+            leeway=auth_config["leeway"],
+            max_entries=auth_config["cache_max_entries"],
+        )
+        # Added last to run first, so rejected requests cost no other work and
+        # the rate limiter sees the authenticated subject
+        app.add_middleware(
+            auth.BearerAuthMiddleware,
+            validator=validator,
+            paths=[config["mcp_server"]["streamable_http_path"], "/test/call_tool"],
+        )
+    # Outermost, so work refused while starting or draining costs nothing and
+    # every request that was let in is waited for
+    app.add_middleware(
+        DrainMiddleware, lifecycle=lifecycle, paths=[config["mcp_server"]["streamable_http_path"], "/test/call_tool"]
+    )
 
     @app.exception_handler(ToolError)
     async def tool_error_handler(_request: Request, exc: ToolError) -> JSONResponse:
@@ -202,118 +492,496 @@ def create_app() -> FastAPI:
     @app.post("/test/call_tool")
     async def test_call_tool(
         request_data: dict,
-    ) -> Any:
-        """Tests calling a tool with the given request."""
+    ) -> Response:
+        """Tests calling a tool with the given request.
+
+        Set format to markdown in the request to get the content of a
+        get_agents_instructions result as text/markdown instead of JSON.
+        """
         tool_call_request = request_data.get("tool_call_request", {})
         tool_name = tool_call_request.get("tool_name")
         args = tool_call_request.get("args", {})
+        response_format = tool_call_request.get("format", "json")
 
         if not tool_name:
             raise HTTPException(status_code=422, detail="tool_name is required")
+        if response_format not in ("json", "markdown"):
+            raise HTTPException(status_code=422, detail="format must be json or markdown")
+        if response_format == "markdown" and tool_name != "get_agents_instructions":
+            raise HTTPException(status_code=422, detail="format markdown is only available for get_agents_instructions")
 
         try:
             raw_result = await mcp_server.call_tool(tool_name, args)
-
-            # Extract the TextContent object from the tuple
-            result = raw_result[0][0] if isinstance(raw_result, tuple) and len(raw_result[0]) > 0 else raw_result
-
-            response_content = {}
-            if isinstance(result, TextContent):
-                try:
-                    json_data = json.loads(result.text)
-                    response_content = {"type": "json", "content": json_data}
-                except json.JSONDecodeError:
-                    response_content = {"type": "text", "content": result.text}
-
-            return JSONResponse(status_code=200, content=response_content)
-        except HTTPException as e:
-            return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
         except ToolError as e:
             if isinstance(e.__cause__, HTTPException):
-                return JSONResponse(
-                    status_code=e.__cause__.status_code,
-                    content={"detail": e.__cause__.detail},
-                )
-            return JSONResponse(status_code=500, content={"detail": str(e)})
+                raise e.__cause__ from None
+            raise HTTPException(status_code=500, detail=str(e)) from None
+
+        # Structured tools return a (content, structured) tuple, unstructured
+        # ones the content list
+        content, structured = raw_result if isinstance(raw_result, tuple) else (raw_result, None)
+        result = content[0] if isinstance(content, list | tuple) and len(content) > 0 else None
+        # The whole-document reply of get_agents_instructions is the cached
+        # entry, whose encoded body is reused
+        entry = document_cache.get(args.get("name", "")) if tool_name == "get_agents_instructions" else None
+        whole_document = entry is not None and result is entry.text_content
+
+        if response_format == "markdown":
+            return _markdown_response(result, entry if whole_document else None)
+        if tool_name in JSON_TEXT_TOOLS and isinstance(result, TextContent):
+            body = entry.body if whole_document else result.text.encode("utf-8")
+            return JoinedResponse([b'{"type":"json","content":', body, b"}"], media_type="application/json")
+        return _json_response(result, structured)
+
+    def _json_response(result: Any, structured: dict | None) -> Response:
+        """Wraps a tool result in the JSON envelope of /test/call_tool."""
+        # A value that is not an object is wrapped as {"result": value}, its
+        # text content is the value itself
+        if structured is not None and list(structured) != ["result"]:
+            return Response(encode_bytes({"type": "json", "content": structured}), media_type="application/json")
+        if not isinstance(result, TextContent):
+            return JSONResponse(status_code=200, content={})
+        try:
+            response_content = {"type": "json", "content": json.loads(result.text)}
+        except json.JSONDecodeError:
+            response_content = {"type": "text", "content": result.text}
+        return Response(encode_bytes(response_content), media_type="application/json")
+
+    def _markdown_response(result: TextContent | None, entry: Any) -> Response:
+        """Returns the markdown of a get_agents_instructions result."""
+        if entry is not None:
+            return Response(entry.content, media_type=CONTENT_TYPE, headers={"ETag": entry.etag})
+        payload = json.loads(result.text) if isinstance(result, TextContent) else {}
+        if payload.get("not_modified"):
+            return Response(status_code=304, headers={"ETag": payload["etag"]})
+        if not isinstance(payload.get("content"), str):
+            raise HTTPException(status_code=422, detail="The result has no markdown content.")
+        return Response(payload["content"], media_type=CONTENT_TYPE, headers={"ETag": payload["etag"]})
 
     @app.get("/health")
     async def health_check() -> dict:
         """Health check endpoint."""
         return {"status": "ok"}
 
+    @app.get("/ready")
+    async def readiness_check() -> JSONResponse:
+        """Readiness check, OK only while the library is loaded and the server is not draining."""
+        status = HTTPStatus.OK if lifecycle.ready else HTTPStatus.SERVICE_UNAVAILABLE
+        return JSONResponse(
+            {"status": lifecycle.state.value, "in_flight": dict(lifecycle.in_flight)}, status_code=status.value
+        )
+
+    @app.get("/metrics")
+    async def metrics() -> Response:
+        """Exposes request, latency and library metrics in the Prometheus text format."""
+        return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+    @app.get("/scripts")
+    async def script_schemas() -> dict:
+        """Returns the JSON schema of the arguments of every script."""
+        return {name: spec.schema() for name, spec in sorted(scripts.specs.items())}
+
+    @app.get("/scripts/stats")
+    async def script_stats() -> dict:
+        """Reports the load of the script scheduler to help size its limits."""
+        return {**scheduler.snapshot(), "cache": script_runner.snapshot()}
+
+    @app.get("/agents/{name}")
+    async def get_agents_document(name: str, request: Request) -> Response:
+        """Returns the cached get_agents_instructions payload with ETag support."""
+        entry = document_cache.get(name)
+        if entry is None:
+            raise HTTPException(status_code=404, detail=f"AGENTS.md file '{name}' not found.")
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if entry.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        if len(entry.body) >= compression_config["minimum_size"]:
+            encoding = negotiate(request.headers.get("accept-encoding"), encodings)
+            if encoding is not None:
+                # Compressed once per document version instead of on every request
+                body = await entry.compressed(CODECS[encoding], compression_levels[encoding])
+                headers["Content-Encoding"] = encoding
+                return Response(content=body, media_type="application/json", headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
     @mcp_server.tool(
         name="get_agents_instructions",
-        description="Retrieves a specific AGENTS.md file for providing AI with instructions and context.",
+        description=(
+            "Retrieves a specific AGENTS.md file for providing AI with instructions and context. "
+            "Pass the etag of a previously fetched copy as if_none_match to get a short "
+            "not_modified reply when the file has not changed. Large files can be fetched in "
+            "parts: set outline to get only the headings with their sizes, then request "
+            "sections by title or path, a 0-based end-exclusive byte_range or a 1-based "
+            "inclusive line_range."
+        ),
+        structured_output=False,
     )
+    @instrument_tool("get_agents_instructions")
     async def get_agents_instructions(
         name: str,
-    ) -> dict[str, str]:
-        """Handler to return the content of a requested AGENTS.md file."""
-        if name in agents_data:
-            return {"content": agents_data[name], "content_type": "text/markdown"}
-        raise HTTPException(status_code=404, detail=f"AGENTS.md file '{name}' not found.")
+        if_none_match: str | None = None,
+        *,
+        sections: list[str] | None = None,
+        byte_range: list[int] | None = None,
+        line_range: list[int] | None = None,
+        outline: bool = False,
+    ) -> TextContent:
+        """Handler to return the content of a requested AGENTS.md file.
+
+        Args:
+            name: The name of the AGENTS.md file (e.g., 'dev_rules').
+            if_none_match: The etag of the copy the client already holds.
+            sections: Titles or " > " separated paths of the sections to return.
+            byte_range: [start, end] UTF-8 byte offsets of the text to return.
+            line_range: [first, last] line numbers of the text to return.
+            outline: Return only the headings of the file with their sizes.
+        """
+        entry = document_cache.get(name)
+        if entry is None:
+            raise HTTPException(status_code=404, detail=f"AGENTS.md file '{name}' not found.")
+        if entry.matches(if_none_match):
+            return entry.not_modified()
+        if not outline and sections is None and byte_range is None and line_range is None:
+            return entry.text_content
+
+        document_outline = outlines.get(name)
+        if outline:
+            payload = {
+                "name": name,
+                "etag": entry.etag,
+                "size": document_outline.size,
+                "lines": document_outline.line_count,
+                "sections": [section.to_dict() for section in document_outline.sections],
+            }
+        else:
+            try:
+                payload = extract(document_outline, sections=sections, byte_range=byte_range, line_range=line_range)
+            except LookupError as e:
+                raise HTTPException(status_code=404, detail=f"{e.args[0]} in AGENTS.md file '{name}'.") from None
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e)) from None
+            payload.update(content_type=CONTENT_TYPE, etag=entry.etag)
+        return TextContent(type="text", text=encode(payload))
+
+    @mcp_server.tool(
+        name="get_agents_instructions_batch",
+        description=(
+            "Retrieves several AGENTS.md files in one call. Returns the found files by name "
+            "and lists the names that do not exist under not_found. Optionally pass sections "
+            "per file name, etags per file name as if_none_match, and a max_bytes budget for "
+            "the content of all files together: the file that crosses it is cut short and "
+            "marked truncated, later files are listed under omitted."
+        ),
+        structured_output=False,
+    )
+    @instrument_tool("get_agents_instructions_batch")
+    async def get_agents_instructions_batch(
+        names: list[str],
+        sections: dict[str, list[str]] | None = None,
+        if_none_match: dict[str, str] | None = None,
+        max_bytes: int | None = None,
+    ) -> TextContent:
+        """Handler to return several AGENTS.md files at once.
+
+        Args:
+            names: The names of the AGENTS.md files, in the order to fill the budget.
+            sections: Titles or paths of the sections to return, by file name.
+            if_none_match: The etags of the copies the client already holds, by file name.
+            max_bytes: The maximum number of UTF-8 content bytes of all files together.
+        """
+        if max_bytes is not None and max_bytes < 0:
+            raise HTTPException(status_code=422, detail="max_bytes must not be negative.")
+        sections = sections or {}
+        if_none_match = if_none_match or {}
+        # -1 stands for no budget
+        budget = max_bytes if max_bytes is not None else -1
+        documents: dict[str, str] = {}
+        not_found: list[str] = []
+        omitted: list[str] = []
+        for name in dict.fromkeys(names):
+            entry = document_cache.get(name)
+            if entry is None:
+                not_found.append(name)
+                continue
+            if entry.matches(if_none_match.get(name)):
+                documents[name] = entry.not_modified().text
+                continue
+            if budget == 0:
+                omitted.append(name)
+                continue
+            document_outline = outlines.get(name)
+            if name in sections:
+                try:
+                    payload = extract(document_outline, sections=sections[name])
+                except LookupError:
+                    payload = {"content": "", "sections": [], "missing_sections": sections[name]}
+                payload.update(content_type=CONTENT_TYPE, etag=entry.etag)
+                size = len(payload["content"].encode("utf-8"))
+            else:
+                # Whole documents reuse the payload encoded for get_agents_instructions
+                payload = None
+                size = document_outline.size
+            if 0 <= budget < size:
+                content = payload["content"] if payload is not None else entry.content
+                cut = content.encode("utf-8")[:budget].decode("utf-8", errors="ignore")
+                payload = {**(payload or {}), "content": cut, "content_type": CONTENT_TYPE, "etag": entry.etag}
+                payload.update(truncated=True, size=size)
+                size = budget
+            documents[name] = entry.text if payload is None else encode(payload)
+            if budget > 0:
+                budget -= size
+        text = encode_members(
+            {"documents": encode_members(documents), "not_found": encode(not_found), "omitted": encode(omitted)}
+        )
+        return TextContent(type="text", text=text)
 
     @mcp_server.tool(
         name="list_agents_instructions",
-        description="Lists all available AGENTS.md files.",
+        description=(
+            "Lists the available AGENTS.md files in name order. Filter them by prefix or by a glob pattern "
+            "such as 'py*', and page through them with limit and the next_cursor of the previous page. "
+            "With metadata each file comes with its size in bytes, etag, modified time and headings."
+        ),
+    )
+    @instrument_tool("list_agents_instructions")
+    async def list_agents_instructions(
+        cursor: str | None = None,
+        limit: int | None = None,
+        prefix: str = "",
+        glob: str = "",
+        metadata: bool = False,
+    ) -> dict[str, Any]:
+        """Handler to list the available AGENTS.md files.
+
+        Args:
+            cursor: The next_cursor of the previous page.
+            limit: The maximum number of files to return, all of them when omitted.
+            prefix: Only list files whose name starts with it.
+            glob: Only list files whose name matches this shell-style pattern.
+            metadata: Whether to describe every file instead of only naming it.
+        """
+        if limit is not None and limit < 1:
+            raise HTTPException(status_code=422, detail="limit must be at least 1.")
+        try:
+            page = await listing.fetch(cursor, limit, prefix=prefix, glob=glob)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e)) from None
+        result: dict[str, Any] = {"files": [listing.describe(name) for name in page.names] if metadata else page.names}
+        if page.next_cursor is not None:
+            result["next_cursor"] = page.next_cursor
+        return result
+
+    @mcp_server.tool(
+        name="search_agents_instructions",
+        description=(
+            "Searches the sections of all AGENTS.md files and returns the best matching "
+            "sections with their headings and a short snippet."
+        ),
+    )
+    @instrument_tool("search_agents_instructions")
+    async def search_agents_instructions(
+        query: str,
+        limit: int = 10,
+    ) -> dict[str, Any]:
+        """Handler to run a full-text search over the AGENTS.md files.
+
+        Args:
+            query: The words to search for.
+            limit: The maximum number of hits to return.
+        """
+        limit = max(0, min(limit, 100))
+        storage = library.storage
+        if isinstance(storage, SqliteStorage):
+            terms = list(dict.fromkeys(tokenize(query)))
+            ranked = await library.run_io(storage.search, terms, limit)
+            hits = [
+                document_hit(name, outline, score, terms)
+                for name, score in ranked
+                if (outline := outlines.get(name)) is not None
+            ]
+        else:
+            hits = search_index.search(query, limit=limit)
+        return {"query": query, "hits": [asdict(hit) for hit in hits]}
+
+    @mcp_server.tool(
+        name="get_agents_history",
+        description=(
+            "Lists the versions of an AGENTS.md file held in memory with their etags, newest last. "
+            "Pass since_version to also get a unified diff from that version to the current one."
+        ),
+        structured_output=False,
     )
-    async def list_agents_instructions() -> dict[str, list]:
-        """Handler to list all available AGENTS.md files."""
-        return {"files": sorted(agents_data.keys())}
+    @instrument_tool("get_agents_history")
+    async def get_agents_history(name: str, since_version: int | None = None) -> str:
+        """Handler to return the version history of an AGENTS.md file.
+
+        Args:
+            name: The name of the AGENTS.md file (e.g., 'dev_rules').
+            since_version: The version the client holds, to get the changes since.
+        """
+        current = versions.current(name)
+        if current is None:
+            raise HTTPException(status_code=404, detail=f"AGENTS.md file '{name}' not found.")
+        payload: dict[str, Any] = {
+            "name": name,
+            "version": current.version,
+            "etag": current.etag,
+            "versions": [version.to_dict() for version in versions.versions(name)],
+        }
+        if since_version is not None:
+            base = versions.get(name, since_version)
+            if base is None:
+                raise HTTPException(
+                    status_code=410,
+                    detail=f"Version {since_version} of AGENTS.md file '{name}' is no longer in the history.",
+                )
+            payload["diff"] = make_patch(
+                base.content, current.content, f"{name}@{since_version}", f"{name}@{current.version}"
+            )
+        return encode(payload)
 
     @mcp_server.tool(
         name="update_agents_file",
-        description="Updates the content of a specific AGENTS.md file in the agents-library.",
+        description=(
+            "Updates the content of a specific AGENTS.md file in the agents-library. Pass either the "
+            "new_content or a unified diff as patch. With expected_version the update is only made "
+            "while the file is still at that version, 0 meaning it does not exist yet, and the new "
+            "version and etag are returned. A patch always needs the expected_version it was made against."
+        ),
     )
+    @instrument_tool("update_agents_file")
     async def update_agents_file(
         file_name: str,
-        new_content: str,
+        new_content: str | None = None,
+        patch: str | None = None,
+        expected_version: int | None = None,
+        expected_etag: str | None = None,
     ) -> str:
         """Handler to update a markdown file in the agents-library.
 
         Args:
             file_name: The name of the file to update (e.g., 'common_prompts').
             new_content: The new content to write to the file.
+            patch: A unified diff to apply to the current content instead.
+            expected_version: The version the update was made against.
+            expected_etag: The etag of the content the update was made against.
         """
+        if (new_content is None) == (patch is None):
+            raise HTTPException(status_code=422, detail="Pass either new_content or patch.")
+        if expected_version is not None and expected_etag is not None:
+            raise HTTPException(status_code=422, detail="Pass either expected_version or expected_etag.")
+        checked = expected_version is not None or expected_etag is not None
+        if patch is not None and not checked:
+            raise HTTPException(
+                status_code=422, detail="A patch needs the expected_version or expected_etag it was made against."
+            )
+        if expected_version is not None and workers > 1:
+            raise HTTPException(
+                status_code=422, detail="Versions are counted by each worker, pass expected_etag instead."
+            )
+
         # Security check: Ensure the file has the correct extension
         if not file_name.endswith(".agents.md"):
             raise HTTPException(status_code=403, detail="File must end with '.agents.md'.")
 
-        # Define the base directory for agents and ensure the file is in the markdown
-        # subdirectory
-        target_dir = AGENTS_LIBRARY_PATH / "markdown"
-
-        # Resolve the absolute path of the target directory to prevent path traversal
-        # attacks
-        safe_target_dir = target_dir.resolve()
-
-        # Construct the full file path and resolve it to its absolute path
-        file_path = (target_dir / file_name).resolve()
+        # Files are written to the markdown subdirectory of the loaded library
+        target_dir = library.markdown_dir
+        if target_dir is not None:
+            # Resolve the absolute path of the target directory to prevent path traversal
+            # attacks
+            safe_target_dir = target_dir.resolve()
+
+            # Construct the full file path and resolve it to its absolute path
+            file_path = (target_dir / file_name).resolve()
+            allowed = str(file_path).startswith(str(safe_target_dir))
+            name = document_name(file_path.name)
+        else:
+            # Other storages take the name as it is, it must still be a valid file name
+            name = document_name(file_name)
+            allowed = name is not None and not any(c in name for c in "/\\\0")
 
         # Security check: Ensure the resolved file path is within the safe target
         # directory
-        if not str(file_path).startswith(str(safe_target_dir)):
+        if not allowed or name is None:
             raise HTTPException(
                 status_code=403,
                 detail=f"Access denied: '{file_name}' is not in the allowed directory.",
             )
 
-        try:
-            # Write the new content to the file
-            file_path.write_text(new_content, encoding="utf-8")
+        # The update is checked against the hash of the content it was made
+        # against, None meaning the document must not exist yet
+        expected: str | None = None
+        if expected_etag is not None:
+            expected = expected_etag.strip('"')
+        elif expected_version:
+            base = versions.get(name, expected_version)
+            if base is None:
+                current = versions.current(name)
+                raise HTTPException(
+                    status_code=409,
+                    detail=(
+                        f"'{file_name}' is at version {current.version if current is not None else 0}, "
+                        f"not {expected_version}. Fetch it again and retry."
+                    ),
+                )
+            expected = base.digest
 
-            # Reload agents data to reflect the changes in memory
-            await _load_agents_data(AGENTS_LIBRARY_PATH)
+        def _change(current: str | None) -> str:
+            # Runs on the stored document under the lock every writer takes,
+            # so no other worker or server can write in between
+            if checked:
+                check_etag(name, current, expected)
+            if patch is not None:
+                return apply_patch(current or "", patch)
+            return new_content
 
-            return f"Successfully updated '{file_name}'."
+        try:
+            # Store the new content and apply only the updated document to
+            # reflect the change in memory
+            if checked:
+                changes = await library.update(name, _change)
+            else:
+                changes = await library.write(name, new_content)
+        except ConflictError as e:
+            raise HTTPException(
+                status_code=409,
+                detail=(
+                    f"'{file_name}' changed since the version the update was made against, it is at "
+                    f"{e.etag or 'no version'}. Fetch it again and retry."
+                ),
+            ) from None
+        except PatchError as e:
+            raise HTTPException(status_code=422, detail=f"Patch does not apply to '{file_name}': {e}") from None
         except Exception as e:
             raise ToolError(f"Error updating file '{file_name}': {e}") from e
+        if shared is not None and changes:
+            shared.publish([*changes.added, *changes.changed, *changes.removed])
+        updated = versions.current(name)
+
+        if not checked or updated is None:
+            return f"Successfully updated '{file_name}'."
+        return encode({"file_name": file_name, "version": updated.version, "etag": updated.etag})
 
+    profiler.phases["create_app"] = time.perf_counter() - created
     return app
 
 
-app = create_app()
+def __getattr__(name: str) -> Any:
+    """Resolves config and app on first use instead of at import.
+
+    Keeps `uvicorn app.server:app` working, the launcher uses the create_app
+    factory instead.
+    """
+    if name == "config":
+        return get_config()
+    if name == "app":
+        app = create_app()
+        globals()["app"] = app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=SERVER_PORT)
+    from app.main import main
+
+    main()
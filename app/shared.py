@@ -0,0 +1,142 @@
+import asyncio
+import contextlib
+import fcntl
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+from app.library import AgentsLibrary
+
+logger = logging.getLogger(__name__)
+
+# The shared counter file holds the generation and the number of times the
+# journal was cut back
+HEADER = struct.Struct("<QQ")
+# The journal is cut back once it grows past this size, workers that fall
+# behind a truncation reload the whole library instead
+MAX_JOURNAL_SIZE = 1024 * 1024
+
+
+class SharedGeneration:
+    """A generation counter and change journal shared by the workers of one server.
+
+    The counters live in a small file mapped into every worker, so checking
+    for changes costs a single memory read. Writers append the names of the
+    documents they changed to the journal and then bump the counter, both
+    under an exclusive lock on the journal. Readers that see a new
+    generation read the journal from where they left off.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        counter_path = directory / "generation"
+        fd = os.open(counter_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < HEADER.size:
+                os.ftruncate(fd, HEADER.size)
+            self._counter = mmap.mmap(fd, HEADER.size)
+        finally:
+            os.close(fd)
+        self._journal = os.open(directory / "changes.log", os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        with self._locked():
+            self._seen, self._epoch = HEADER.unpack_from(self._counter)
+            self._offset = os.fstat(self._journal).st_size
+
+    @property
+    def generation(self) -> int:
+        """The current generation of the shared state."""
+        return HEADER.unpack_from(self._counter)[0]
+
+    def changed(self) -> bool:
+        """Whether another worker published changes since the last collect."""
+        return HEADER.unpack_from(self._counter)[0] != self._seen
+
+    def publish(self, names: list[str]) -> int:
+        """Records changed documents and bumps the generation.
+
+        Returns:
+            The new generation.
+        """
+        with self._locked():
+            generation, epoch = HEADER.unpack_from(self._counter)
+            end = os.fstat(self._journal).st_size
+            up_to_date = self._seen == generation and self._epoch == epoch and self._offset == end
+            if end > MAX_JOURNAL_SIZE:
+                os.ftruncate(self._journal, 0)
+                end = 0
+                epoch += 1
+            entry = b"".join(name.encode("utf-8") + b"\n" for name in names)
+            os.write(self._journal, entry)
+            generation += 1
+            HEADER.pack_into(self._counter, 0, generation, epoch)
+            # The publishing worker already applied its own changes
+            if up_to_date:
+                self._seen, self._epoch, self._offset = generation, epoch, end + len(entry)
+        return generation
+
+    def collect(self) -> list[str] | None:
+        """Returns the documents changed by other workers since the last collect.
+
+        Returns:
+            The changed document names, or None if the journal was cut back
+            and everything has to be reloaded.
+        """
+        with self._locked():
+            self._seen, epoch = HEADER.unpack_from(self._counter)
+            end = os.fstat(self._journal).st_size
+            if epoch != self._epoch:
+                self._epoch, self._offset = epoch, end
+                return None
+            data = os.pread(self._journal, end - self._offset, self._offset)
+            self._offset = end
+        return sorted({line.decode("utf-8") for line in data.splitlines() if line})
+
+    def close(self) -> None:
+        """Unmaps the counter and closes the journal."""
+        self._counter.close()
+        os.close(self._journal)
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Holds an exclusive lock on the journal, shared by all workers."""
+        fcntl.flock(self._journal, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._journal, fcntl.LOCK_UN)
+
+
+class SharedStateMiddleware:
+    """Brings the library of this worker up to date before every HTTP request.
+
+    The check is one read of the shared counter, documents are only read
+    again when another worker changed them.
+    """
+
+    def __init__(self, app: Any, library: AgentsLibrary, shared: SharedGeneration) -> None:
+        self.app = app
+        self.library = library
+        self.shared = shared
+        self._lock = asyncio.Lock()
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        """Handles an ASGI call."""
+        if scope["type"] == "http" and self.shared.changed():
+            await self.sync()
+        await self.app(scope, receive, send)
+
+    async def sync(self) -> None:
+        """Applies the changes published by other workers."""
+        # Requests that arrive during a sync wait for it instead of serving
+        # the old documents
+        async with self._lock:
+            if not self.shared.changed():
+                return
+            names = self.shared.collect()
+            changes = await self.library.refresh(names)
+        if changes:
+            logger.debug("Applied changes from other workers: %s", changes)
@@ -0,0 +1,183 @@
+"""Packs an agents library into one memory-mapped snapshot file.
+
+Usage:
+    python -m app.snapshot /app/agents-library
+
+The server maps the snapshot at startup instead of reading every AGENTS.md
+file and serves the pre-encoded payloads as slices of the mapping. Files that
+changed since the snapshot was built are read from disk as usual.
+"""
+
+import argparse
+import logging
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+
+from app.cache import document_digest, encode_document
+from app.storage import MARKDOWN_DIR, atomic_write_bytes, document_name
+
+logger = logging.getLogger(__name__)
+
+# Default location of the snapshot relative to the agents library root
+SNAPSHOT_NAME = "agents.snapshot"
+MAGIC = b"AGSNAP\x00\x00"
+VERSION = 1
+# Magic, version, number of entries and offset of the entry table
+HEADER = struct.Struct("<8sIIQ")
+# Name offset and length, mtime and size of the source file, offsets and
+# lengths of the markdown and the payload, raw SHA-256 digest
+ENTRY = struct.Struct("<QIqQQQQQ32s")
+
+
+@dataclass
+class SnapshotEntry:
+    """A document stored in a snapshot, with views into the mapped file."""
+
+    name: str
+    mtime_ns: int
+    size: int
+    digest: str
+    markdown: memoryview
+    payload: memoryview
+
+    @cached_property
+    def content(self) -> str:
+        """The document text, decoded on first use."""
+        return str(self.markdown, "utf-8")
+
+
+class Snapshot:
+    """A mapped snapshot file and its documents by name.
+
+    The mapping stays open until close is called, the server closes it when
+    it shuts down.
+    """
+
+    def __init__(self, path: Path, mapping: mmap.mmap, entries: dict[str, SnapshotEntry]) -> None:
+        self.path = path
+        self.mapping = mapping
+        self.entries = entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def close(self) -> None:
+        """Releases the views into the mapping and unmaps the file.
+
+        The views of the entries are released even where they are still
+        referenced, e.g. as payloads of cached documents, which must not be
+        used afterwards.
+        """
+        for entry in self.entries.values():
+            entry.markdown.release()
+            entry.payload.release()
+        self.entries = {}
+        try:
+            self.mapping.close()
+        except BufferError:
+            # A view derived from an entry is still alive, the mapping is unmapped once it is collected
+            logger.debug("Snapshot %s is still in use, leaving it mapped", self.path)
+
+    @classmethod
+    def open(cls, path: Path) -> "Snapshot | None":
+        """Maps a snapshot file.
+
+        Returns:
+            The snapshot, or None if the file does not exist or is not a
+            snapshot of this version.
+        """
+        try:
+            with path.open("rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot map snapshot %s: %s", path, e)
+            return None
+        try:
+            with memoryview(mapping) as view:
+                entries = _read_entries(view)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            logger.warning("Ignoring invalid snapshot %s: %s", path, e)
+            entries = None
+        if entries is None:
+            # Only once the traceback is gone, it holds the views of the entries read so far
+            mapping.close()
+            return None
+        return cls(path, mapping, entries)
+
+
+def _read_entries(view: memoryview) -> dict[str, SnapshotEntry]:
+    """Parses the header and the entry table of a mapped snapshot."""
+    magic, version, count, table_offset = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"unsupported format {magic!r} version {version}")
+    table = view[table_offset : table_offset + count * ENTRY.size]
+    if len(table) != count * ENTRY.size:
+        raise ValueError("truncated entry table")
+    entries: dict[str, SnapshotEntry] = {}
+    for name_at, name_len, mtime_ns, size, md_at, md_len, payload_at, payload_len, digest in ENTRY.iter_unpack(table):
+        if max(name_at + name_len, md_at + md_len, payload_at + payload_len) > table_offset:
+            raise ValueError("entry points past the data section")
+        name = str(view[name_at : name_at + name_len], "utf-8")
+        entries[name] = SnapshotEntry(
+            name=name,
+            mtime_ns=mtime_ns,
+            size=size,
+            digest=digest.hex(),
+            markdown=view[md_at : md_at + md_len],
+            payload=view[payload_at : payload_at + payload_len],
+        )
+    return entries
+
+
+def build(root: Path, output: Path) -> int:
+    """Writes a snapshot of every AGENTS.md file below root.
+
+    Returns:
+        The number of documents in the snapshot.
+    """
+    data = bytearray(HEADER.size)
+    table = bytearray()
+    with os.scandir(root / MARKDOWN_DIR) as entries:
+        files = sorted((name, entry.path) for entry in entries if (name := document_name(entry.name)) is not None)
+    for name, path in files:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            markdown = f.read()
+        try:
+            content = markdown.decode("utf-8")
+        except UnicodeDecodeError as e:
+            logger.warning("Skipping %s: %s", path, e)
+            continue
+        digest = document_digest(content)
+        fields = []
+        for chunk in (name.encode("utf-8"), markdown, encode_document(content, digest).encode("utf-8")):
+            fields += [len(data), len(chunk)]
+            data += chunk
+        name_at, name_len, md_at, md_len, payload_at, payload_len = fields
+        table += ENTRY.pack(
+            name_at, name_len, st.st_mtime_ns, st.st_size, md_at, md_len, payload_at, payload_len, bytes.fromhex(digest)
+        )
+    HEADER.pack_into(data, 0, MAGIC, VERSION, len(table) // ENTRY.size, len(data))
+    atomic_write_bytes(output, bytes(data + table))
+    return len(table) // ENTRY.size
+
+
+def main() -> None:
+    """Builds a snapshot from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", type=Path, help="The agents library root.")
+    parser.add_argument("-o", "--output", type=Path, help=f"Snapshot file, defaults to <root>/{SNAPSHOT_NAME}.")
+    args = parser.parse_args()
+    output = args.output or args.root / SNAPSHOT_NAME
+    count = build(args.root, output)
+    print(f"Wrote {count} documents to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+"""Storage backends of the agents library.
+
+Usage:
+    python -m app.storage /app/agents-library
+
+Imports the AGENTS.md files of a library into a SQLite database, by default
+agents.db in the library root, for the sqlite backend.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import logging
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+logger = logging.getLogger(__name__)
+
+# Location of the AGENTS.md files relative to the agents library root
+MARKDOWN_DIR = "markdown"
+AGENTS_SUFFIX = ".agents.md"
+# Default location of the SQLite database relative to the agents library root
+DATABASE_NAME = "agents.db"
+
+# Names per query when the SQLite backend looks up documents by name
+SQLITE_BATCH_SIZE = 500
+# Lock file in the library root that serializes writes across processes
+LOCK_NAME = ".agents.lock"
+
+
+class Signature(Protocol):
+    """Identifies the stored version of a document.
+
+    Signatures are hashable and change with every write, so comparing them
+    tells which documents to read again without reading them.
+    """
+
+    def __hash__(self) -> int: ...
+
+    @property
+    def modified(self) -> float:
+        """When the document was last written, in seconds since the epoch."""
+        ...
+
+
+class FileSignature(NamedTuple):
+    """The stat fields used to decide whether a file changed on disk."""
+
+    mtime_ns: int
+    size: int
+    inode: int
+
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> "FileSignature":
+        """Builds a signature from an os.stat_result."""
+        return cls(st.st_mtime_ns, st.st_size, st.st_ino)
+
+    @property
+    def modified(self) -> float:
+        """The modification time of the file."""
+        return self.mtime_ns / 1e9
+
+
+class RowSignature(NamedTuple):
+    """The revision of a document in the SQLite storage and when it was written."""
+
+    rev: int
+    modified: float
+
+
+def document_name(file_name: str) -> str | None:
+    """Returns the document name for an AGENTS.md file name, or None if it is not one."""
+    if not file_name.endswith(AGENTS_SUFFIX) or file_name == AGENTS_SUFFIX:
+        return None
+    return file_name[: -len(AGENTS_SUFFIX)]
+
+
+class LibraryStorage(Protocol):
+    """Where the documents of the agents library are kept.
+
+    All methods block and are run on the I/O thread pool of the library.
+    """
+
+    # Documents read per I/O task
+    read_batch_size: int
+
+    @property
+    def location(self) -> Path:
+        """Where the documents are stored, for logs."""
+        ...
+
+    def exists(self) -> bool:
+        """Whether the storage is there to be read."""
+        ...
+
+    def revision(self) -> int | None:
+        """Returns a number that changes with every change to the documents, None if there is none."""
+        ...
+
+    def scan(self, names: set[str] | None = None) -> dict[str, Signature]:
+        """Returns the signatures of the stored documents, or of the given ones that exist."""
+        ...
+
+    def read(self, names: list[str]) -> list[str | None]:
+        """Returns the content of documents, None for the ones that cannot be read."""
+        ...
+
+    def write(self, name: str, content: str) -> Signature:
+        """Stores a document atomically and returns its new signature."""
+        ...
+
+    def update(self, name: str, change: Callable[[str | None], str]) -> tuple[str, Signature]:
+        """Reads a document, None if it does not exist, and stores what change returns in its place.
+
+        No other process can write the document in between, so change can
+        check a precondition on the stored content and raise to abort.
+
+        Returns:
+            The stored content and its signature.
+        """
+        ...
+
+    def list_names(self, after: str = "", limit: int = 100, prefix: str = "") -> list[str]:
+        """Returns up to limit document names after a name in sorted order, optionally with a prefix."""
+        ...
+
+    def close(self) -> None:
+        """Releases the resources held by the storage."""
+        ...
+
+
+class FileStorage:
+    """Keeps every document in its own markdown/<name>.agents.md file below a root.
+
+    Signatures are the modification time, size and inode of the files, so a
+    scan only stats them.
+    """
+
+    read_batch_size = 32
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    @property
+    def location(self) -> Path:
+        """The library root."""
+        return self.root
+
+    @property
+    def markdown_dir(self) -> Path:
+        """The directory holding the AGENTS.md files."""
+        return self.root / MARKDOWN_DIR
+
+    def path_for(self, name: str) -> Path:
+        """Returns the path of the AGENTS.md file for a document name."""
+        return self.markdown_dir / f"{name}{AGENTS_SUFFIX}"
+
+    def exists(self) -> bool:
+        """Whether the library root is a directory."""
+        return self.root.is_dir()
+
+    def revision(self) -> None:
+        """Files can change without a trace outside the files, so every refresh stats them."""
+
+    def scan(self, names: set[str] | None = None) -> dict[str, FileSignature]:
+        """Stats the AGENTS.md files, all of them or those of the given names."""
+        found: dict[str, FileSignature] = {}
+        if names is not None:
+            for name in names:
+                with contextlib.suppress(OSError):
+                    found[name] = FileSignature.from_stat(self.path_for(name).stat())
+            return found
+        try:
+            with os.scandir(self.markdown_dir) as entries:
+                for entry in entries:
+                    name = document_name(entry.name)
+                    if name is None:
+                        continue
+                    try:
+                        if entry.is_file():
+                            found[name] = FileSignature.from_stat(entry.stat())
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return found
+
+    def read(self, names: list[str]) -> list[str | None]:
+        """Reads AGENTS.md files, returning None for the ones that cannot be read."""
+        contents: list[str | None] = []
+        for name in names:
+            path = self.path_for(name)
+            try:
+                contents.append(path.read_text(encoding="utf-8"))
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning("Error loading %s: %s", path, e)
+                contents.append(None)
+        return contents
+
+    def write(self, name: str, content: str) -> FileSignature:
+        """Writes an AGENTS.md file atomically."""
+        path = self.path_for(name)
+        with self._locked():
+            atomic_write_text(path, content)
+            return FileSignature.from_stat(path.stat())
+
+    def update(self, name: str, change: Callable[[str | None], str]) -> tuple[str, FileSignature]:
+        """Rewrites an AGENTS.md file under an exclusive lock on the library."""
+        path = self.path_for(name)
+        with self._locked():
+            try:
+                current: str | None = path.read_text(encoding="utf-8")
+            except FileNotFoundError:
+                current = None
+            content = change(current)
+            atomic_write_text(path, content)
+            return content, FileSignature.from_stat(path.stat())
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Holds the lock that every process writing to the library takes, see update."""
+        fd = os.open(self.root / LOCK_NAME, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def list_names(self, after: str = "", limit: int = 100, prefix: str = "") -> list[str]:
+        """Lists the directory and returns one page of the sorted names."""
+        names = sorted(n for n in self.scan() if n > after and n.startswith(prefix))
+        return names[:limit]
+
+    def close(self) -> None:
+        """Nothing to release."""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    content TEXT NOT NULL,
+    rev INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+-- Scans and listings read only this index, never the content pages
+CREATE INDEX IF NOT EXISTS documents_name_rev ON documents (name, rev, updated);
+CREATE TABLE IF NOT EXISTS revision (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL);
+INSERT OR IGNORE INTO revision VALUES (0, 0);
+-- Writes take the next revision themselves, deletes only bump it
+CREATE TRIGGER IF NOT EXISTS documents_revision_delete AFTER DELETE ON documents BEGIN
+    UPDATE revision SET value = value + 1;
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5 (
+    content, content = 'documents', content_rowid = 'id'
+);
+CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE OF content ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO documents_fts (rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+
+class SqliteStorage:
+    """Keeps the documents in one SQLite database in WAL mode.
+
+    Lookups by name use the unique index on the name, and scans and listings
+    only read the (name, rev, updated) index. Every write takes the next value of a
+    database-wide revision counter as the signature of the document, so
+    several servers sharing the database see each other's writes with a
+    scan. An FTS5 table over the content is kept in sync by triggers.
+
+    Every I/O thread uses its own connection. WAL mode lets them read while
+    another connection writes, but the database must be on a local file
+    system, not on a network share.
+    """
+
+    read_batch_size = SQLITE_BATCH_SIZE
+
+    def __init__(self, path: Path, busy_timeout: float = 5.0) -> None:
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        # executescript commits any open transaction, so the script brings its own
+        self._connection().executescript(f"BEGIN IMMEDIATE; {SCHEMA} COMMIT;")
+
+    @property
+    def location(self) -> Path:
+        """The database file."""
+        return self.path
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of the calling thread, opening it on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode = WAL")
+            # In WAL mode a commit survives a crash of the process, only a
+            # power loss can take back the last transactions
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs a block in a write transaction, taking the write lock up front."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def exists(self) -> bool:
+        """The database is created when it is opened."""
+        return True
+
+    def revision(self) -> int:
+        """Returns the revision counter, which every write and delete increments."""
+        (value,) = self._connection().execute("SELECT value FROM revision").fetchone()
+        return value
+
+    def scan(self, names: set[str] | None = None) -> dict[str, RowSignature]:
+        """Returns the revisions of all documents or of the given names."""
+        connection = self._connection()
+        if names is None:
+            rows = connection.execute("SELECT name, rev, updated FROM documents")
+            return {name: RowSignature(rev, updated) for name, rev, updated in rows}
+        found: dict[str, RowSignature] = {}
+        for batch in _batches(sorted(names)):
+            rows = connection.execute(
+                f"SELECT name, rev, updated FROM documents WHERE name IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            found.update((name, RowSignature(rev, updated)) for name, rev, updated in rows)
+        return found
+
+    def read(self, names: list[str]) -> list[str | None]:
+        """Returns the content of documents, None for the ones that do not exist."""
+        contents: dict[str, str] = {}
+        connection = self._connection()
+        for batch in _batches(names):
+            contents.update(
+                connection.execute(
+                    f"SELECT name, content FROM documents WHERE name IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+            )
+        return [contents.get(name) for name in names]
+
+    def write(self, name: str, content: str) -> RowSignature:
+        """Stores a document under the next revision."""
+        now = time.time()
+        with self._transaction() as connection:
+            rev = _store(connection, name, content, now)
+        return RowSignature(rev, now)
+
+    def update(self, name: str, change: Callable[[str | None], str]) -> tuple[str, RowSignature]:
+        """Reads and rewrites a document in one write transaction."""
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute("SELECT content FROM documents WHERE name = ?", (name,)).fetchone()
+            content = change(row[0] if row is not None else None)
+            rev = _store(connection, name, content, now)
+        return content, RowSignature(rev, now)
+
+    def write_many(self, documents: dict[str, str]) -> None:
+        """Stores many documents in one transaction, e.g. to import a library."""
+        now = time.time()
+        with self._transaction() as connection:
+            (start,) = connection.execute(
+                "UPDATE revision SET value = value + ? RETURNING value - ?", (len(documents), len(documents))
+            ).fetchone()
+            connection.executemany(
+                "INSERT INTO documents (name, content, rev, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET content = excluded.content, rev = excluded.rev, "
+                "updated = excluded.updated",
+                ((name, content, start + i, now) for i, (name, content) in enumerate(documents.items(), 1)),
+            )
+
+    def list_names(self, after: str = "", limit: int = 100, prefix: str = "") -> list[str]:
+        """Returns one page of the sorted names from the name index."""
+        # Names with the prefix sort between the prefix and the prefix followed
+        # by the highest code point, which keeps the lookup a range scan
+        rows = self._connection().execute(
+            "SELECT name FROM documents WHERE name > ? AND name >= ? AND name < ? ORDER BY name LIMIT ?",
+            (after, prefix, prefix + "\U0010ffff", limit),
+        )
+        return [name for (name,) in rows]
+
+    def search(self, terms: list[str], limit: int = 10) -> list[tuple[str, float]]:
+        """Returns the names and BM25 scores of the documents matching any of the terms, best first."""
+        if not terms or limit < 1:
+            return []
+        query = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = self._connection().execute(
+            "SELECT documents.name, -bm25(documents_fts) AS score FROM documents_fts "
+            "JOIN documents ON documents.id = documents_fts.rowid "
+            "WHERE documents_fts MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit),
+        )
+        return [(name, score) for name, score in rows]
+
+    def close(self) -> None:
+        """Closes the connections of all threads."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+
+def _batches(names: list[str]) -> Iterator[list[str]]:
+    for i in range(0, len(names), SQLITE_BATCH_SIZE):
+        yield names[i : i + SQLITE_BATCH_SIZE]
+
+
+def _store(connection: sqlite3.Connection, name: str, content: str, now: float) -> int:
+    """Stores a document under the next revision inside a write transaction and returns the revision."""
+    (rev,) = connection.execute("UPDATE revision SET value = value + 1 RETURNING value").fetchone()
+    connection.execute(
+        "INSERT INTO documents (name, content, rev, updated) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET content = excluded.content, rev = excluded.rev, "
+        "updated = excluded.updated",
+        (name, content, rev, now),
+    )
+    return rev
+
+
+def atomic_write_text(path: Path, content: str) -> None:
+    """Writes a text file through a temporary file and os.replace.
+
+    Readers either see the old or the new content, never a partial write.
+    The permissions of an existing file are kept.
+    """
+    atomic_write_bytes(path, content.encode("utf-8"))
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Writes a file through a temporary file and os.replace, see atomic_write_text."""
+    try:
+        mode = stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_name)
+        raise
+
+
+def import_files(root: Path, database: Path) -> int:
+    """Copies the AGENTS.md files of a library into a SQLite database.
+
+    Returns:
+        The number of documents imported.
+    """
+    files = FileStorage(root)
+    names = sorted(files.scan())
+    storage = SqliteStorage(database)
+    try:
+        documents = {n: c for n, c in zip(names, files.read(names), strict=True) if c is not None}
+        storage.write_many(documents)
+    finally:
+        storage.close()
+    return len(documents)
+
+
+def main() -> None:
+    """Imports a library into a SQLite database from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", type=Path, help="The agents library root.")
+    parser.add_argument("-o", "--output", type=Path, help=f"Database file, defaults to <root>/{DATABASE_NAME}.")
+    args = parser.parse_args()
+    output = args.output or args.root / DATABASE_NAME
+    count = import_files(args.root, output)
+    print(f"Imported {count} documents into {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import difflib
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from app.cache import document_digest
+from app.library import ChangeSet
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+NO_NEWLINE = "\\ No newline at end of file"
+
+
+class PatchError(ValueError):
+    """Raised when a patch is malformed or does not apply to the document."""
+
+
+class ConflictError(Exception):
+    """Raised when the stored document is no longer the one an update was made against."""
+
+    def __init__(self, name: str, etag: str | None) -> None:
+        super().__init__(f"{name!r} is at {etag or 'no version'}.")
+        self.name = name
+        self.etag = etag
+
+
+@dataclass(slots=True)
+class DocumentVersion:
+    """One version of a document.
+
+    The content is the string held by the documents dict at the time, so
+    keeping a version costs no copy. The hash is computed on first use.
+    """
+
+    version: int
+    content: str
+    updated: float
+    _digest: str | None = None
+
+    @property
+    def digest(self) -> str:
+        """The SHA-256 hex digest of the content, which is also its ETag."""
+        if self._digest is None:
+            self._digest = document_digest(self.content)
+        return self._digest
+
+    @property
+    def etag(self) -> str:
+        """The digest as a quoted entity tag."""
+        return f'"{self.digest}"'
+
+    def to_dict(self) -> dict:
+        """Describes the version without its content."""
+        return {"version": self.version, "etag": self.etag, "updated": self.updated}
+
+
+class VersionStore:
+    """Numbers the versions of every document and keeps the last few in memory.
+
+    Every change set from the library gives each added or changed document
+    the next version, whether it came from update_agents_file, a watcher or
+    another worker. Versions keep counting after a document is removed, so a
+    recreated document never reuses a version. Each document keeps its last
+    history versions in a ring, which serves diffs between versions and maps
+    the version an update was made against to its content hash. Version
+    numbers are counted by each process, the hash is what the storage checks.
+    """
+
+    def __init__(self, documents: dict[str, str], history: int = 16) -> None:
+        if history < 1:
+            raise ValueError("history must be at least 1.")
+        self.documents = documents
+        self.history = history
+        self._rings: dict[str, deque[DocumentVersion]] = {}
+        self._counters: dict[str, int] = {}
+
+    def apply(self, changes: ChangeSet) -> None:
+        """Records a new version of the added and changed documents."""
+        now = time.time()
+        for name in changes.removed:
+            self._rings.pop(name, None)
+        for name in (*changes.added, *changes.changed):
+            version = self._counters.get(name, 0) + 1
+            self._counters[name] = version
+            ring = self._rings.get(name)
+            if ring is None:
+                ring = self._rings[name] = deque(maxlen=self.history)
+            ring.append(DocumentVersion(version, self.documents[name], now))
+
+    def current(self, name: str) -> DocumentVersion | None:
+        """Returns the current version of a document, or None if it does not exist."""
+        ring = self._rings.get(name)
+        return ring[-1] if ring else None
+
+    def get(self, name: str, version: int) -> DocumentVersion | None:
+        """Returns a version of a document, or None if it is no longer in the history."""
+        for entry in reversed(self._rings.get(name, ())):
+            if entry.version == version:
+                return entry
+        return None
+
+    def versions(self, name: str) -> list[DocumentVersion]:
+        """Returns the versions of a document in the history, oldest first."""
+        return list(self._rings.get(name, ()))
+
+
+def check_etag(name: str, content: str | None, expected: str | None) -> None:
+    """Checks that a stored document has the expected hash, None meaning it must not exist.
+
+    Raises:
+        ConflictError: If it does not.
+    """
+    digest = document_digest(content) if content is not None else None
+    if digest != expected:
+        raise ConflictError(name, f'"{digest}"' if digest is not None else None)
+
+
+def make_patch(old: str, new: str, old_label: str = "a", new_label: str = "b") -> str:
+    """Returns a unified diff that turns old into new."""
+    lines = []
+    for line in difflib.unified_diff(
+        old.splitlines(keepends=True), new.splitlines(keepends=True), fromfile=old_label, tofile=new_label
+    ):
+        lines.append(line)
+        if not line.endswith("\n"):
+            lines.append(f"\n{NO_NEWLINE}\n")
+    return "".join(lines)
+
+
+def apply_patch(content: str, patch: str) -> str:
+    """Applies a unified diff to a document.
+
+    Every hunk must match the document exactly at the line numbers of its
+    header, fuzzy matching is not attempted.
+
+    Raises:
+        PatchError: If the patch is malformed or a hunk does not match.
+    """
+    lines = content.splitlines(keepends=True)
+    output: list[str] = []
+    position = 0
+    for start, old, new in _parse_hunks(patch):
+        if start < position:
+            raise PatchError(f"Hunk at line {start + 1} overlaps the previous hunk.")
+        if lines[start : start + len(old)] != old:
+            raise PatchError(f"Hunk at line {start + 1} does not match the document.")
+        output.extend(lines[position:start])
+        output.extend(new)
+        position = start + len(old)
+    output.extend(lines[position:])
+    return "".join(output)
+
+
+def _parse_hunks(patch: str) -> list[tuple[int, list[str], list[str]]]:
+    """Returns the 0-based start, old lines and new lines of every hunk of a patch."""
+    hunks = []
+    lines = patch.splitlines(keepends=True)
+    i = 0
+    while i < len(lines):
+        match = HUNK_HEADER.match(lines[i])
+        i += 1
+        if match is None:
+            # File headers and anything else between hunks
+            continue
+        old_start, old_count, _, new_count = (int(g) if g is not None else 1 for g in match.groups())
+        old: list[str] = []
+        new: list[str] = []
+        previous = ""
+        while i < len(lines) and (len(old) < old_count or len(new) < new_count or lines[i].startswith("\\")):
+            line = lines[i]
+            i += 1
+            tag, text = line[:1], line[1:]
+            if tag == "\\":
+                if previous in ("", "\\"):
+                    raise PatchError("No newline marker without a line before it.")
+                # The previous line has no newline at the end of the file
+                targets = (old, new) if previous == " " else (old,) if previous == "-" else (new,)
+                for target in targets:
+                    target[-1] = target[-1].removesuffix("\n")
+            elif tag in (" ", "\n"):
+                text = text if tag == " " else "\n"
+                old.append(text)
+                new.append(text)
+            elif tag == "-":
+                old.append(text)
+            elif tag == "+":
+                new.append(text)
+            else:
+                raise PatchError(f"Unexpected line in hunk: {line.rstrip()!r}.")
+            previous = tag if tag != "\n" else " "
+        if len(old) != old_count or len(new) != new_count:
+            raise PatchError("Hunk is shorter than its header says.")
+        # A hunk that only adds lines names the line after which they go
+        hunks.append((old_start if old_count == 0 else old_start - 1, old, new))
+    if not hunks:
+        raise PatchError("The patch has no hunks.")
+    return hunks
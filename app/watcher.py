@@ -0,0 +1,273 @@
+import asyncio
+import contextlib
+import ctypes
+import ctypes.util
+import functools
+import logging
+import os
+import struct
+import sys
+from typing import Any, Protocol
+
+from app.library import AgentsLibrary
+from app.storage import document_name
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+RESCAN_MASK = IN_Q_OVERFLOW | IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Refreshable(Protocol):
+    """Anything kept in sync with files by stat-only scans, e.g. the library or the scripts."""
+
+    async def refresh(self) -> Any:
+        """Picks up the changes on disk."""
+        ...
+
+
+class PollingWatcher:
+    """Periodically refreshes the agents library, or its scripts, from a stat-only scan."""
+
+    mode = "polling"
+
+    def __init__(self, library: Refreshable, poll_interval: float = 2.0) -> None:
+        self.library = library
+        self.poll_interval = poll_interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Starts watching in the background."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops watching."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.library.refresh()
+            except Exception:
+                logger.exception("Error refreshing agents library")
+
+
+class InotifyWatcher:
+    """Refreshes only the documents that inotify reports as touched.
+
+    Events are collected for a short debounce window so that an editor's
+    write, rename and chmod on one file collapse into a single refresh.
+
+    The kernel drops the watch when the markdown directory is deleted or
+    replaced, so the watch is then added again to whatever directory is at
+    the path, retrying every retry_interval seconds until one exists. Every
+    new watch is followed by a full refresh, which picks up the files that
+    were written while nothing was watched.
+    """
+
+    mode = "inotify"
+
+    def __init__(self, library: AgentsLibrary, debounce: float = 0.05, retry_interval: float = 2.0) -> None:
+        self.library = library
+        self.debounce = debounce
+        self.retry_interval = retry_interval
+        self._libc = _load_libc()
+        self._fd = -1
+        self._wd = -1
+        self._retry_handle: asyncio.TimerHandle | None = None
+        self._pending: set[str] = set()
+        self._rescan = False
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._refreshing: set[asyncio.Task] = set()
+
+    @staticmethod
+    def available() -> bool:
+        """Whether inotify can be used on this platform."""
+        return sys.platform.startswith("linux") and _load_libc() is not None
+
+    def start(self) -> None:
+        """Starts watching the markdown directory of the library."""
+        if self._libc is None:
+            raise OSError("inotify is not available on this platform.")
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        try:
+            self._watch()
+        except OSError:
+            os.close(fd)
+            self._fd = -1
+            raise
+        asyncio.get_running_loop().add_reader(fd, self._on_readable)
+
+    async def stop(self) -> None:
+        """Stops watching and waits for a refresh that is already running."""
+        if self._fd >= 0:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+            self._wd = -1
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+            self._retry_handle = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._refreshing:
+            await asyncio.gather(*self._refreshing, return_exceptions=True)
+
+    def _on_readable(self) -> None:
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            raw_name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._rescan = True
+                continue
+            if wd != self._wd:
+                # Left over from a watch that was dropped
+                continue
+            if mask & RESCAN_MASK:
+                self._unwatch(moved=bool(mask & IN_MOVE_SELF))
+                self._rescan = True
+                continue
+            name = document_name(os.fsdecode(raw_name))
+            if name is not None:
+                self._pending.add(name)
+        if (self._pending or self._rescan) and self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.debounce, self._flush)
+
+    def _watch(self) -> None:
+        """Watches the directory that is now at the markdown directory path."""
+        path = os.fsencode(self.library.markdown_dir)
+        wd = self._libc.inotify_add_watch(self._fd, path, WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {self.library.markdown_dir}")
+        self._wd = wd
+
+    def _unwatch(self, moved: bool) -> None:
+        """Forgets the watch of a directory that was deleted or moved away."""
+        if moved:
+            # A moved directory keeps its watch, which would follow it to the new path
+            self._libc.inotify_rm_watch(self._fd, self._wd)
+        self._wd = -1
+        logger.info(
+            "Agents library directory %s was deleted or moved, watching its path again", self.library.markdown_dir
+        )
+
+    def _rewatch(self) -> bool:
+        """Adds the watch again, or retries later while no directory exists at the path."""
+        try:
+            self._watch()
+        except OSError:
+            self._retry_handle = asyncio.get_running_loop().call_later(self.retry_interval, self._retry)
+            return False
+        return True
+
+    def _retry(self) -> None:
+        self._retry_handle = None
+        if self._rewatch():
+            self._rescan = True
+            if self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.debounce, self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        if self._wd < 0 and self._retry_handle is None:
+            self._rewatch()
+        names = None if self._rescan else set(self._pending)
+        self._pending.clear()
+        self._rescan = False
+        task = asyncio.create_task(self._refresh(names))
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+
+    async def _refresh(self, names: set[str] | None) -> None:
+        try:
+            await self.library.refresh(names)
+        except Exception:
+            logger.exception("Error refreshing agents library")
+
+
+@functools.cache
+def _load_libc() -> ctypes.CDLL | None:
+    """Loads libc if it exposes the inotify syscalls."""
+    name = ctypes.util.find_library("c")
+    if name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+def create_watcher(
+    library: AgentsLibrary, mode: str = "auto", poll_interval: float = 2.0
+) -> InotifyWatcher | PollingWatcher:
+    """Creates and starts a watcher for the agents library.
+
+    Args:
+        library: The library to keep up to date.
+        mode: One of "auto", "inotify" or "polling". "auto" uses inotify when
+            it is available and falls back to polling otherwise. Libraries
+            that are not stored in files are always polled.
+        poll_interval: Seconds between scans in polling mode.
+    """
+    if library.markdown_dir is None:
+        mode = "polling"
+    if mode in ("auto", "inotify") and InotifyWatcher.available():
+        watcher = InotifyWatcher(library, retry_interval=poll_interval)
+        try:
+            watcher.start()
+            return watcher
+        except OSError as e:
+            if mode == "inotify":
+                raise
+            logger.warning("Falling back to polling the agents library: %s", e)
+    elif mode == "inotify":
+        raise OSError("inotify is not available on this platform.")
+
+    polling = PollingWatcher(library, poll_interval=poll_interval)
+    polling.start()
+    return polling
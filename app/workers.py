@@ -0,0 +1,210 @@
+import asyncio
+import contextlib
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from app.metrics import SCRIPT_EXIT, SCRIPT_SPAWN
+from app.scripts import DEFAULT_MAX_OUTPUT, OutputCallback, ScriptResult
+
+# The bash side of a worker. It reads NUL separated requests of the form
+# "<id>\0<script path>\0<argc>\0<arg>\0..." from stdin, runs the script as a
+# function in a subshell with its output redirected to files in the worker
+# directory and replies with "<id> <status>\n" once the run is over. Every
+# script is read and turned into a function once, and again when it is newer
+# than its marker file in the worker directory.
+WORKER_SOURCE = r"""
+set +o errexit +o nounset +o pipefail
+declare -A __mcp_functions=()
+__mcp_count=0
+
+__mcp_load() {
+  local name="__mcp_script_$((++__mcp_count))" body
+  : >"$MCP_WORKER_DIR/$name" || return 1
+  body=$(<"$1") || return 1
+  eval "$name() {
+$body
+}" || return 1
+  __mcp_functions[$1]=$name
+}
+
+while IFS= read -r -d '' __mcp_id && IFS= read -r -d '' __mcp_path && IFS= read -r -d '' __mcp_argc; do
+  __mcp_args=()
+  for ((__mcp_i = 0; __mcp_i < __mcp_argc; __mcp_i++)); do
+    IFS= read -r -d '' __mcp_arg
+    __mcp_args+=("$__mcp_arg")
+  done
+  __mcp_function=${__mcp_functions[$__mcp_path]-}
+  if [[ -z $__mcp_function || $__mcp_path -nt $MCP_WORKER_DIR/$__mcp_function ]]; then
+    if ! __mcp_load "$__mcp_path" >"$MCP_WORKER_DIR/stdout" 2>"$MCP_WORKER_DIR/stderr"; then
+      printf '%s 127\n' "$__mcp_id"
+      continue
+    fi
+    __mcp_function=${__mcp_functions[$__mcp_path]}
+  fi
+  # The output files, like any file the script writes, stop growing at the
+  # output limit; writes beyond it fail instead of killing the script
+  (ulimit -f "$MCP_MAX_OUTPUT_BLOCKS"; trap '' XFSZ; BASH_ARGV0=$__mcp_path; "$__mcp_function" "${__mcp_args[@]}") \
+    </dev/null >"$MCP_WORKER_DIR/stdout" 2>"$MCP_WORKER_DIR/stderr"
+  printf '%s %d\n' "$__mcp_id" "$?"
+done
+"""
+
+
+class BashWorker:
+    """A long-lived bash process that runs scripts sent over its stdin."""
+
+    def __init__(self, process: asyncio.subprocess.Process, directory: str, max_output: int) -> None:
+        self.process = process
+        self.directory = directory
+        self.max_output = max_output
+        self.runs = 0
+        self._broken = False
+
+    @classmethod
+    async def spawn(cls, max_output: int = DEFAULT_MAX_OUTPUT) -> "BashWorker":
+        """Starts a new worker in its own process group."""
+        start = time.perf_counter()
+        directory = tempfile.mkdtemp(prefix="mcp-worker-")
+        process = await asyncio.create_subprocess_exec(
+            "bash",
+            "--noprofile",
+            "--norc",
+            "-c",
+            WORKER_SOURCE,
+            "mcp-worker",
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env={**os.environ, "MCP_WORKER_DIR": directory, "MCP_MAX_OUTPUT_BLOCKS": str(max_output // 1024 + 1)},
+            start_new_session=True,
+        )
+        SCRIPT_SPAWN.observe(time.perf_counter() - start)
+        return cls(process, directory, max_output)
+
+    @property
+    def alive(self) -> bool:
+        """Whether the worker can take another request."""
+        return not self._broken and self.process.returncode is None
+
+    async def run(self, script_path: Path, args: list[str], script_timeout: float) -> ScriptResult:
+        """Runs a script in the worker.
+
+        Raises:
+            TimeoutError: If the script did not finish in time. The worker is
+                killed together with everything the script started.
+        """
+        self.runs += 1
+        request_id = str(self.runs)
+        fields = [request_id, str(script_path), str(len(args)), *args]
+        if any("\0" in field for field in fields):
+            raise ValueError("Script arguments must not contain NUL characters.")
+        try:
+            self.process.stdin.write(b"".join(os.fsencode(field) + b"\0" for field in fields))
+            await self.process.stdin.drain()
+            return await asyncio.wait_for(self._read_reply(request_id), timeout=script_timeout)
+        except TimeoutError:
+            await self.kill()
+            raise
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            # The worker died while running the script
+            await self.kill()
+            return ScriptResult(1, b"", b"Script worker exited unexpectedly.")
+        except BaseException:
+            # Cancelled half way through a request, the stream is out of sync
+            await self.kill()
+            raise
+
+    async def _read_reply(self, request_id: str) -> ScriptResult:
+        header = await self.process.stdout.readuntil(b"\n")
+        reply_id, status = header.decode().split()
+        if reply_id != request_id:
+            raise ValueError(f"Out of sync reply {reply_id} for request {request_id}.")
+        (stdout, stdout_truncated), (stderr, stderr_truncated) = await asyncio.to_thread(
+            lambda: (self._read_output("stdout"), self._read_output("stderr"))
+        )
+        return ScriptResult(int(status), stdout, stderr, stdout_truncated or stderr_truncated)
+
+    def _read_output(self, name: str) -> tuple[bytes, bool]:
+        """Reads at most max_output bytes of a captured output file."""
+        with open(os.path.join(self.directory, name), "rb") as f:
+            output = f.read(self.max_output)
+            return output, bool(f.read(1))
+
+    async def kill(self) -> None:
+        """Kills the worker and the processes started by its scripts."""
+        self._broken = True
+        if self.process.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(self.process.pid, signal.SIGKILL)
+            await self.process.wait()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    async def close(self, grace: float = 1.0) -> None:
+        """Lets the worker exit after its current request, killing it if it does not."""
+        if self.process.returncode is None:
+            self.process.stdin.close()
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self.process.wait(), timeout=grace)
+        await self.kill()
+
+
+class BashWorkerPool:
+    """Runs scripts on a pool of long-lived bash workers instead of forking bash per call.
+
+    Each script is read and defined as a bash function once per worker, and
+    every run executes that function in a subshell of the worker, which saves
+    the exec and the bash startup of a fresh process. Workers are replaced
+    after max_runs runs, when they crash and when a script times out.
+    """
+
+    def __init__(self, size: int = 4, max_runs: int = 100, max_output: int = DEFAULT_MAX_OUTPUT) -> None:
+        self.size = size
+        self.max_runs = max_runs
+        self.max_output = max_output
+        self._idle: list[BashWorker] = []
+        self._busy: set[BashWorker] = set()
+        self._slots = asyncio.Semaphore(size)
+
+    async def start(self) -> None:
+        """Spawns the workers up front so the first runs do not pay for it."""
+        workers = await asyncio.gather(*(BashWorker.spawn(self.max_output) for _ in range(self.size - len(self._idle))))
+        self._idle.extend(workers)
+
+    async def run(
+        self,
+        script_path: Path,
+        args: list[str],
+        script_timeout: float,
+        *,
+        on_output: OutputCallback | None = None,
+    ) -> ScriptResult:
+        """Runs a script on an idle worker, waiting for one if all are busy.
+
+        Workers capture output in files, so on_output receives all of stdout
+        in one chunk once the script has finished.
+        """
+        async with self._slots:
+            worker = self._idle.pop() if self._idle else await BashWorker.spawn(self.max_output)
+            start = time.perf_counter()
+            self._busy.add(worker)
+            try:
+                result = await worker.run(script_path, args, script_timeout)
+            finally:
+                self._busy.discard(worker)
+                SCRIPT_EXIT.observe(time.perf_counter() - start, script_path.stem)
+                if worker.alive and worker.runs < self.max_runs:
+                    self._idle.append(worker)
+                else:
+                    await worker.close()
+        if on_output is not None and result.stdout:
+            await on_output(result.stdout)
+        return result
+
+    async def close(self) -> None:
+        """Shuts down the idle workers and kills the busy ones with their scripts."""
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(worker.close() for worker in idle), *(worker.kill() for worker in list(self._busy)))
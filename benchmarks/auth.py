@@ -0,0 +1,103 @@
+"""Measures the per-request cost of bearer token authentication.
+
+Usage:
+    python -m benchmarks.auth --requests 20000
+
+A stand-in issuer signs tokens and serves its keys in process. For RS256 and
+ES256 the benchmark reports the time of a full signature and claims check, as
+paid by the first request with a token, and of a request whose token is
+already in the cache of verified tokens. It also times an ASGI call through
+the authentication middleware against the same call without it.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any
+
+import httpx
+from authlib.jose import JsonWebKey, JsonWebToken
+
+from app.auth import BearerAuthMiddleware, JwksCache, TokenValidator
+
+ISSUER = "https://issuer.test"
+KEY_TYPES = {"RS256": ("RSA", 2048), "ES256": ("EC", "P-256")}
+
+
+def stand_in_issuer(algorithm: str) -> tuple[Any, httpx.MockTransport]:
+    """Returns a signing key and a transport that serves its public half as a JWKS."""
+    key_type, size = KEY_TYPES[algorithm]
+    key = JsonWebKey.generate_key(key_type, size, is_private=True, options={"kid": algorithm})
+    jwks = {"keys": [key.as_dict(is_private=False)]}
+    return key, httpx.MockTransport(lambda _: httpx.Response(200, json=jwks))
+
+
+def sign(key: Any, algorithm: str, subject: str) -> str:
+    """Signs a token that is valid for an hour."""
+    now = int(time.time())
+    claims = {"iss": ISSUER, "aud": "bench", "sub": subject, "iat": now, "exp": now + 3600}
+    return JsonWebToken([algorithm]).encode({"alg": algorithm, "kid": key.kid}, claims, key).decode()
+
+
+async def ok_app(_scope: dict, _receive: Any, send: Any) -> None:
+    """Answers every request with an empty 200."""
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def time_calls(app: Any, token: str, requests: int) -> float:
+    """Returns the seconds of one ASGI call of app, averaged over requests calls."""
+    scope = {"type": "http", "path": "/test/call_tool", "headers": [(b"authorization", f"Bearer {token}".encode())]}
+
+    async def _send(_message: dict) -> None:
+        return None
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), None, _send)
+    return (time.perf_counter() - start) / requests
+
+
+async def run(algorithm: str, requests: int) -> None:
+    """Prints the timings of one signing algorithm."""
+    key, transport = stand_in_issuer(algorithm)
+    validator = TokenValidator(
+        JwksCache(jwks_url=f"{ISSUER}/jwks", transport=transport),
+        issuer=ISSUER,
+        audience="bench",
+        algorithms=[algorithm],
+        max_entries=requests,
+    )
+    await validator.validate(sign(key, algorithm, "warm-up"))
+    # Distinct tokens, so every one of them is verified in full
+    tokens = [sign(key, algorithm, f"user-{i}") for i in range(min(requests, 2000))]
+    start = time.perf_counter()
+    for token in tokens:
+        await validator.validate(token)
+    verified = (time.perf_counter() - start) / len(tokens)
+    start = time.perf_counter()
+    for i in range(requests):
+        await validator.validate(tokens[i % len(tokens)])
+    cached = (time.perf_counter() - start) / requests
+
+    middleware = BearerAuthMiddleware(ok_app, validator=validator, paths=["/test/call_tool"])
+    plain = await time_calls(ok_app, tokens[0], requests)
+    authenticated = await time_calls(middleware, tokens[0], requests)
+    print(
+        f"{algorithm:>9} {verified * 1e6:>10.1f}us {cached * 1e6:>8.2f}us "
+        f"{plain * 1e6:>8.2f}us {authenticated * 1e6:>8.2f}us {(authenticated - plain) * 1e6:>+9.2f}us"
+    )
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000, help="Calls per measurement.")
+    args = parser.parse_args()
+    print(f"{'algorithm':>9} {'verify':>12} {'cached':>10} {'no auth':>10} {'auth':>10} {'overhead':>11}")
+    for algorithm in KEY_TYPES:
+        asyncio.run(run(algorithm, args.requests))
+
+
+if __name__ == "__main__":
+    main()
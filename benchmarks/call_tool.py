@@ -0,0 +1,99 @@
+"""Measures latency and allocations of /test/call_tool on multi-megabyte documents.
+
+Usage:
+    python -m benchmarks.call_tool --sizes 1048576 4194304 16777216
+
+Runs the app in process behind an ASGI transport and fetches one document of
+each size with get_agents_instructions, in the json and in the markdown
+format. The previous handler, which parsed the JSON text of the tool result
+and serialized it again, is timed on the same result for comparison. Peak
+allocations are the tracemalloc peak while serving one request.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import httpx
+from fastapi.responses import JSONResponse
+
+from app.cache import document_digest, encode_document
+from app.server import create_app
+from benchmarks.synthetic import DocumentGenerator
+
+
+async def measure(call: Callable[[], Awaitable[None]], repeat: int) -> tuple[float, float]:
+    """Returns the median milliseconds of call and the peak MiB allocated during one call."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    await call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak / 2**20
+
+
+async def run(sizes: list[int], repeat: int) -> None:
+    """Prints the timings of every size and format."""
+    generator = DocumentGenerator()
+    with tempfile.TemporaryDirectory(prefix="agents-call-tool-") as tmp:
+        root = Path(tmp)
+        (root / "markdown").mkdir()
+        documents = {f"doc_{size}": generator.document(0, size) for size in sizes}
+        for name, content in documents.items():
+            (root / "markdown" / f"{name}.agents.md").write_text(content, encoding="utf-8")
+        os.environ["AGENTS_LIBRARY_PATH"] = str(root)
+        app = create_app()
+        transport = httpx.ASGITransport(app=app)
+        async with (
+            app.router.lifespan_context(app),
+            httpx.AsyncClient(transport=transport, base_url="http://x") as client,
+        ):
+            print(f"{'size':>10} {'format':>16} {'median ms':>10} {'peak MiB':>9}")
+            for name, content in documents.items():
+                for response_format in ("json", "markdown"):
+                    request = {
+                        "tool_name": "get_agents_instructions",
+                        "args": {"name": name},
+                        "format": response_format,
+                    }
+
+                    async def _call(request: dict = request) -> None:
+                        (await client.post("/test/call_tool", json={"tool_call_request": request})).raise_for_status()
+
+                    median, peak = await measure(_call, repeat)
+                    print(f"{len(content):>10} {response_format:>16} {median:>10.2f} {peak:>9.1f}")
+
+                # What the previous handler did on top of the tool call
+                text = encode_document(content, document_digest(content))
+
+                async def _reparse(text: str = text) -> None:
+                    JSONResponse({"type": "json", "content": json.loads(text)}).render(None)
+
+                median, peak = await measure(_reparse, repeat)
+                print(f"{len(content):>10} {'previous (extra)':>16} {median:>10.2f} {peak:>9.1f}")
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[2**20, 4 * 2**20, 16 * 2**20], help="Document sizes in bytes."
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="Requests per measurement.")
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
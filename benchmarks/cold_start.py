@@ -0,0 +1,82 @@
+"""Measures how long it takes to load an agents library from disk.
+
+Usage:
+    python -m benchmarks.cold_start --files 10000 --workers 1 4 8 16 --snapshot
+
+A local disk with a warm page cache hides the benefit of concurrent reads, use
+--latency-ms to add a per-file delay that mimics an NFS or container volume.
+--snapshot also loads the library from a snapshot built with app.snapshot.
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from app.library import AgentsLibrary
+from app.snapshot import Snapshot, build
+from benchmarks.synthetic import write_library
+
+
+async def time_load(root: Path, workers: int, snapshot_path: Path | None = None) -> tuple[float, int]:
+    """Loads the library with a fresh AgentsLibrary and returns the elapsed time."""
+    documents: dict[str, str] = {}
+    # Refresh directly rather than through load() to keep per-file logging out of the timing
+    library = AgentsLibrary(documents, root=root, io_workers=workers)
+    start = time.perf_counter()
+    snapshot = Snapshot.open(snapshot_path) if snapshot_path is not None else None
+    await library.refresh(preloaded=snapshot.entries if snapshot is not None else None)
+    elapsed = time.perf_counter() - start
+    library.close()
+    return elapsed, len(documents)
+
+
+def add_read_latency(latency: float) -> None:
+    """Makes every Path.read_text call sleep first to simulate a slow volume."""
+    read_text = Path.read_text
+
+    def _slow_read_text(self: Path, *args: Any, **kwargs: Any) -> str:
+        time.sleep(latency)
+        return read_text(self, *args, **kwargs)
+
+    Path.read_text = _slow_read_text
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10_000, help="Number of AGENTS.md files to generate.")
+    parser.add_argument("--size", type=int, default=4096, help="Size of each file in bytes.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16], help="I/O pool sizes to compare.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per pool size, the best one is reported.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency of every file read.")
+    parser.add_argument("--snapshot", action="store_true", help="Also load the library from a snapshot.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="agents-bench-") as tmp:
+        root = Path(tmp)
+        write_library(root, args.files, args.size)
+        if args.latency_ms:
+            add_read_latency(args.latency_ms / 1000)
+        print(f"Loading {args.files} files of {args.size} bytes ({args.latency_ms} ms simulated latency)")
+        snapshot_path = None
+        if args.snapshot:
+            snapshot_path = root / "agents.snapshot"
+            build(root, snapshot_path)
+        print(f"{'source':>8} {'workers':>8} {'best (s)':>10} {'files/s':>10}")
+        for source, path in (("files", None), ("snapshot", snapshot_path)):
+            if source == "snapshot" and path is None:
+                continue
+            for workers in args.workers:
+                best = float("inf")
+                for _ in range(args.repeat):
+                    elapsed, loaded = asyncio.run(time_load(root, workers, path))
+                    assert loaded == args.files, f"loaded {loaded} of {args.files} files"
+                    best = min(best, elapsed)
+                print(f"{source:>8} {workers:>8} {best:>10.3f} {args.files / best:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Measures bytes on the wire and CPU cost of the response compression.
+
+Usage:
+    python -m benchmarks.compression --sizes 4096 65536 524288
+
+For every document size and coding it reports the compressed size of the
+get_agents_instructions payload, the CPU time to compress it on every request
+as the middleware does, and the time to look up the variant cached with the
+document as the /agents endpoint does. Bodies from 64 KiB on are compressed on
+a worker thread, so their cost moves off the event loop but not off the CPU.
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+
+from app.cache import DocumentCache
+from app.compression import CODECS, DEFAULT_LEVELS
+from benchmarks.synthetic import DocumentGenerator
+
+
+def cpu_time_per_call(repeat: int, func: Callable[..., object], *args: object) -> float:
+    """Returns the CPU seconds of one call of func, averaged over repeat calls."""
+    start = time.process_time()
+    for _ in range(repeat):
+        func(*args)
+    return (time.process_time() - start) / repeat
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4096, 65536, 524288], help="Document sizes in bytes.")
+    parser.add_argument("--repeat", type=int, default=50, help="Compressions per measurement.")
+    args = parser.parse_args()
+
+    generator = DocumentGenerator()
+    print(f"Codings: {', '.join(sorted(CODECS))}")
+    print(f"{'size':>8} {'coding':>8} {'level':>6} {'wire bytes':>11} {'ratio':>6} {'per request':>12} {'cached':>9}")
+    for size in args.sizes:
+        documents = {"doc": generator.document(0, size)}
+        entry = DocumentCache(documents).get("doc")
+        body = bytes(entry.body)
+        print(f"{len(body):>8} {'identity':>8} {'-':>6} {len(body):>11} {1:>6.2f} {'-':>12} {'-':>9}")
+        for name, codec in sorted(CODECS.items()):
+            level = DEFAULT_LEVELS[name]
+            compressed = codec.compress(body, level)
+            per_request = cpu_time_per_call(args.repeat, codec.compress, body, level)
+            entry.variants[name] = compressed
+            cached = cpu_time_per_call(args.repeat * 100, entry.variants.get, name)
+            print(
+                f"{len(body):>8} {name:>8} {level:>6} {len(compressed):>11} {len(body) / len(compressed):>6.2f} "
+                f"{per_request * 1e6:>10.0f}us {cached * 1e6:>7.2f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Load tests the server with one and several uvicorn workers.
+
+Usage:
+    python -m benchmarks.load --workers 1 2 4 --clients 8 --duration 10
+
+Every run starts the server on a synthetic library, checks that an update made
+through one connection is visible on every other connection and then measures
+the throughput of search_agents_instructions calls from several client
+processes. Throughput can only scale up to the number of CPU cores.
+"""
+
+import argparse
+import http
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import write_library
+
+# Document the consistency check updates, named like benchmarks.synthetic does
+DOCUMENT = "doc_000000"
+SEARCH = {"tool_name": "search_agents_instructions", "args": {"query": "deploy service", "limit": 5}}
+
+
+def free_port() -> int:
+    """Returns a TCP port that is free right now."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(connection: http.client.HTTPConnection, method: str, path: str, body: dict | None = None) -> bytes:
+    """Sends one request over a keep-alive connection and returns the body."""
+    payload = json.dumps(body).encode() if body is not None else None
+    connection.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    data = response.read()
+    if response.status != http.HTTPStatus.OK:
+        raise RuntimeError(f"{method} {path} returned {response.status}: {data[:200]!r}")
+    return data
+
+
+def start_server(
+    root: Path, state_dir: Path, port: int, workers: int, env: dict[str, str] | None = None
+) -> subprocess.Popen:
+    """Starts the server with the given number of workers and waits until it answers.
+
+    Settings in env override the configuration, see load_config.
+    """
+    env = {
+        **os.environ,
+        "AGENTS_LIBRARY_PATH": str(root),
+        "SERVER_AGENTS_LIBRARY_PATH": str(root),
+        "SERVER_PORT": str(port),
+        "SERVER_WORKERS": str(workers),
+        "SERVER_SHARED_STATE_DIR": str(state_dir),
+        "LOGGING_LEVEL": "WARNING",
+        **(env or {}),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.main"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            request(http.client.HTTPConnection("127.0.0.1", port, timeout=1), "GET", "/health")
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("Server did not start")
+
+
+def check_consistency(port: int, connections: int) -> None:
+    """Updates a document through one connection and reads it back through many."""
+    content = f"## Updated at {time.time()}"
+    writer = http.client.HTTPConnection("127.0.0.1", port)
+    update = {"tool_name": "update_agents_file", "args": {"file_name": f"{DOCUMENT}.agents.md", "new_content": content}}
+    request(writer, "POST", "/test/call_tool", {"tool_call_request": update})
+    for _ in range(connections):
+        reader = http.client.HTTPConnection("127.0.0.1", port)
+        payload = json.loads(request(reader, "GET", f"/agents/{DOCUMENT}"))
+        if payload["content"] != content:
+            raise RuntimeError("A worker served a stale document after an update")
+
+
+def client(port: int, duration: float) -> int:
+    """Sends search calls over one connection for duration seconds and returns their number."""
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    count = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        request(connection, "POST", "/test/call_tool", {"tool_call_request": SEARCH})
+        count += 1
+    return count
+
+
+def run(root: Path, workers: int, clients: int, duration: float) -> float:
+    """Measures the throughput of one server configuration in requests per second."""
+    with tempfile.TemporaryDirectory(prefix="mcp-state-") as state_dir:
+        port = free_port()
+        server = start_server(root, Path(state_dir), port, workers)
+        try:
+            check_consistency(port, connections=4 * workers)
+            with multiprocessing.Pool(clients) as pool:
+                total = sum(pool.starmap(client, [(port, duration)] * clients))
+        finally:
+            server.terminate()
+            server.wait()
+    return total / duration
+
+
+def main() -> None:
+    """Runs the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare.")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent client processes.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to send requests for.")
+    parser.add_argument("--documents", type=int, default=1000, help="Number of documents in the library.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="agents-load-") as tmp:
+        root = Path(tmp)
+        write_library(root, args.documents)
+        print(f"{args.documents} documents, {args.clients} clients, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'req/s':>10} {'speedup':>8}")
+        baseline = None
+        for workers in args.workers:
+            throughput = run(root, workers, args.clients, args.duration)
+            baseline = baseline or throughput
+            print(f"{workers:>8} {throughput:>10.0f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compares the latency of script resources run by forking bash and by the worker pool.
+
+Usage:
+    python -m benchmarks.scripts --runs 500 --concurrency 1 4
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.scripts import ScriptRunner, SubprocessRunner
+from app.workers import BashWorkerPool
+
+SCRIPT = """#!/bin/bash
+set -euo pipefail
+name=""
+while [[ $# -gt 0 ]]; do
+  case "$1" in
+    --name) name="$2"; shift 2 ;;
+    *) shift ;;
+  esac
+done
+echo "Hello, ${name}!"
+"""
+
+
+async def time_runs(runner: ScriptRunner, script: Path, runs: int, concurrency: int) -> list[float]:
+    """Runs the script runs times with up to concurrency runs at once and returns each latency."""
+    latencies: list[float] = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def _run_once() -> None:
+        async with limit:
+            start = time.perf_counter()
+            result = await runner.run(script, ["--name", "bench"], 10)
+            latencies.append(time.perf_counter() - start)
+            assert result.stdout == b"Hello, bench!\n", result
+
+    await asyncio.gather(*(_run_once() for _ in range(runs)))
+    return latencies
+
+
+async def compare(script: Path, runs: int, concurrency: int, pool_size: int) -> None:
+    """Prints the latencies of both runners for one concurrency level."""
+    pool = BashWorkerPool(size=pool_size, max_runs=1_000_000)
+    await pool.start()
+    try:
+        for label, runner in (("fork", SubprocessRunner()), ("pool", pool)):
+            await time_runs(runner, script, min(runs, 20), concurrency)
+            latencies = sorted(await time_runs(runner, script, runs, concurrency))
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            print(f"{label:>6} {concurrency:>12} {p50:>10.2f} {p99:>10.2f}")
+    finally:
+        await pool.close()
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=500, help="Script runs per runner and concurrency level.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Concurrent runs to compare.")
+    parser.add_argument("--pool-size", type=int, default=4, help="Number of workers in the pool.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="scripts-bench-") as tmp:
+        script = Path(tmp) / "hello.sh"
+        script.write_text(SCRIPT)
+        print(f"{args.runs} runs per runner")
+        print(f"{'runner':>6} {'concurrency':>12} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+        for concurrency in args.concurrency:
+            asyncio.run(compare(script, args.runs, concurrency, args.pool_size))
+
+
+if __name__ == "__main__":
+    main()
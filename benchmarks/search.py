@@ -0,0 +1,53 @@
+"""Measures search_agents_instructions query latency on a synthetic library.
+
+Usage:
+    python -m benchmarks.search --documents 10000 --queries 2000
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from app.search import SearchIndex
+from benchmarks.synthetic import generate_documents
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=10_000, help="Number of documents to index.")
+    parser.add_argument("--size", type=int, default=4096, help="Size of each document in bytes.")
+    parser.add_argument("--queries", type=int, default=2000, help="Number of queries to run.")
+    parser.add_argument("--terms", type=int, default=2, help="Words per query.")
+    parser.add_argument("--limit", type=int, default=10, help="Hits per query.")
+    args = parser.parse_args()
+
+    documents = generate_documents(args.documents, args.size)
+    index = SearchIndex(documents)
+    start = time.perf_counter()
+    index.build()
+    build = time.perf_counter() - start
+    print(f"Indexed {args.documents} documents ({len(index)} sections) in {build:.2f} s")
+
+    # Query with words drawn from the whole vocabulary, like real agents asking
+    # for a topic rather than for the most common words
+    rng = random.Random(1)
+    vocabulary = sorted({word for content in list(documents.values())[:500] for word in content.lower().split()})
+    queries = [" ".join(rng.sample(vocabulary, args.terms)) for _ in range(args.queries)]
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, limit=args.limit)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{args.queries} queries of {args.terms} words: p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {latencies[-1]:.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Measures latency, throughput and memory of the server for every tool.
+
+Usage:
+    python -m benchmarks.server --documents 1000 --clients 8 --duration 5
+    python -m benchmarks.server --compare baseline.json results.json
+
+Starts the server on a synthetic library on a local port and runs concurrent
+clients against it for each scenario: the tools through /test/call_tool, the
+tools through the streamable HTTP MCP endpoint with one MCP session per
+client, and a script resource. Every scenario reports p50 and p99 latency,
+requests per second and the peak RSS of the server while it ran. Results are
+written as JSON, --compare prints the change between two result files.
+
+Clients and server share the machine, on few cores the client side limits the
+throughput that can be measured.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import httpx
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+from pydantic import AnyUrl
+
+from benchmarks.load import free_port, start_server
+from benchmarks.synthetic import vocabulary, write_library
+
+SCRIPT = """#!/bin/bash
+echo "ok"
+"""
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """A request that the clients send over and over."""
+
+    name: str
+    transport: str
+    target: str
+    arguments: Callable[[int], dict[str, Any]]
+
+
+def scenarios(names: list[str], words: list[str]) -> list[Scenario]:
+    """Returns the scenarios, the arguments vary with the request number."""
+    tools = [
+        ("list_agents_instructions", lambda _: {}),
+        ("get_agents_instructions", lambda i: {"name": names[i % len(names)]}),
+        ("get_agents_instructions_batch", lambda i: {"names": [names[(i + k) % len(names)] for k in range(5)]}),
+        ("search_agents_instructions", lambda i: {"query": f"{words[i % 50]} {words[(i * 7) % 200]}", "limit": 10}),
+    ]
+    return [
+        *(Scenario(f"http:{tool}", "http", tool, arguments) for tool, arguments in tools),
+        *(Scenario(f"mcp:{tool}", "mcp", tool, arguments) for tool, arguments in tools),
+        Scenario("mcp:resource:scripts/echo", "mcp-resource", "resource://scripts/echo", lambda _: {}),
+    ]
+
+
+async def run_clients(url: str, scenario: Scenario, clients: int, duration: float) -> tuple[list[float], int]:
+    """Runs the clients for duration seconds and returns the latencies and the number of errors."""
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(sys.maxsize))
+
+    async def _loop(call: Callable[[dict[str, Any]], Awaitable[bool]], deadline: float) -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            ok = await call(scenario.arguments(next(counter)))
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    async def _http_client(deadline: float) -> None:
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+
+            async def _call(arguments: dict[str, Any]) -> bool:
+                request = {"tool_call_request": {"tool_name": scenario.target, "args": arguments}}
+                response = await client.post("/test/call_tool", json=request)
+                return response.status_code == httpx.codes.OK
+
+            await _loop(_call, deadline)
+
+    async def _mcp_client(deadline: float) -> None:
+        async with streamablehttp_client(f"{url}/") as (read, write, _), ClientSession(read, write) as session:
+            await session.initialize()
+
+            async def _call(arguments: dict[str, Any]) -> bool:
+                if scenario.transport == "mcp-resource":
+                    await session.read_resource(AnyUrl(scenario.target))
+                    return True
+                return not (await session.call_tool(scenario.target, arguments)).isError
+
+            await _loop(_call, deadline)
+
+    client = _http_client if scenario.transport == "http" else _mcp_client
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client(deadline) for _ in range(clients)))
+    return latencies, errors
+
+
+def reset_peak_rss(pid: int) -> None:
+    """Resets the peak RSS of a process where the kernel allows it."""
+    with contextlib.suppress(OSError):
+        Path(f"/proc/{pid}/clear_refs").write_text("5")
+
+
+def peak_rss(pid: int) -> int | None:
+    """Returns the peak RSS of a process in bytes, or None where /proc is not available."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return None
+    for line in status.splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def summarize(latencies: list[float], errors: int, duration: float, rss: int | None) -> dict[str, Any]:
+    """Condenses the latencies of one scenario."""
+    p50 = p99 = None
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p99 = percentiles[49] * 1000, percentiles[98] * 1000
+    elif latencies:
+        p50 = p99 = latencies[0] * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50_ms": p50,
+        "p99_ms": p99,
+        "peak_rss_mb": rss / 2**20 if rss is not None else None,
+    }
+
+
+def metadata(args: argparse.Namespace) -> dict[str, Any]:
+    """Describes the code version, the machine and the parameters of a run."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "documents": args.documents,
+        "size": args.size,
+        "clients": args.clients,
+        "duration": args.duration,
+    }
+
+
+def print_row(name: str, result: dict[str, Any]) -> None:
+    """Prints the summary of one scenario."""
+    p50, p99, rss = (
+        f"{result[key]:.{digits}f}" if result[key] is not None else "-"
+        for key, digits in (("p50_ms", 2), ("p99_ms", 2), ("peak_rss_mb", 0))
+    )
+    print(f"{name:<42} {result['rps']:>9.0f} {p50:>9} {p99:>9} {result['errors']:>7} {rss:>8}")
+
+
+def compare(baseline_path: Path, current_path: Path) -> None:
+    """Prints the relative change of every scenario between two result files."""
+    baseline = json.loads(baseline_path.read_text())
+    current = json.loads(current_path.read_text())
+    print(f"{baseline['meta']['commit']} -> {current['meta']['commit']}")
+    print(f"{'scenario':<42} {'rps':>9} {'p50':>9} {'p99':>9} {'rss':>9}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<42} {'new':>9}")
+            continue
+        changes = [
+            f"{(result[key] / before[key] - 1) * 100:>+8.1f}%" if result[key] and before[key] else f"{'-':>9}"
+            for key in ("rps", "p50_ms", "p99_ms", "peak_rss_mb")
+        ]
+        print(f"{name:<42} {' '.join(changes)}")
+
+
+async def run_all(url: str, pid: int, args: argparse.Namespace, names: list[str]) -> dict[str, dict[str, Any]]:
+    """Runs every selected scenario and returns the summaries by name."""
+    results: dict[str, dict[str, Any]] = {}
+    for scenario in scenarios(names, vocabulary()):
+        if args.only and not any(part in scenario.name for part in args.only):
+            continue
+        await run_clients(url, scenario, args.clients, min(1.0, args.duration))
+        reset_peak_rss(pid)
+        latencies, errors = await run_clients(url, scenario, args.clients, args.duration)
+        results[scenario.name] = summarize(latencies, errors, args.duration, peak_rss(pid))
+        print_row(scenario.name, results[scenario.name])
+    return results
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=1000, help="Number of documents in the library.")
+    parser.add_argument("--size", type=int, default=4096, help="Size of each document in bytes.")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients per scenario.")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to measure each scenario for.")
+    parser.add_argument("--only", nargs="+", help="Run only the scenarios whose name contains one of these.")
+    parser.add_argument("--output", type=Path, help="Result file, defaults to benchmarks/results/<time>.json.")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two results.")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="agents-server-") as tmp:
+        root = Path(tmp) / "library"
+        names = sorted(write_library(root, args.documents, args.size))
+        (root / "bash").mkdir()
+        (root / "bash" / "echo.sh").write_text(SCRIPT)
+        port = free_port()
+        server = start_server(root, Path(tmp) / "state", port, workers=1)
+        print(f"{args.documents} documents of {args.size} bytes, {args.clients} clients, {args.duration} s each")
+        print(f"{'scenario':<42} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'rss MB':>8}")
+        try:
+            results = asyncio.run(run_all(f"http://127.0.0.1:{port}", server.pid, args, names))
+        finally:
+            server.terminate()
+            server.wait()
+
+    output = args.output or RESULTS_DIR / f"server-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"meta": metadata(args), "results": results}, indent=2) + "\n")
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Measures the time from launching the server until it answers its first request.
+
+Usage:
+    python -m benchmarks.startup --workers 1 2 --runs 5 --profile
+
+Every run starts python -m app.main on the agents library of the repository
+and polls /health until it answers. --profile turns on the startup profiler
+and prints the import and lifespan phase timings that the last run logged.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks.load import free_port
+
+LIBRARY = Path(__file__).parent.parent / "agents-library"
+
+
+def time_to_first_request(workers: int, state_dir: Path, *, profile: bool) -> tuple[float, list[str]]:
+    """Starts the server once and returns the seconds until /health answered and its log lines."""
+    port = free_port()
+    env = {
+        **os.environ,
+        "AGENTS_LIBRARY_PATH": str(LIBRARY),
+        "SERVER_PORT": str(port),
+        "SERVER_WORKERS": str(workers),
+        "SERVER_SHARED_STATE_DIR": str(state_dir),
+        "SERVER_PROFILE_STARTUP": str(profile).lower(),
+        "AGENTS_LIBRARY_WATCH": "false",
+    }
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.main"], env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                connection.request("GET", "/health")
+                connection.getresponse().read()
+                break
+            except OSError:
+                time.sleep(0.005)
+        else:
+            raise RuntimeError("Server did not start")
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        output, _ = server.communicate()
+    return elapsed, output.splitlines()
+
+
+def startup_records(lines: list[str]) -> list[dict[str, Any]]:
+    """Returns the startup records among the JSON log lines."""
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get("event") == "startup":
+            records.append(record)
+    return records
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2], help="Numbers of workers to measure.")
+    parser.add_argument("--runs", type=int, default=5, help="Server starts per number of workers.")
+    parser.add_argument("--profile", action="store_true", help="Print the startup profile of the last run.")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    with tempfile.TemporaryDirectory(prefix="agents-startup-") as tmp:
+        for workers in args.workers:
+            timings = []
+            lines: list[str] = []
+            for _ in range(args.runs):
+                elapsed, lines = time_to_first_request(workers, Path(tmp), profile=args.profile)
+                timings.append(elapsed * 1000)
+            print(f"{workers:>7} {statistics.median(timings):>10.0f} {min(timings):>8.0f} {max(timings):>8.0f}")
+            for record in startup_records(lines) if args.profile else []:
+                print(f"  imports_ms {record.get('imports_ms')}")
+                print(f"  phases_ms  {record.get('phases_ms')}")
+                print(f"  total_ms   {record.get('total_ms')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Compares the file and the SQLite storage of the agents library.
+
+Usage:
+    python -m benchmarks.storage --documents 100000 --size 1024
+
+Writes the same synthetic library to AGENTS.md files and imports it into a
+SQLite database, then times on both: a cold load, the stat or revision scan
+of a refresh that finds nothing changed, a refresh of a batch of named
+documents, single document writes, listing one page of names and a search.
+The file storage has no search of its own, the in-memory index that the
+server builds over it is timed instead, with its build time.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from app.library import AgentsLibrary
+from app.search import SearchIndex
+from app.storage import FileStorage, LibraryStorage, SqliteStorage, import_files
+from benchmarks.synthetic import write_library
+
+
+def median_ms(call: Callable[[], object], repeat: int) -> float:
+    """Returns the median milliseconds of call."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def run_library(storage: LibraryStorage, names: list[str], repeat: int) -> dict[str, float]:
+    """Times loading and refreshing a library on the storage."""
+    documents: dict[str, str] = {}
+    library = AgentsLibrary(documents, storage=storage)
+    start = time.perf_counter()
+    await library.refresh()
+    timings = {"load": (time.perf_counter() - start) * 1000}
+    assert len(documents) == len(names), f"loaded {len(documents)} of {len(names)} documents"
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await library.refresh()
+        samples.append((time.perf_counter() - start) * 1000)
+    timings["refresh (all)"] = statistics.median(samples)
+
+    batch = random.Random(0).sample(names, min(100, len(names)))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await library.refresh(batch)
+        samples.append((time.perf_counter() - start) * 1000)
+    timings["refresh (100)"] = statistics.median(samples)
+
+    samples = []
+    for i in range(repeat):
+        name = names[i % len(names)]
+        start = time.perf_counter()
+        await library.write(name, documents[name] + "\n")
+        samples.append((time.perf_counter() - start) * 1000)
+    timings["write"] = statistics.median(samples)
+    library.close()
+    return timings
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100_000, help="Number of documents to generate.")
+    parser.add_argument("--size", type=int, default=1024, help="Size of each document in bytes.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement, the median is reported.")
+    parser.add_argument("--query", default="kalo mine", help="Search query.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="agents-storage-") as tmp:
+        root = Path(tmp)
+        start = time.perf_counter()
+        documents = write_library(root, args.documents, args.size)
+        print(f"Wrote {args.documents} files of {args.size} bytes in {time.perf_counter() - start:.1f} s")
+        start = time.perf_counter()
+        import_files(root, root / "agents.db")
+        print(f"Imported them into SQLite in {time.perf_counter() - start:.1f} s")
+        names = sorted(documents)
+        middle = names[len(names) // 2]
+
+        results: dict[str, dict[str, float]] = {}
+        for backend, storage in (("files", FileStorage(root)), ("sqlite", SqliteStorage(root / "agents.db"))):
+            timings = asyncio.run(run_library(storage, names, args.repeat))
+            timings["list page"] = median_ms(lambda s=storage: s.list_names(after=middle, limit=100), args.repeat)
+            if isinstance(storage, SqliteStorage):
+                timings["search"] = median_ms(lambda s=storage: s.search(args.query.split(), 10), args.repeat)
+            else:
+                index = SearchIndex(documents)
+                start = time.perf_counter()
+                index.build()
+                timings["index build"] = (time.perf_counter() - start) * 1000
+                timings["search"] = median_ms(lambda i=index: i.search(args.query, 10), args.repeat)
+            storage.close()
+            results[backend] = timings
+
+        print(f"{'operation':>14} {'files ms':>10} {'sqlite ms':>10}")
+        for operation in dict.fromkeys(op for timings in results.values() for op in timings):
+            cells = [results[backend].get(operation) for backend in ("files", "sqlite")]
+            print(f"{operation:>14} " + " ".join(f"{c:>10.2f}" if c is not None else f"{'-':>10}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Synthetic agents libraries for the benchmarks."""
+
+import itertools
+import random
+from pathlib import Path
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "pa", "qu", "de", "fo", "gi", "ba", "ch")
+
+
+def vocabulary(size: int = 20_000, seed: int = 0) -> list[str]:
+    """Returns a list of distinct pseudo-words, most frequent first."""
+    rng = random.Random(seed)
+    words: dict[str, None] = {}
+    while len(words) < size:
+        words["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))] = None
+    return list(words)
+
+
+class DocumentGenerator:
+    """Generates markdown documents whose word frequencies follow Zipf's law."""
+
+    def __init__(self, vocabulary_size: int = 20_000, seed: int = 0) -> None:
+        self.words = vocabulary(vocabulary_size, seed)
+        self.cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(self.words) + 1)))
+        self.rng = random.Random(seed)
+
+    def sentence(self, length: int) -> str:
+        """Returns a sentence of the given number of words."""
+        return " ".join(self.rng.choices(self.words, cum_weights=self.cum_weights, k=length)).capitalize() + "."
+
+    def document(self, index: int, size: int = 4096) -> str:
+        """Returns a document of roughly the given size in bytes with a few sections."""
+        parts = [f"# Document {index}\n"]
+        written = 0
+        section = 0
+        while written < size:
+            section += 1
+            heading = f"\n## {self.sentence(3)[:-1]}\n\n"
+            body = " ".join(self.sentence(self.rng.randint(6, 16)) for _ in range(self.rng.randint(3, 8))) + "\n"
+            parts += [heading, body]
+            written += len(heading) + len(body)
+        return "".join(parts)[: size + 64]
+
+
+def generate_documents(count: int, size: int = 4096, seed: int = 0) -> dict[str, str]:
+    """Returns a documents dict shaped like agents_data."""
+    generator = DocumentGenerator(seed=seed)
+    return {f"doc_{i:06d}": generator.document(i, size) for i in range(count)}
+
+
+def write_library(root: Path, count: int, size: int = 4096, seed: int = 0) -> dict[str, str]:
+    """Writes a synthetic agents library below root and returns its documents."""
+    markdown_dir = root / "markdown"
+    markdown_dir.mkdir(parents=True, exist_ok=True)
+    documents = generate_documents(count, size, seed)
+    for name, content in documents.items():
+        (markdown_dir / f"{name}.agents.md").write_text(content, encoding="utf-8")
+    return documents
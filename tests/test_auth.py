@@ -0,0 +1,161 @@
+import time
+from http import HTTPStatus
+from typing import Any
+
+import httpx
+import pytest
+from authlib.jose import JsonWebKey, JsonWebToken
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import app.auth
+import app.server
+from app.auth import AuthError, BearerAuthMiddleware, JwksCache, TokenValidator
+
+ISSUER = "https://issuer.test"
+AUDIENCE = "mcp-server"
+
+
+class Issuer:
+    """A local stand-in for an OIDC issuer that signs tokens and serves its JWKS."""
+
+    def __init__(self) -> None:
+        self.keys = [JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "key-1"})]
+        self.requests: list[str] = []
+        self.transport = httpx.MockTransport(self.handle)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        """Serves the discovery document and the public keys."""
+        self.requests.append(request.url.path)
+        if request.url.path == "/.well-known/openid-configuration":
+            return httpx.Response(200, json={"issuer": ISSUER, "jwks_uri": f"{ISSUER}/jwks"})
+        return httpx.Response(200, json={"keys": [key.as_dict(is_private=False) for key in self.keys]})
+
+    def rotate(self) -> None:
+        """Adds a new signing key."""
+        self.keys.append(
+            JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": f"key-{len(self.keys) + 1}"})
+        )
+
+    def token(self, key: Any = None, **claims: Any) -> str:
+        """Signs a token, valid for an hour unless the claims say otherwise."""
+        key = key or self.keys[-1]
+        now = int(time.time())
+        payload = {"iss": ISSUER, "aud": AUDIENCE, "sub": "alice", "iat": now, "exp": now + 3600, **claims}
+        return JsonWebToken(["RS256"]).encode({"alg": "RS256", "kid": key.kid}, payload, key).decode()
+
+
+@pytest.fixture(scope="module")
+def issuer() -> Issuer:
+    """Provides a stand-in issuer, generating RSA keys is slow so it is shared."""
+    return Issuer()
+
+
+@pytest.fixture
+def validator(issuer: Issuer) -> TokenValidator:
+    """Provides a validator that discovers the keys of the stand-in issuer."""
+    issuer.requests.clear()
+    return TokenValidator(
+        JwksCache(issuer=ISSUER, transport=issuer.transport), issuer=ISSUER, audience=AUDIENCE, max_entries=2
+    )
+
+
+@pytest.mark.asyncio
+async def test_validate_caches_verified_tokens(issuer: Issuer, validator: TokenValidator) -> None:
+    """Test that keys are fetched once and a token is verified once."""
+    token = issuer.token()
+    claims = await validator.validate(token)
+    assert claims["sub"] == "alice"
+    assert await validator.validate(token) == claims
+    assert issuer.requests == ["/.well-known/openid-configuration", "/jwks"]
+    assert len(validator) == 1
+
+    # The least recently used token is evicted
+    await validator.validate(issuer.token(sub="bob"))
+    await validator.validate(issuer.token(sub="carol"))
+    assert len(validator) == validator.max_entries
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"exp": int(time.time()) - 120},
+        {"aud": "another-service"},
+        {"iss": "https://attacker.test"},
+    ],
+)
+async def test_validate_rejects_invalid_claims(issuer: Issuer, validator: TokenValidator, claims: dict) -> None:
+    """Test that expired tokens and tokens for another audience or issuer are rejected."""
+    with pytest.raises(AuthError):
+        await validator.validate(issuer.token(**claims))
+
+
+@pytest.mark.asyncio
+async def test_validate_rejects_forged_tokens(issuer: Issuer, validator: TokenValidator) -> None:
+    """Test that tokens signed with another key or mangled are rejected."""
+    forger = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "key-1"})
+    with pytest.raises(AuthError):
+        await validator.validate(issuer.token(key=forger))
+    with pytest.raises(AuthError):
+        await validator.validate("not-a-token")
+    header, payload, _ = issuer.token().split(".")
+    with pytest.raises(AuthError):
+        await validator.validate(f"{header}.{payload}.c2lnbmF0dXJl")
+
+
+@pytest.mark.asyncio
+async def test_unknown_key_refreshes_jwks(
+    issuer: Issuer, validator: TokenValidator, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that a token signed with a rotated-in key triggers a refresh of the keys."""
+    await validator.validate(issuer.token())
+    fetches = validator.jwks.fetches
+    monkeypatch.setattr(app.auth, "MIN_REFRESH_INTERVAL", 0)
+    issuer.rotate()
+    claims = await validator.validate(issuer.token())
+    assert claims["sub"] == "alice"
+    assert validator.jwks.fetches == fetches + 1
+
+
+def test_middleware(issuer: Issuer, validator: TokenValidator) -> None:
+    """Test that only the protected paths require a token and see its claims."""
+    api = FastAPI()
+    api.add_middleware(BearerAuthMiddleware, validator=validator, paths=["/test/call_tool"])
+
+    @api.get("/health")
+    async def health() -> dict:
+        return {"status": "ok"}
+
+    @api.post("/test/call_tool")
+    async def call_tool(request: Request) -> dict:
+        return {"sub": request.state.claims["sub"]}
+
+    with TestClient(api) as client:
+        assert client.get("/health").status_code == HTTPStatus.OK.value
+
+        response = client.post("/test/call_tool")
+        assert response.status_code == HTTPStatus.UNAUTHORIZED.value
+        assert response.headers["www-authenticate"] == 'Bearer realm="mcp"'
+
+        response = client.post("/test/call_tool", headers={"Authorization": "Bearer not-a-token"})
+        assert response.status_code == HTTPStatus.UNAUTHORIZED.value
+        assert 'error="invalid_token"' in response.headers["www-authenticate"]
+
+        response = client.post("/test/call_tool", headers={"Authorization": f"Bearer {issuer.token()}"})
+        assert response.status_code == HTTPStatus.OK.value
+        assert response.json() == {"sub": "alice"}
+
+
+def test_server_requires_token_when_enabled(tmp_path: Any, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the server protects the MCP endpoint and /test/call_tool but not /health."""
+    (tmp_path / "markdown").mkdir()
+    monkeypatch.setenv("AGENTS_LIBRARY_PATH", str(tmp_path))
+    monkeypatch.setitem(app.server.config["auth"], "enabled", True)
+    monkeypatch.setitem(app.server.config["auth"], "issuer", ISSUER)
+    app.server.agents_data.clear()
+    with TestClient(app.server.create_app()) as client:
+        assert client.get("/health").status_code == HTTPStatus.OK.value
+        request = {"tool_call_request": {"tool_name": "list_agents_instructions", "args": {}}}
+        assert client.post("/test/call_tool", json=request).status_code == HTTPStatus.UNAUTHORIZED.value
+        assert client.post("/", json={}).status_code == HTTPStatus.UNAUTHORIZED.value
@@ -0,0 +1,50 @@
+from app.cache import DocumentCache
+from app.library import ChangeSet
+
+
+def test_get_reuses_entry_until_content_changes() -> None:
+    """Test that an entry is only rebuilt when the document is replaced."""
+    documents = {"git": "## Git"}
+    cache = DocumentCache(documents)
+
+    entry = cache.get("git")
+    assert entry is cache.get("git")
+    assert entry.text_content is cache.get("git").text_content
+
+    documents["git"] = "## Git, updated"
+    updated = cache.get("git")
+    assert updated is not entry
+    assert updated.digest != entry.digest
+
+
+def test_entry_is_kept_until_the_document_string_is_replaced() -> None:
+    """Test that an entry is reused while the document is the same string and rebuilt afterwards."""
+    documents = {"git": "## Git"}
+    cache = DocumentCache(documents)
+    entry = cache.get("git")
+    assert cache.get("git") is entry
+
+    documents["git"] = "## Git, rewritten"
+    assert cache.get("git").digest != entry.digest
+
+
+def test_invalidate_drops_changed_and_removed_entries() -> None:
+    """Test that invalidation releases the entries named in a change set."""
+    documents = {"git": "## Git", "dev_rules": "## Rules", "python": "## Python"}
+    cache = DocumentCache(documents)
+    for name in documents:
+        cache.get(name)
+
+    cache.invalidate(ChangeSet(changed=["git"], removed=["dev_rules"]))
+    assert len(cache) == 1
+
+
+def test_matches() -> None:
+    """Test If-None-Match parsing."""
+    entry = DocumentCache({"git": "## Git"}).get("git")
+    assert entry.matches(entry.etag)
+    assert entry.matches(entry.digest)
+    assert entry.matches(f'"other", W/{entry.etag}')
+    assert entry.matches("*")
+    assert not entry.matches('"other"')
+    assert not entry.matches(None)
@@ -0,0 +1,84 @@
+import gzip
+from collections.abc import AsyncIterator
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.cache import DocumentCache
+from app.compression import CODECS, CompressionMiddleware, negotiate
+
+LARGE = "## Rules\n" + "Always write tests before the code. " * 200
+
+
+def test_negotiate() -> None:
+    """Test that quality values win over the server preference, which breaks ties."""
+    offered = ["zstd", "br", "gzip"]
+    assert negotiate(None, offered) is None
+    assert negotiate("identity", offered) is None
+    assert negotiate("gzip, br", offered) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", offered) == "gzip"
+    assert negotiate("*", offered) == "zstd"
+    assert negotiate("*, zstd;q=0", offered) == "br"
+    assert negotiate("gzip;q=bogus", offered) is None
+
+
+@pytest.fixture
+def client() -> TestClient:
+    """Provides a client for an app behind the compression middleware."""
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, encodings=["gzip"], minimum_size=1024)
+
+    @app.get("/large")
+    async def large() -> PlainTextResponse:
+        return PlainTextResponse(LARGE)
+
+    @app.get("/small")
+    async def small() -> PlainTextResponse:
+        return PlainTextResponse("## Rules")
+
+    @app.get("/encoded")
+    async def encoded() -> Response:
+        return Response(gzip.compress(LARGE.encode()), media_type="text/plain", headers={"Content-Encoding": "gzip"})
+
+    @app.get("/stream")
+    async def stream() -> StreamingResponse:
+        async def chunks() -> AsyncIterator[str]:
+            for line in LARGE.splitlines(keepends=True):
+                yield line
+
+        return StreamingResponse(chunks(), media_type="text/markdown")
+
+    return TestClient(app)
+
+
+def test_middleware(client: TestClient) -> None:
+    """Test that large and streamed responses are compressed and the others pass through."""
+    headers = {"Accept-Encoding": "gzip"}
+    response = client.get("/large", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(LARGE) // 10
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.text == LARGE
+
+    assert "content-encoding" not in client.get("/small", headers=headers).headers
+    assert "content-encoding" not in client.get("/large", headers={"Accept-Encoding": "identity"}).headers
+    assert client.get("/encoded", headers=headers).text == LARGE
+
+    response = client.get("/stream", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == LARGE
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", sorted(CODECS))
+async def test_compressed_variants_are_reused(encoding: str) -> None:
+    """Test that a document is compressed once per coding while it is unchanged."""
+    documents = {"dev_rules": LARGE}
+    cache = DocumentCache(documents)
+    entry = cache.get("dev_rules")
+    body = await entry.compressed(CODECS[encoding], 3)
+    assert len(body) < len(entry.body)
+    assert await entry.compressed(CODECS[encoding], 3) is body
+    assert await cache.get("dev_rules").compressed(CODECS[encoding], 3) is body
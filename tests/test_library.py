@@ -0,0 +1,195 @@
+import asyncio
+import os
+import shutil
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from app.library import AgentsLibrary
+from app.storage import atomic_write_text
+from app.watcher import InotifyWatcher, PollingWatcher, create_watcher
+
+
+@pytest.fixture
+def library_root(tmp_path: Path) -> Path:
+    """Creates an agents library with two AGENTS.md files."""
+    markdown_dir = tmp_path / "markdown"
+    markdown_dir.mkdir()
+    (markdown_dir / "dev_rules.agents.md").write_text("## Development Rules")
+    (markdown_dir / "git.agents.md").write_text("## Git")
+    (markdown_dir / "notes.md").write_text("Not an AGENTS.md file")
+    return tmp_path
+
+
+async def _wait_for(predicate: Callable[[], bool]) -> None:
+    """Waits up to five seconds until the predicate returns True."""
+    for _ in range(250):
+        if predicate():
+            return
+        await asyncio.sleep(0.02)
+    raise AssertionError("Timed out waiting for the library to refresh")
+
+
+@pytest.mark.asyncio
+async def test_load(library_root: Path) -> None:
+    """Test that a load picks up every AGENTS.md file."""
+    documents: dict[str, str] = {}
+    changes = await AgentsLibrary(documents).load(library_root)
+    assert sorted(changes.added) == ["dev_rules", "git"]
+    assert documents == {"dev_rules": "## Development Rules", "git": "## Git"}
+
+
+@pytest.mark.asyncio
+async def test_refresh_applies_only_the_difference(library_root: Path) -> None:
+    """Test that a refresh reports added, changed and removed documents."""
+    documents: dict[str, str] = {}
+    library = AgentsLibrary(documents)
+    await library.load(library_root)
+
+    markdown_dir = library_root / "markdown"
+    (markdown_dir / "git.agents.md").write_text("## Git, updated")
+    (markdown_dir / "dev_rules.agents.md").unlink()
+    (markdown_dir / "python.agents.md").write_text("## Python")
+
+    changes = await library.refresh()
+    assert changes.added == ["python"]
+    assert changes.changed == ["git"]
+    assert changes.removed == ["dev_rules"]
+    assert documents == {"git": "## Git, updated", "python": "## Python"}
+
+    assert not await library.refresh()
+
+
+@pytest.mark.asyncio
+async def test_refresh_skips_unchanged_files(library_root: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that files with an unchanged signature are not read again."""
+    library = AgentsLibrary({})
+    await library.load(library_root)
+
+    read_paths: list[Path] = []
+    original_read_text = Path.read_text
+
+    def _read_text(self: Path, *args: object, **kwargs: object) -> str:
+        read_paths.append(self)
+        return original_read_text(self, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "read_text", _read_text)
+    path = library_root / "markdown" / "git.agents.md"
+    path.write_text("## Git, updated")
+
+    await library.refresh()
+    assert read_paths == [path]
+
+
+@pytest.mark.asyncio
+async def test_refresh_named_document(library_root: Path) -> None:
+    """Test that a named refresh leaves the other documents alone."""
+    documents: dict[str, str] = {}
+    library = AgentsLibrary(documents)
+    await library.load(library_root)
+
+    (library_root / "markdown" / "git.agents.md").unlink()
+    (library_root / "markdown" / "dev_rules.agents.md").write_text("## Updated")
+
+    changes = await library.refresh(["dev_rules"])
+    assert changes.changed == ["dev_rules"]
+    assert changes.removed == []
+    assert documents == {"dev_rules": "## Updated", "git": "## Git"}
+
+
+@pytest.mark.asyncio
+async def test_write_replaces_file_atomically(library_root: Path) -> None:
+    """Test that a write refreshes the document and leaves no temporary file behind."""
+    documents: dict[str, str] = {}
+    library = AgentsLibrary(documents, io_workers=2)
+    await library.load(library_root)
+    path = library_root / "markdown" / "git.agents.md"
+    mode = 0o640
+    path.chmod(mode)
+
+    changes = await library.write("git", "## Git, rewritten")
+    assert changes.changed == ["git"]
+    assert documents["git"] == "## Git, rewritten"
+    assert path.stat().st_mode & 0o777 == mode
+    assert sorted(p.name for p in path.parent.iterdir()) == ["dev_rules.agents.md", "git.agents.md", "notes.md"]
+    library.close()
+
+
+def test_atomic_write_text_keeps_old_content_on_failure(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a failed write leaves the original file untouched."""
+    path = tmp_path / "git.agents.md"
+    path.write_text("## Git")
+
+    def _fsync(_fd: int) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "fsync", _fsync)
+    with pytest.raises(OSError, match="disk full"):
+        atomic_write_text(path, "## Broken")
+    assert path.read_text() == "## Git"
+    assert [p.name for p in tmp_path.iterdir()] == ["git.agents.md"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not InotifyWatcher.available(), reason="inotify is not available")
+async def test_inotify_watcher_picks_up_out_of_band_edits(library_root: Path) -> None:
+    """Test that inotify refreshes documents edited on disk."""
+    documents: dict[str, str] = {}
+    library = AgentsLibrary(documents)
+    await library.load(library_root)
+    watcher = create_watcher(library, mode="inotify")
+    try:
+        (library_root / "markdown" / "terraform.agents.md").write_text("## Terraform")
+        await _wait_for(lambda: documents.get("terraform") == "## Terraform")
+        os.remove(library_root / "markdown" / "git.agents.md")
+        await _wait_for(lambda: "git" not in documents)
+    finally:
+        await watcher.stop()
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not InotifyWatcher.available(), reason="inotify is not available")
+async def test_inotify_watcher_follows_a_replaced_directory(library_root: Path) -> None:
+    """Test that inotify keeps watching the markdown directory path after the directory is replaced."""
+    documents: dict[str, str] = {}
+    library = AgentsLibrary(documents)
+    await library.load(library_root)
+    watcher = create_watcher(library, mode="inotify", poll_interval=0.05)
+    markdown_dir = library_root / "markdown"
+    try:
+        # Swapped in by a rename, e.g. a deployment that syncs into a new directory
+        staging = library_root / "staging"
+        staging.mkdir()
+        (staging / "git.agents.md").write_text("## Git, deployed")
+        markdown_dir.rename(library_root / "previous")
+        staging.rename(markdown_dir)
+        await _wait_for(lambda: documents == {"git": "## Git, deployed"})
+        (markdown_dir / "terraform.agents.md").write_text("## Terraform")
+        await _wait_for(lambda: documents.get("terraform") == "## Terraform")
+
+        # Deleted and only created again later
+        shutil.rmtree(markdown_dir)
+        await _wait_for(lambda: not documents)
+        markdown_dir.mkdir()
+        (markdown_dir / "git.agents.md").write_text("## Git, restored")
+        await _wait_for(lambda: documents == {"git": "## Git, restored"})
+        (markdown_dir / "git.agents.md").write_text("## Git, edited")
+        await _wait_for(lambda: documents == {"git": "## Git, edited"})
+    finally:
+        await watcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_polling_watcher_picks_up_out_of_band_edits(library_root: Path) -> None:
+    """Test that polling refreshes documents edited on disk."""
+    documents: dict[str, str] = {}
+    library = AgentsLibrary(documents)
+    await library.load(library_root)
+    watcher = create_watcher(library, mode="polling", poll_interval=0.05)
+    assert isinstance(watcher, PollingWatcher)
+    try:
+        (library_root / "markdown" / "git.agents.md").write_text("## Git, updated")
+        await _wait_for(lambda: documents["git"] == "## Git, updated")
+    finally:
+        await watcher.stop()
@@ -0,0 +1,81 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.lifecycle import DrainMiddleware, Lifecycle, State
+from app.metrics import DRAIN_ABANDONED
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_work_in_flight() -> None:
+    """Test that draining refuses new work and ends once the work in flight is done."""
+    lifecycle = Lifecycle(drain_timeout=5)
+    lifecycle.mark_ready()
+    finish = asyncio.Event()
+
+    async def _work() -> None:
+        with lifecycle.track("script"):
+            await finish.wait()
+
+    work = asyncio.create_task(_work())
+    await asyncio.sleep(0)
+    drain = asyncio.create_task(lifecycle.drain())
+    await asyncio.sleep(0.01)
+    assert lifecycle.state is State.DRAINING
+    assert not lifecycle.ready
+    assert not drain.done()
+
+    finish.set()
+    await work
+    assert await drain
+    # Draining again returns the outcome of the first drain
+    assert await lifecycle.drain()
+
+
+@pytest.mark.asyncio
+async def test_drain_deadline() -> None:
+    """Test that the drain gives up at its deadline, counts what was left and kills it."""
+    killed = []
+
+    async def _kill() -> None:
+        killed.append(True)
+
+    lifecycle = Lifecycle(drain_timeout=0.05, on_deadline=_kill)
+    abandoned = DRAIN_ABANDONED.value("request")
+    with lifecycle.track("request"):
+        assert not await lifecycle.drain()
+    assert DRAIN_ABANDONED.value("request") == abandoned + 1
+    assert killed == [True]
+
+
+def test_middleware_refuses_work_unless_ready() -> None:
+    """Test that tool calls are refused while starting and draining, other requests are served."""
+    lifecycle = Lifecycle()
+    api = FastAPI()
+    api.add_middleware(DrainMiddleware, lifecycle=lifecycle, paths=["/test/call_tool"])
+
+    @api.get("/health")
+    async def health() -> dict:
+        return {"status": "ok"}
+
+    @api.post("/test/call_tool")
+    async def call_tool() -> dict:
+        return {"in_flight": dict(lifecycle.in_flight)}
+
+    client = TestClient(api)
+    response = client.post("/test/call_tool")
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE.value
+    assert "retry-after" in response.headers
+    assert client.get("/health").status_code == HTTPStatus.OK.value
+
+    lifecycle.mark_ready()
+    assert client.post("/test/call_tool").json() == {"in_flight": {"request": 1}}
+    assert not lifecycle.in_flight
+
+    lifecycle.state = State.DRAINING
+    response = client.post("/test/call_tool")
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE.value
+    assert response.headers["connection"] == "close"
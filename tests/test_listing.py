@@ -0,0 +1,74 @@
+import pytest
+
+from app.library import AgentsLibrary, ChangeSet
+from app.listing import BULK_UPDATE, ListingIndex, decode_cursor, encode_cursor
+
+
+def _index(names: list[str]) -> tuple[ListingIndex, dict[str, str]]:
+    documents = {name: f"# {name}\n\n## Usage\n\nText." for name in names}
+    index = ListingIndex(AgentsLibrary(documents))
+    index.apply(ChangeSet(added=list(documents)))
+    return index, documents
+
+
+def test_pages_follow_the_cursor() -> None:
+    """Test that paging returns every name once, in order, with a cursor only while more remain."""
+    names = [f"doc_{i:03d}" for i in range(25)]
+    index, _ = _index(names[::-1])
+    listed: list[str] = []
+    cursor = None
+    while True:
+        page = index.page(cursor, limit=10)
+        listed += page.names
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    assert listed == names
+    assert index.page(limit=25).next_cursor is None
+    assert index.page().names == names
+
+
+@pytest.mark.parametrize(
+    ("prefix", "glob", "expected"),
+    [
+        ("py", "", ["py_rules", "python", "python_tests"]),
+        ("", "py*", ["py_rules", "python", "python_tests"]),
+        ("", "*_rules", ["dev_rules", "py_rules"]),
+        ("python", "py*s", ["python_tests"]),
+        ("py", "go*", []),
+        ("", "[dg]*", ["dev_rules", "git"]),
+    ],
+)
+def test_prefix_and_glob_filters(prefix: str, glob: str, expected: list[str]) -> None:
+    """Test that prefixes and globs filter the names, alone and together."""
+    index, _ = _index(["python", "py_rules", "dev_rules", "git", "python_tests"])
+    assert index.page(prefix=prefix, glob=glob).names == expected
+
+
+def test_index_follows_changes_and_describes_documents() -> None:
+    """Test that removed and added names keep the index sorted and metadata is precomputed."""
+    index, documents = _index(["b", "d"])
+    documents["a"] = documents["c"] = "# New\n\n## Part\n\nÜnïcode"
+    del documents["d"]
+    index.apply(ChangeSet(added=["c", "a"], removed=["d"]))
+    assert index.page().names == ["a", "b", "c"]
+    assert index.describe("a") == {
+        "name": "a",
+        "size": len(documents["a"].encode()),
+        "modified": None,
+        "headings": ["New", "Part"],
+    }
+
+    # Bulk changes rebuild the names in one sort
+    added = [f"x{i}" for i in range(BULK_UPDATE + 1)]
+    documents.update(dict.fromkeys(added, ""))
+    index.apply(ChangeSet(added=added, removed=["b"]))
+    assert index.page(limit=3).names == ["a", "c", "x0"]
+    assert len(index) == len(added) + 2
+
+
+def test_cursor_round_trip() -> None:
+    """Test that cursors are opaque and invalid ones are refused."""
+    assert decode_cursor(encode_cursor("dev_rules/ünï")) == "dev_rules/ünï"
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor("not a cursor!")
@@ -0,0 +1,65 @@
+import json
+import logging
+
+import pytest
+
+from app.logs import ROOT_LOGGER, configure_logging, log_event
+
+SETTINGS = {
+    "level": "INFO",
+    "format": "json",
+    "levels": {"app.noisy": "WARNING"},
+    "sample_rates": {"hot": 0.0, "warm": 0.5},
+}
+
+
+def _records(capsys: pytest.CaptureFixture) -> list[dict]:
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_json_records(capsys: pytest.CaptureFixture) -> None:
+    """Test that records are written as JSON lines with their fields and per-component levels apply."""
+    listener = configure_logging(SETTINGS)
+    logger = logging.getLogger(f"{ROOT_LOGGER}.component")
+    log_event(logger, "tool_call", "Tool call", tool="search", duration_ms=1.5)
+    logging.getLogger(f"{ROOT_LOGGER}.noisy").info("Dropped")
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        logger.exception("Failed %s", "badly")
+    listener.stop()
+
+    first, second = _records(capsys)
+    assert first | {"time": None} == {
+        "time": None,
+        "level": "INFO",
+        "logger": "app.component",
+        "message": "Tool call",
+        "event": "tool_call",
+        "tool": "search",
+        "duration_ms": 1.5,
+    }
+    assert first["time"].endswith("Z")
+    assert second["message"] == "Failed badly"
+    assert second["level"] == "ERROR"
+    assert "ValueError: broken" in second["exception"]
+
+
+def test_sampling(capsys: pytest.CaptureFixture) -> None:
+    """Test that sampled events are dropped or tagged, and warnings are always kept."""
+    listener = configure_logging(SETTINGS)
+    logger = logging.getLogger(f"{ROOT_LOGGER}.component")
+    for _ in range(20):
+        log_event(logger, "hot", "Hot path")
+    log_event(logger, "hot", "Hot path failed", level=logging.WARNING)
+    attempts = 200
+    for _ in range(attempts):
+        log_event(logger, "warm", "Warm path")
+    listener.stop()
+
+    records = _records(capsys)
+    assert records[0]["message"] == "Hot path failed"
+    assert "sample_rate" not in records[0]
+    warm = records[1:]
+    assert 0 < len(warm) < attempts
+    assert all(record["sample_rate"] == SETTINGS["sample_rates"]["warm"] for record in warm)
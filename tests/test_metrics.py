@@ -0,0 +1,66 @@
+import pytest
+
+from app.library import ChangeSet, LibrarySize
+from app.metrics import TOOL_CALLS, TOOL_DURATION, Counter, Gauge, Histogram, Registry, instrument_tool
+
+
+def test_render_text_format() -> None:
+    """Test that counters, gauges and histograms render in the Prometheus text format."""
+    registry = Registry()
+    calls = registry.register(Counter("calls_total", "Calls.", ("tool",)))
+    registry.register(Gauge("documents", "Documents.", lambda: 3))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ("tool",), buckets=(0.1, 1.0)))
+    calls.inc("get")
+    calls.inc("get")
+    calls.inc('say "hi"')
+    latency.observe(0.05, "get")
+    latency.observe(0.5, "get")
+    latency.observe(5, "get")
+
+    assert registry.render().splitlines() == [
+        "# HELP calls_total Calls.",
+        "# TYPE calls_total counter",
+        'calls_total{tool="get"} 2',
+        'calls_total{tool="say \\"hi\\""} 1',
+        "# HELP documents Documents.",
+        "# TYPE documents gauge",
+        "documents 3",
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{tool="get",le="0.1"} 1',
+        'latency_seconds_bucket{tool="get",le="1"} 2',
+        'latency_seconds_bucket{tool="get",le="+Inf"} 3',
+        'latency_seconds_sum{tool="get"} 5.55',
+        'latency_seconds_count{tool="get"} 3',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_instrument_tool_counts_outcomes() -> None:
+    """Test that instrumented handlers count successful and failed calls."""
+
+    @instrument_tool("metrics_test")
+    async def handler(fail: bool) -> str:
+        """Returns ok or fails."""
+        if fail:
+            raise ValueError("failed")
+        return "ok"
+
+    assert await handler(fail=False) == "ok"
+    with pytest.raises(ValueError, match="failed"):
+        await handler(fail=True)
+    assert TOOL_CALLS.value("metrics_test", "ok") == TOOL_CALLS.value("metrics_test", "error") == 1
+    assert TOOL_DURATION.count("metrics_test") == TOOL_CALLS.value("metrics_test", "ok") * 2
+    assert handler.__name__ == "handler"
+
+
+def test_library_size_tracks_changes() -> None:
+    """Test that the library size follows added, changed and removed documents."""
+    documents = {"a": "abc", "b": "é"}
+    size = LibrarySize(documents)
+    size.apply(ChangeSet(added=["a", "b"]))
+    assert size.total_bytes == len("abc") + len("é".encode())
+    documents["a"] = "a"
+    del documents["b"]
+    size.apply(ChangeSet(changed=["a"], removed=["b"]))
+    assert size.total_bytes == 1
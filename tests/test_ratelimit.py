@@ -0,0 +1,124 @@
+from http import HTTPStatus
+
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from app.ratelimit import RATE_LIMITED_CODE, RateLimiter, RateLimitMiddleware, classify
+
+
+def test_bucket_refills_at_rate() -> None:
+    """Test that a client gets a burst and then rate tokens per second."""
+    limiter = RateLimiter(rate=2.0, burst=3)
+    assert [limiter.acquire("a", now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("a", now=0.0) == pytest.approx(0.5)
+    assert limiter.acquire("a", now=0.5) == 0.0
+    assert limiter.acquire("b", now=0.5) == 0.0
+    # Refilling stops at the burst size
+    assert [limiter.acquire("a", now=100.0) for _ in range(4)][-1] > 0
+
+
+def test_idle_buckets_are_evicted() -> None:
+    """Test that the number of buckets stays bounded and idle ones go first."""
+    limiter = RateLimiter(rate=1.0, burst=2, max_clients=3)
+    for i in range(10):
+        limiter.acquire(f"client-{i}", now=0.0)
+    assert len(limiter) == limiter.max_clients
+
+    # client-9 is still refilling, the others are full again after 2 seconds
+    limiter.acquire("client-9", now=1.5)
+    limiter.acquire("new", now=2.5)
+    assert list(limiter._buckets) == ["client-9", "new"]
+
+
+def test_classify() -> None:
+    """Test that tool calls and script reads are told apart."""
+    assert classify(b'{"jsonrpc": "2.0", "id": 7, "method": "tools/call", "params": {"name": "x"}}') == (1, 0, 7)
+    script = b'{"jsonrpc": "2.0", "id": 8, "method": "resources/read", "params": {"uri": "resource://scripts/up"}}'
+    assert classify(script) == (0, 1, 8)
+    assert classify(b'{"jsonrpc": "2.0", "id": 9, "method": "tools/list"}') == (0, 0, None)
+    assert classify(b"not json") == (0, 0, None)
+
+
+@pytest.fixture
+def client() -> TestClient:
+    """Provides a client for an app behind the rate limiter with small budgets."""
+    api = FastAPI()
+    api.add_middleware(
+        RateLimitMiddleware,
+        tools=RateLimiter(rate=0.001, burst=2),
+        scripts=RateLimiter(rate=0.001, burst=1),
+        mcp_path="/mcp",
+        tool_paths=["/test/call_tool"],
+        sessions=True,
+    )
+
+    @api.post("/mcp")
+    async def mcp(request: Request, response: Response) -> dict:
+        message = await request.json()
+        # Issues a session like the streamable HTTP transport does
+        if isinstance(message, dict) and message.get("method") == "initialize":
+            response.headers["Mcp-Session-Id"] = message["params"]["session"]
+        return {"echo": message}
+
+    @api.post("/test/call_tool")
+    async def call_tool() -> dict:
+        return {}
+
+    return TestClient(api)
+
+
+def test_middleware_throttles_per_budget(client: TestClient) -> None:
+    """Test that scripts and tools have separate budgets and throttled calls get a 429."""
+    script = {"jsonrpc": "2.0", "id": 1, "method": "resources/read", "params": {"uri": "resource://scripts/up"}}
+    tool = {"jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {"name": "list"}}
+    headers = {"Mcp-Session-Id": "session-1"}
+    for session in ("session-1", "session-2"):
+        initialize = {"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {"session": session}}
+        client.post("/mcp", json=initialize)
+
+    response = client.post("/mcp", json=script, headers=headers)
+    assert response.json() == {"echo": script}
+    response = client.post("/mcp", json=script, headers=headers)
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS.value
+    assert int(response.headers["retry-after"]) > 0
+    assert response.json()["id"] == 1
+    assert response.json()["error"]["code"] == RATE_LIMITED_CODE
+
+    # Other sessions and the tools budget are not affected
+    assert client.post("/mcp", json=script, headers={"Mcp-Session-Id": "session-2"}).status_code == HTTPStatus.OK
+    assert client.post("/mcp", json=tool, headers=headers).status_code == HTTPStatus.OK
+    assert client.post("/mcp", json={"jsonrpc": "2.0", "id": 3, "method": "tools/list"}).status_code == HTTPStatus.OK
+
+    # Without a session the client is identified by its address
+    assert client.post("/test/call_tool").status_code == HTTPStatus.OK
+    assert client.post("/test/call_tool").status_code == HTTPStatus.OK
+    response = client.post("/test/call_tool")
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS.value
+    assert "retry_after" in response.json()
+
+
+def test_unknown_session_ids_do_not_get_their_own_bucket(client: TestClient) -> None:
+    """Test that a throttled client cannot start over by sending made-up session IDs."""
+    tool = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": "list"}}
+    statuses = [client.post("/mcp", json=tool, headers={"Mcp-Session-Id": f"forged-{i}"}).status_code for i in range(4)]
+    assert statuses == [HTTPStatus.OK, HTTPStatus.OK, HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.TOO_MANY_REQUESTS]
+    # /test/call_tool never trusts the header, even for an issued session
+    initialize = {"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {"session": "issued"}}
+    client.post("/mcp", json=initialize)
+    response = client.post("/test/call_tool", headers={"Mcp-Session-Id": "issued"})
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS.value
+
+
+def test_requests_are_charged_only_when_every_budget_can_pay(client: TestClient) -> None:
+    """Test that a rejected batch takes no tokens and one larger than a bucket gets no Retry-After."""
+    tool = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": "list"}}
+    script = {"jsonrpc": "2.0", "id": 2, "method": "resources/read", "params": {"uri": "resource://scripts/up"}}
+
+    response = client.post("/mcp", json=[script, tool, tool, tool])
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS.value
+    assert "retry-after" not in response.headers
+    assert "retry_after" not in response.json()["error"]["data"]
+
+    # The script token was not spent on the rejected batch
+    assert client.post("/mcp", json=[script, tool, tool]).status_code == HTTPStatus.OK
@@ -0,0 +1,86 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.result_cache import ScriptResultCache
+from app.scripts import ScriptResult
+
+
+class CountingRunner:
+    """A runner that counts its runs and answers after a short delay."""
+
+    def __init__(self, returncode: int = 0) -> None:
+        self.returncode = returncode
+        self.runs = 0
+
+    async def run(self, script_path: Path, args: list[str], *_args: object, **_kwargs: object) -> ScriptResult:
+        """Returns the run number with the script name and arguments."""
+        self.runs += 1
+        await asyncio.sleep(0.01)
+        return ScriptResult(self.returncode, f"{self.runs} {script_path.stem} {' '.join(args)}".encode(), b"")
+
+    async def close(self) -> None:
+        """Nothing to release."""
+
+
+@pytest.mark.asyncio
+async def test_identical_runs_are_coalesced_and_cached() -> None:
+    """Test that concurrent identical runs share one run and later runs hit the cache."""
+    runner = CountingRunner()
+    cache = ScriptResultCache(runner, ttls={"uptime": 60})
+    script = Path("uptime.sh")
+    results = await asyncio.gather(*(cache.run(script, ["--host", "a"], 5) for _ in range(5)))
+    assert {result.stdout for result in results} == {b"1 uptime --host a"}
+    assert (await cache.run(script, ["--host", "a"], 5)).stdout == b"1 uptime --host a"
+    assert (await cache.run(script, ["--host", "b"], 5)).stdout == b"2 uptime --host b"
+    assert cache.snapshot() | {"ttls": None} == {
+        "entries": 2,
+        "max_entries": 256,
+        "in_flight": 0,
+        "hits": 1,
+        "misses": 2,
+        "coalesced": 4,
+        "ttls": None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_uncached_scripts_and_failures_always_run() -> None:
+    """Test that scripts without a TTL and failed runs are not cached."""
+    runner = CountingRunner(returncode=1)
+    cache = ScriptResultCache(runner, ttls={"uptime": 60})
+    scripts = [Path("deploy_app.sh"), Path("deploy_app.sh"), Path("uptime.sh"), Path("uptime.sh")]
+    for script in scripts:
+        await cache.run(script, [], 5)
+    assert runner.runs == len(scripts)
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_expiry_and_lru_eviction() -> None:
+    """Test that entries expire after their TTL and the least recently used entry is evicted."""
+    runner = CountingRunner()
+    cache = ScriptResultCache(runner, ttls={"uptime": 60, "clock": 0.01}, max_entries=2)
+    await cache.run(Path("clock.sh"), [], 5)
+    await asyncio.sleep(0.02)
+    assert (await cache.run(Path("clock.sh"), [], 5)).stdout.startswith(b"2 ")
+
+    await cache.run(Path("uptime.sh"), ["a"], 5)
+    await cache.run(Path("uptime.sh"), ["b"], 5)
+    assert len(cache) == cache.max_entries
+    assert (await cache.run(Path("uptime.sh"), ["a"], 5)).stdout.startswith(b"3 ")
+    assert (await cache.run(Path("clock.sh"), [], 5)).stdout.startswith(b"5 ")
+
+
+def test_config_ttl_wins_over_header() -> None:
+    """Test that a TTL from the configuration is not replaced by a script header."""
+    cache = ScriptResultCache(CountingRunner(), ttls={"uptime": 60})
+    cache.set_ttl("uptime", 5)
+    cache.set_ttl("health_check", 10)
+    cache.set_ttl("deploy_app", None)
+    assert cache.ttls == {"uptime": 60, "health_check": 10}
+    # A header that drops its TTL clears it, a configured TTL stays
+    cache.set_ttl("health_check", None)
+    cache.set_ttl("uptime", None)
+    assert cache.ttls == {"uptime": 60}
@@ -0,0 +1,91 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.metrics import SCRIPT_QUEUE_WAIT, SCRIPT_REJECTED
+from app.scheduler import ScriptRejectedError, ScriptScheduler
+from app.scripts import ScriptResult
+
+
+class GatedRunner:
+    """A runner whose runs block until the test releases them."""
+
+    def __init__(self) -> None:
+        self.gate = asyncio.Event()
+        self.started: list[str] = []
+
+    async def run(self, script_path: Path, *_args: object, **_kwargs: object) -> ScriptResult:
+        """Records the script and waits for the gate to open."""
+        self.started.append(script_path.stem)
+        await self.gate.wait()
+        return ScriptResult(0, script_path.stem.encode(), b"")
+
+    async def close(self) -> None:
+        """Nothing to release."""
+
+
+async def _settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_limits_and_queue_order() -> None:
+    """Test that runs beyond the limits wait and a busy script does not block others."""
+    runner = GatedRunner()
+    scheduler = ScriptScheduler(runner, max_concurrent=3, max_concurrent_per_script=2, script_limits={"deploy": 1})
+    waits = SCRIPT_QUEUE_WAIT.count("deploy")
+    tasks = [
+        asyncio.create_task(scheduler.run(Path(f"{name}.sh"), [], 5))
+        for name in ("deploy", "deploy", "uptime", "uptime", "logs")
+    ]
+    await _settle()
+    assert runner.started == ["deploy", "uptime", "uptime"]
+    assert scheduler.snapshot()["scripts"]["deploy"] == {"running": 1, "queued": 1, "limit": 1}
+
+    runner.gate.set()
+    results = await asyncio.gather(*tasks)
+    assert [result.stdout for result in results] == [b"deploy", b"deploy", b"uptime", b"uptime", b"logs"]
+    assert sorted(runner.started) == ["deploy", "deploy", "logs", "uptime", "uptime"]
+    stats = scheduler.snapshot()
+    assert stats["running"] == stats["queued"] == 0
+    assert stats["started"] == len(tasks)
+    assert stats["max_queue_depth"] == len(tasks) - 3
+    assert SCRIPT_QUEUE_WAIT.count("deploy") == waits + 2
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_immediately() -> None:
+    """Test that a run is rejected without waiting when the queue is full."""
+    runner = GatedRunner()
+    scheduler = ScriptScheduler(runner, max_concurrent=1, max_queued=1)
+    rejected = SCRIPT_REJECTED.value("queue_full")
+    tasks = [asyncio.create_task(scheduler.run(Path("uptime.sh"), [], 5)) for _ in range(2)]
+    await _settle()
+    with pytest.raises(ScriptRejectedError, match="Too many scripts"):
+        await scheduler.run(Path("uptime.sh"), [], 5)
+    assert scheduler.stats.rejected == 1
+    assert SCRIPT_REJECTED.value("queue_full") == rejected + 1
+
+    runner.gate.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout() -> None:
+    """Test that a run gives up after waiting queue_timeout seconds and frees its queue spot."""
+    runner = GatedRunner()
+    scheduler = ScriptScheduler(runner, max_concurrent=1, queue_timeout=0.05)
+    timeouts = SCRIPT_REJECTED.value("queue_timeout")
+    running = asyncio.create_task(scheduler.run(Path("uptime.sh"), [], 5))
+    await _settle()
+    with pytest.raises(ScriptRejectedError, match="waited more than"):
+        await scheduler.run(Path("uptime.sh"), [], 5)
+    assert scheduler.queued == 0
+    assert scheduler.stats.queue_timeouts == 1
+    assert SCRIPT_REJECTED.value("queue_timeout") == timeouts + 1
+
+    runner.gate.set()
+    await running
+    assert scheduler.running == 0
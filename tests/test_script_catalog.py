@@ -0,0 +1,103 @@
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+from app.script_catalog import ScriptArgumentError, ScriptCatalog, ScriptHeaderError, parse_param, read_spec
+
+DEPLOY = """#!/bin/bash
+# Deploys an application.
+#
+# mcp-param: app-name: string, required - Name of the application to deploy.
+# mcp-param: environment: dev|staging|prod, default=dev - Deployment environment.
+# mcp-param: replicas: integer, min=1, max=10
+# mcp-param: dry-run: boolean
+# mcp-cache-ttl: 5
+
+echo deploying
+# mcp-param: ignored: string - Declarations after the header are not read.
+"""
+
+
+def test_parse_param() -> None:
+    """Test that declarations are parsed and malformed ones are refused."""
+    param = parse_param("port: integer, default=443, min=1, max=65535 - Port for TCP checks.")
+    assert param.schema() == {
+        "type": "integer",
+        "minimum": 1,
+        "maximum": 65535,
+        "default": 443,
+        "description": "Port for TCP checks.",
+    }
+    assert parse_param("action: create|delete, required").schema() == {"type": "string", "enum": ["create", "delete"]}
+    for declaration in ("port", "port: float", "port: integer, default=x", "port: integer, optional", "9: string"):
+        with pytest.raises(ScriptHeaderError):
+            parse_param(declaration)
+
+
+def test_spec_schema_and_validation(tmp_path: Path) -> None:
+    """Test that a spec validates and converts arguments before a run."""
+    script = tmp_path / "deploy.sh"
+    script.write_text(DEPLOY)
+    spec = read_spec(script)
+    assert spec.cache_ttl == float("5")
+    schema = spec.schema()
+    assert list(schema["properties"]) == ["app-name", "environment", "replicas", "dry-run", "script_timeout"]
+    assert schema["required"] == ["app-name"]
+    assert schema["additionalProperties"] is False
+
+    arguments = {"app-name": "web", "replicas": "3", "dry-run": "true", "script_timeout": "5"}
+    assert spec.validate(arguments) == ({"app-name": "web", "replicas": 3, "dry-run": True, "environment": "dev"}, 5)
+
+    with pytest.raises(ScriptArgumentError) as excinfo:
+        spec.validate({"environment": "qa", "replicas": "11", "force": "yes", "script_timeout": "0"})
+    assert excinfo.value.errors == [
+        "script_timeout must be at least 1",
+        "environment must be one of dev, staging, prod",
+        "replicas must be at most 10",
+        "unknown argument 'force'",
+        "missing required argument 'app-name'",
+    ]
+
+    # Scripts without declarations keep accepting any argument
+    script.write_text("#!/bin/bash\nuptime\n")
+    legacy = read_spec(script)
+    assert legacy.validate({"host": "a"}) == ({"host": "a"}, 60)
+    assert legacy.schema()["additionalProperties"] is True
+
+
+@pytest.mark.asyncio
+async def test_catalog_refresh_reads_only_changed_headers(tmp_path: Path) -> None:
+    """Test that a refresh reports added, changed and removed scripts and drops broken headers."""
+
+    async def run_io(func: object, *args: object) -> object:
+        return await asyncio.to_thread(func, *args)
+
+    (tmp_path / "deploy.sh").write_text(DEPLOY)
+    (tmp_path / "uptime.sh").write_text("#!/bin/bash\nuptime\n")
+    (tmp_path / "notes.txt").write_text("not a script")
+    catalog = ScriptCatalog(tmp_path, run_io)
+    seen = []
+    catalog.subscribe(seen.append)
+
+    changes = await catalog.refresh()
+    assert (changes.added, changes.changed, changes.removed) == (["deploy", "uptime"], [], [])
+    assert not await catalog.refresh()
+
+    uptime = tmp_path / "uptime.sh"
+    uptime.write_text("#!/bin/bash\n# mcp-param: host: string, required\nuptime\n")
+    os.utime(uptime, ns=(1, 1))
+    (tmp_path / "deploy.sh").write_text("#!/bin/bash\n# mcp-param: app-name: unknown\n")
+    changes = await catalog.refresh()
+    assert (changes.added, changes.changed, changes.removed) == ([], ["uptime"], ["deploy"])
+    assert catalog.get("uptime").schema()["required"] == ["host"]
+    assert catalog.get("deploy") is None
+
+    uptime.unlink()
+    (tmp_path / "deploy.sh").write_text(DEPLOY)
+    changes = await catalog.refresh()
+    assert (changes.added, changes.changed, changes.removed) == (["deploy"], [], ["uptime"])
+    # Listeners only hear about refreshes that changed something
+    assert all(seen)
+    assert seen[-1] is changes
@@ -0,0 +1,67 @@
+import asyncio
+import signal
+from pathlib import Path
+
+import pytest
+
+from app.scripts import SubprocessRunner, build_args
+
+
+def test_build_args() -> None:
+    """Test that resource parameters become --key value arguments."""
+    assert build_args({"project_name": "demo", "count": 3}) == ["--project_name", "demo", "--count", "3"]
+
+
+@pytest.mark.asyncio
+async def test_output_is_streamed_while_the_script_runs(tmp_path: Path) -> None:
+    """Test that stdout reaches the callback before the script exits."""
+    script = tmp_path / "stream.sh"
+    script.write_text(f'#!/bin/bash\necho first\nwhile [[ ! -e "{tmp_path}/go" ]]; do sleep 0.01; done\necho second\n')
+    chunks: list[bytes] = []
+
+    async def _on_output(chunk: bytes) -> None:
+        chunks.append(chunk)
+        (tmp_path / "go").touch()
+
+    result = await SubprocessRunner().run(script, [], 5, on_output=_on_output)
+    assert chunks == [b"first\n", b"second\n"]
+    assert result.stdout == b"first\nsecond\n"
+    assert not result.truncated
+
+
+@pytest.mark.asyncio
+async def test_output_is_truncated(tmp_path: Path) -> None:
+    """Test that output beyond max_output is dropped without blocking the script."""
+    script = tmp_path / "flood.sh"
+    script.write_text("#!/bin/bash\nhead -c 1000000 /dev/zero | tr '\\0' x\necho done >&2\n")
+    chunks: list[bytes] = []
+
+    async def _on_output(chunk: bytes) -> None:
+        chunks.append(chunk)
+
+    runner = SubprocessRunner(max_output=1000)
+    result = await runner.run(script, [], 5, on_output=_on_output)
+    assert result.returncode == 0
+    assert result.stdout == b"x" * runner.max_output
+    assert b"".join(chunks) == result.stdout
+    assert result.stderr == b"done\n"
+    assert result.truncated
+
+
+@pytest.mark.asyncio
+async def test_close_kills_scripts_with_their_children(tmp_path: Path) -> None:
+    """Test that closing the runner kills running scripts and the processes they started."""
+    script = tmp_path / "spawn.sh"
+    script.write_text("#!/bin/bash\nsleep 30 &\necho started\nwait\n")
+    started = asyncio.Event()
+
+    async def _on_output(_chunk: bytes) -> None:
+        started.set()
+
+    runner = SubprocessRunner()
+    run = asyncio.create_task(runner.run(script, [], 30, on_output=_on_output))
+    await started.wait()
+    await runner.close()
+    # The orphaned sleep would keep stdout open and the run from returning
+    result = await asyncio.wait_for(run, timeout=5)
+    assert result.returncode == -signal.SIGKILL
@@ -0,0 +1,105 @@
+import math
+
+from app.library import ChangeSet
+from app.search import SearchIndex, tokenize
+
+DOCUMENTS = {
+    "git": "# Git\n\nUse conventional commits.\n\n## Branches\n\nRebase feature branches before merging.\n",
+    "python": "# Python\n\nFollow PEP 8.\n\n## Testing\n\nWrite tests with pytest and keep commits small.\n",
+    "docker": "# Docker\n\n```bash\n# not a heading\ndocker build .\n```\n\nPin base images.\n",
+}
+
+
+def test_tokenize() -> None:
+    """Test that tokens are lower-cased and stopwords are dropped."""
+    assert tokenize("Use the PEP_8 style, and TEST it!") == ["use", "pep_8", "style", "test"]
+
+
+def test_search_ranks_sections() -> None:
+    """Test that hits point at the matching section with a snippet."""
+    index = SearchIndex(dict(DOCUMENTS))
+    index.build()
+
+    hits = index.search("rebase branches")
+    assert [(hit.name, hit.section) for hit in hits] == [("git", "Branches")]
+    assert "Rebase feature branches" in hits[0].snippet
+
+    hits = index.search("commits")
+    assert {hit.name for hit in hits} == {"git", "python"}
+    assert index.search("commits", limit=1)[0].score == hits[0].score
+    assert index.search("kubernetes") == []
+
+
+def test_apply_updates_incrementally() -> None:
+    """Test that a change set re-indexes only the affected documents."""
+    documents = dict(DOCUMENTS)
+    index = SearchIndex(documents)
+    index.build()
+    sections = len(index)
+
+    documents["python"] = "# Python\n\nUse ruff for linting.\n"
+    del documents["docker"]
+    documents["terraform"] = "# Terraform\n\nPin provider versions.\n"
+    index.apply(ChangeSet(added=["terraform"], changed=["python"], removed=["docker"]))
+
+    assert index.search("pytest") == []
+    assert [hit.name for hit in index.search("ruff")] == ["python"]
+    assert [hit.name for hit in index.search("pin")] == ["terraform"]
+    assert len(index) == sections - 1
+
+
+def test_pruned_search_matches_exhaustive_scoring() -> None:
+    """Test that skipping postings of common terms does not change the top hits."""
+    documents = {
+        f"doc{i}": f"# Doc {i}\n\n{'common ' * (i % 7 + 1)}{'rare' if i % 10 == 0 else 'filler'}\n" for i in range(200)
+    }
+    index = SearchIndex(documents)
+    index.build()
+
+    hits = index.search("rare common", limit=5)
+    exhaustive = index.search("rare common", limit=200)[:5]
+    assert hits == exhaustive
+
+
+def test_common_terms_count_towards_the_scores_of_candidates() -> None:
+    """Test that returned hits get the full BM25 score, common query terms included."""
+    documents = {
+        f"doc{i}": f"# Doc {i}\n\n{'common ' * (i % 5 + 1)}{'rare' if i % 4 == 0 else 'filler'}\n" for i in range(20)
+    }
+    index = SearchIndex(documents)
+    index.build()
+    passages = {name: tokenize(content) for name, content in documents.items()}
+    average = sum(map(len, passages.values())) / len(passages)
+
+    def bm25(tokens: list[str], terms: list[str]) -> float:
+        score = 0.0
+        for term in terms:
+            df = sum(term in p for p in passages.values())
+            idf = math.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+            tf = tokens.count(term)
+            score += idf * tf * (index.k1 + 1) / (tf + index.k1 * (1 - index.b + index.b * len(tokens) / average))
+        return score
+
+    hits = index.search("rare common", limit=3)
+    expected = sorted((bm25(tokens, ["rare", "common"]), name) for name, tokens in passages.items() if "rare" in tokens)
+    # Among the passages with the rare term, the most common ones rank first
+    assert [hit.name for hit in hits] == [name for _, name in sorted(expected, reverse=True)[:3]]
+    assert [hit.score for hit in hits] == [round(score, 4) for score, _ in sorted(expected, reverse=True)[:3]]
+    assert {hit.name for hit in index.search("rare common", limit=20)} == {name for _, name in expected}
+
+
+def test_queries_of_only_common_terms_score_every_term() -> None:
+    """Test that no term is dropped when every query term is common."""
+    index = SearchIndex(
+        {
+            "a": "# A\n\nPython guide.\n",
+            "b": "# B\n\nGuide rules.\n",
+            "c": "# C\n\nPython guide rules.\n",
+        }
+    )
+    index.build()
+
+    hits = index.search("python guide rules")
+    assert hits[0].name == "c"
+    assert {hit.name for hit in hits} == {"a", "b", "c"}
+    assert hits[0].score > hits[1].score
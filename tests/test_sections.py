@@ -0,0 +1,99 @@
+import pytest
+
+from app.library import ChangeSet
+from app.sections import OutlineStore, extract, parse_outline
+
+DOCUMENT = """Intro text.
+
+# Cloud
+
+## Tagging
+
+Tag everything.
+
+```bash
+# not a heading
+```
+
+## Naming
+
+Use lowercase \u2013 no spaces.
+
+### Examples
+
+proj-env-app
+
+# Appendix
+
+Done.
+"""
+
+
+def test_parse_outline() -> None:
+    """Test that headings are nested and code block comments are ignored."""
+    outline = parse_outline(DOCUMENT)
+    assert [(s.level, s.title) for s in outline.sections] == [
+        (0, ""),
+        (1, "Cloud"),
+        (2, "Tagging"),
+        (2, "Naming"),
+        (3, "Examples"),
+        (1, "Appendix"),
+    ]
+    naming = outline.sections[3]
+    assert naming.path == ("Cloud", "Naming")
+    assert DOCUMENT[naming.start : naming.end].endswith("proj-env-app\n\n")
+    assert DOCUMENT[naming.start : naming.body_end] == "## Naming\n\nUse lowercase \u2013 no spaces.\n\n"
+    # The en dash takes three bytes in UTF-8
+    assert outline.size == len(DOCUMENT) + 2
+    assert naming.size == len(DOCUMENT[naming.start : naming.end]) + 2
+    assert (naming.first_line, naming.last_line) == (13, 20)
+    assert outline.sections[-1].last_line == outline.line_count
+
+
+def test_extract_sections() -> None:
+    """Test selecting sections by title or path."""
+    outline = parse_outline(DOCUMENT)
+    payload = extract(outline, sections=["cloud > naming", "Examples", "Missing"])
+    assert payload["sections"] == ["Cloud > Naming"]
+    assert payload["missing_sections"] == ["Missing"]
+    assert payload["content"].startswith("## Naming")
+
+    with pytest.raises(LookupError):
+        extract(outline, sections=["Missing"])
+
+
+def test_extract_ranges() -> None:
+    """Test selecting byte and line ranges."""
+    outline = parse_outline(DOCUMENT)
+    naming = outline.sections[3]
+    payload = extract(outline, byte_range=[naming.byte_start, naming.byte_end])
+    assert payload["content"] == DOCUMENT[naming.start : naming.end]
+    assert payload["size"] == outline.size
+
+    payload = extract(outline, line_range=[3, 5])
+    assert payload["content"] == "# Cloud\n\n## Tagging\n"
+    assert extract(outline, line_range=[22, 100])["line_range"] == [22, outline.line_count]
+
+    with pytest.raises(ValueError, match="exactly one"):
+        extract(outline, sections=["Cloud"], line_range=[1, 2])
+    with pytest.raises(ValueError, match="line_range"):
+        extract(outline, line_range=[0, 2])
+    with pytest.raises(ValueError, match="byte_range"):
+        extract(outline, byte_range=[5])
+
+
+def test_outline_store_follows_changes() -> None:
+    """Test that outlines are parsed on change and dropped on removal."""
+    documents = {"cloud": DOCUMENT}
+    store = OutlineStore(documents)
+    store.apply(ChangeSet(added=["cloud"]))
+    outline = store.get("cloud")
+    assert store.get("cloud") is outline
+
+    documents["cloud"] = "# Replaced\n"
+    assert [s.title for s in store.get("cloud").sections] == ["Replaced"]
+
+    del documents["cloud"]
+    store.apply(ChangeSet(removed=["cloud"]))
+    assert store.get("cloud") is None
@@ -1,3 +1,4 @@
+import hashlib
 import os
 from collections.abc import Generator
 from http import HTTPStatus
@@ -6,9 +7,11 @@ from typing import Any
 
 import pytest
 from fastapi.testclient import TestClient
+from mcp.types import TextContent
 
 # Import the app.server module directly
 import app.server
+from app.metrics import SCRIPT_RUNS
 
 
 @pytest.fixture(scope="module")
@@ -39,8 +42,7 @@ def test_agents_library_path(tmp_path_factory: Any) -> Path:
 @pytest.fixture
 def client(test_agents_library_path: Path, monkeypatch: Any) -> Generator[TestClient, None, None]:
     """Provides a TestClient for the FastAPI app."""
-    monkeypatch.setattr(app.server, "AGENTS_LIBRARY_PATH", test_agents_library_path)
-
+    monkeypatch.setenv("AGENTS_LIBRARY_PATH", str(test_agents_library_path))
     app.server.agents_data.clear()
 
     with TestClient(app.server.create_app()) as c:
@@ -54,6 +56,14 @@ def test_health_check(client: TestClient) -> None:
     assert response.json() == {"status": "ok"}
 
 
+def test_ready_check(client: TestClient) -> None:
+    """Test that the server reports itself ready once the library is loaded."""
+    response = client.get("/ready")
+    assert response.status_code == HTTPStatus.OK.value
+    assert response.json() == {"status": "ready", "in_flight": {}}
+    assert 'mcp_lifecycle_state{state="ready"} 1' in client.get("/metrics").text
+
+
 def test_call_tool(client: TestClient) -> None:
     """Test calling a tool."""
     response = client.post(
@@ -75,7 +85,63 @@ async def test_get_agents_instructions_success(client: TestClient) -> None:
     )
     assert response.status_code == HTTPStatus.OK.value
     assert response.json()["type"] == "json"
-    assert response.json()["content"] == {"content": "## Development Rules", "content_type": "text/markdown"}
+    content_json = response.json()["content"]
+    etag = content_json.pop("etag")
+    assert content_json == {"content": "## Development Rules", "content_type": "text/markdown"}
+    assert etag == f'"{hashlib.sha256(b"## Development Rules").hexdigest()}"'
+
+
+@pytest.mark.asyncio
+async def test_get_agents_instructions_not_modified(client: TestClient) -> None:
+    """Test that a matching if_none_match returns a not_modified reply instead of the document."""
+    first = client.post(
+        "/test/call_tool",
+        json={"tool_call_request": {"tool_name": "get_agents_instructions", "args": {"name": "security_checks"}}},
+    )
+    etag = first.json()["content"]["etag"]
+
+    response = client.post(
+        "/test/call_tool",
+        json={
+            "tool_call_request": {
+                "tool_name": "get_agents_instructions",
+                "args": {"name": "security_checks", "if_none_match": etag},
+            }
+        },
+    )
+    assert response.status_code == HTTPStatus.OK.value
+    assert response.json()["content"] == {"not_modified": True, "etag": etag}
+
+
+def test_call_tool_markdown_format(client: TestClient) -> None:
+    """Test that the markdown format returns the document itself."""
+
+    def call(args: dict, response_format: str = "markdown", tool_name: str = "get_agents_instructions") -> Any:
+        request = {"tool_name": tool_name, "args": args, "format": response_format}
+        return client.post("/test/call_tool", json={"tool_call_request": request})
+
+    response = call({"name": "dev_rules"})
+    assert response.status_code == HTTPStatus.OK.value
+    assert response.headers["content-type"] == "text/markdown; charset=utf-8"
+    assert response.text == "## Development Rules"
+    etag = response.headers["etag"]
+
+    response = call({"name": "dev_rules", "sections": ["Development Rules"]})
+    assert response.text.startswith("## Development Rules")
+    assert call({"name": "dev_rules", "if_none_match": etag}).status_code == HTTPStatus.NOT_MODIFIED.value
+    assert call({"name": "dev_rules", "outline": True}).status_code == HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert call({}, tool_name="list_agents_instructions").status_code == HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert call({"name": "dev_rules"}, response_format="xml").status_code == HTTPStatus.UNPROCESSABLE_ENTITY.value
+
+
+def test_convert_text_content_to_str_copies_only_what_changes() -> None:
+    """Test that containers without TextContent are returned as they are."""
+    untouched = {"files": ["a", "b"], "meta": {"count": 2}}
+    data = {"untouched": untouched, "items": [TextContent(type="text", text="x")]}
+    converted = app.server.convert_text_content_to_str(data)
+    assert converted == {"untouched": untouched, "items": ["x"]}
+    assert converted["untouched"] is untouched
+    assert app.server.convert_text_content_to_str(untouched) is untouched
 
 
 @pytest.mark.asyncio
@@ -106,6 +172,31 @@ async def test_list_agents_instructions(client: TestClient) -> None:
     assert content_json == {"files": ["common_prompts", "dev_rules", "security_checks"]}
 
 
+def test_list_agents_instructions_pages_and_metadata(client: TestClient) -> None:
+    """Test paging through a filtered listing with metadata."""
+
+    def list_files(**args: Any) -> Any:
+        request = {"tool_call_request": {"tool_name": "list_agents_instructions", "args": args}}
+        return client.post("/test/call_tool", json=request)
+
+    first = list_files(glob="*_*", limit=1, metadata=True).json()["content"]
+    entry = first["files"][0]
+    assert entry["name"] == "common_prompts"
+    assert entry["size"] == len("## Common Prompts")
+    assert entry["headings"] == ["Common Prompts"]
+    assert entry["etag"] == f'"{hashlib.sha256(b"## Common Prompts").hexdigest()}"'
+    assert entry["modified"] > 0
+
+    second = list_files(glob="*_*", limit=1, cursor=first["next_cursor"]).json()["content"]
+    assert second["files"] == ["dev_rules"]
+    third = list_files(glob="*_*", limit=1, cursor=second["next_cursor"]).json()["content"]
+    assert third == {"files": ["security_checks"]}
+
+    assert list_files(prefix="de").json()["content"] == {"files": ["dev_rules"]}
+    assert list_files(limit=0).status_code == HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert list_files(cursor="%%%").status_code == HTTPStatus.UNPROCESSABLE_ENTITY.value
+
+
 @pytest.mark.asyncio
 @pytest.mark.usefixtures("test_agents_library_path")
 async def test_update_agents_file_success(client: TestClient) -> None:
@@ -194,3 +285,251 @@ async def test_update_agents_file_path_traversal(client: TestClient) -> None:
     content_json = response.json()
     expected_detail_substring = "Access denied: '../../bad_location.agents.md' is not in the allowed directory."
     assert expected_detail_substring in content_json["detail"]
+
+
+def test_update_agents_file_patch_with_expected_version(client: TestClient) -> None:
+    """Test that patches apply against the expected version and stale updates are rejected."""
+
+    def _call(tool_name: str, **args: Any) -> Any:
+        return client.post("/test/call_tool", json={"tool_call_request": {"tool_name": tool_name, "args": args}})
+
+    client.post(
+        "/test/call_tool",
+        json={
+            "tool_call_request": {
+                "tool_name": "update_agents_file",
+                "args": {"file_name": "versioned.agents.md", "new_content": "# Rules\n\n- one\n"},
+            }
+        },
+    )
+    history = _call("get_agents_history", name="versioned").json()["content"]
+    version = history["version"]
+
+    patch = "@@ -3 +3,2 @@\n - one\n+- two\n"
+    response = _call("update_agents_file", file_name="versioned.agents.md", patch=patch, expected_version=version)
+    assert response.status_code == HTTPStatus.OK.value
+    updated = response.json()["content"]
+    assert updated["version"] == version + 1
+    assert app.server.agents_data["versioned"] == "# Rules\n\n- one\n- two\n"
+    assert updated["etag"] == client.get("/agents/versioned").headers["etag"]
+
+    # A second writer working from the old version loses
+    stale = _call("update_agents_file", file_name="versioned.agents.md", new_content="x", expected_version=version)
+    assert stale.status_code == HTTPStatus.CONFLICT.value
+    assert app.server.agents_data["versioned"] == "# Rules\n\n- one\n- two\n"
+
+    # Etags work the same way and are compared with the stored content
+    response = _call(
+        "update_agents_file",
+        file_name="versioned.agents.md",
+        patch="@@ -4 +4 @@\n-- two\n+- 2\n",
+        expected_etag=updated["etag"],
+    )
+    assert response.status_code == HTTPStatus.OK.value
+    stale = _call("update_agents_file", file_name="versioned.agents.md", new_content="x", expected_etag=updated["etag"])
+    assert stale.status_code == HTTPStatus.CONFLICT.value
+    assert app.server.agents_data["versioned"] == "# Rules\n\n- one\n- 2\n"
+
+    history = _call("get_agents_history", name="versioned", since_version=version).json()["content"]
+    assert [v["version"] for v in history["versions"]] == [version, version + 1, version + 2]
+    assert "+- 2\n" in history["diff"]
+
+
+def test_get_agents_document_etag(client: TestClient) -> None:
+    """Test the plain HTTP document route and its If-None-Match handling."""
+    response = client.get("/agents/common_prompts")
+    assert response.status_code == HTTPStatus.OK.value
+    assert response.json()["content"] == "## Common Prompts"
+    etag = response.headers["etag"]
+    assert response.json()["etag"] == etag
+
+    response = client.get("/agents/common_prompts", headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED.value
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    response = client.get("/agents/non_existent")
+    assert response.status_code == HTTPStatus.NOT_FOUND.value
+
+
+def test_get_agents_document_compressed(test_agents_library_path: Path, monkeypatch: Any) -> None:
+    """Test that the document route serves the negotiated pre-compressed body."""
+    monkeypatch.setenv("AGENTS_LIBRARY_PATH", str(test_agents_library_path))
+    monkeypatch.setitem(app.server.config["compression"], "minimum_size", 0)
+    app.server.agents_data.clear()
+    with TestClient(app.server.create_app()) as client:
+        response = client.get("/agents/common_prompts", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == HTTPStatus.OK.value
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.json()["content"] == "## Common Prompts"
+
+
+def test_get_agents_document_etag_changes_after_update(client: TestClient) -> None:
+    """Test that an update invalidates the cached payload and its ETag."""
+    etag = client.get("/agents/security_checks").headers["etag"]
+    client.post(
+        "/test/call_tool",
+        json={
+            "tool_call_request": {
+                "tool_name": "update_agents_file",
+                "args": {"file_name": "security_checks.agents.md", "new_content": "## Updated Security Checks"},
+            }
+        },
+    )
+
+    response = client.get("/agents/security_checks", headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.OK.value
+    assert response.json()["content"] == "## Updated Security Checks"
+    assert response.headers["etag"] != etag
+
+
+def test_search_agents_instructions(client: TestClient) -> None:
+    """Test searching the agents library via MCP tool invocation."""
+    response = client.post(
+        "/test/call_tool",
+        json={"tool_call_request": {"tool_name": "search_agents_instructions", "args": {"query": "common prompts"}}},
+    )
+    assert response.status_code == HTTPStatus.OK.value
+    content_json = response.json()["content"]
+    assert content_json["query"] == "common prompts"
+    assert [(hit["name"], hit["section"]) for hit in content_json["hits"]] == [("common_prompts", "Common Prompts")]
+
+
+def test_get_agents_instructions_outline_and_sections(client: TestClient) -> None:
+    """Test the outline mode and section retrieval of get_agents_instructions."""
+    response = client.post(
+        "/test/call_tool",
+        json={
+            "tool_call_request": {
+                "tool_name": "get_agents_instructions",
+                "args": {"name": "common_prompts", "outline": True},
+            }
+        },
+    )
+    assert response.status_code == HTTPStatus.OK.value
+    outline = response.json()["content"]
+    assert outline["sections"] == [
+        {"title": "Common Prompts", "level": 2, "path": "Common Prompts", "size": 17, "bytes": [0, 17], "lines": [1, 1]}
+    ]
+
+    response = client.post(
+        "/test/call_tool",
+        json={
+            "tool_call_request": {
+                "tool_name": "get_agents_instructions",
+                "args": {"name": "common_prompts", "sections": ["common prompts"]},
+            }
+        },
+    )
+    assert response.status_code == HTTPStatus.OK.value
+    assert response.json()["content"]["content"] == "## Common Prompts"
+    assert response.json()["content"]["etag"] == outline["etag"]
+
+    response = client.post(
+        "/test/call_tool",
+        json={
+            "tool_call_request": {
+                "tool_name": "get_agents_instructions",
+                "args": {"name": "common_prompts", "sections": ["Missing"]},
+            }
+        },
+    )
+    assert response.status_code == HTTPStatus.NOT_FOUND.value
+
+
+def test_get_agents_instructions_batch(client: TestClient) -> None:
+    """Test fetching several files at once with missing names, sections, etags and a byte budget."""
+
+    def call(args: dict) -> dict:
+        response = client.post(
+            "/test/call_tool",
+            json={"tool_call_request": {"tool_name": "get_agents_instructions_batch", "args": args}},
+        )
+        assert response.status_code == HTTPStatus.OK.value
+        return response.json()["content"]
+
+    single = client.post(
+        "/test/call_tool",
+        json={"tool_call_request": {"tool_name": "get_agents_instructions", "args": {"name": "security_checks"}}},
+    ).json()["content"]
+
+    batch = call({"names": ["security_checks", "missing", "common_prompts"], "sections": {"common_prompts": ["Nope"]}})
+    assert list(batch["documents"]) == ["security_checks", "common_prompts"]
+    assert batch["documents"]["security_checks"] == single
+    assert batch["documents"]["common_prompts"]["missing_sections"] == ["Nope"]
+    assert batch["not_found"] == ["missing"]
+    assert batch["omitted"] == []
+
+    batch = call({"names": ["security_checks", "common_prompts"], "if_none_match": {"security_checks": single["etag"]}})
+    assert batch["documents"]["security_checks"] == {"not_modified": True, "etag": single["etag"]}
+
+    budget = 5
+    batch = call({"names": ["security_checks", "common_prompts"], "max_bytes": budget})
+    truncated = batch["documents"]["security_checks"]
+    assert truncated["content"] == single["content"][:budget]
+    assert truncated["truncated"] is True
+    assert truncated["size"] == len(single["content"])
+    assert batch["omitted"] == ["common_prompts"]
+
+
+def test_script_stats(client: TestClient) -> None:
+    """Test that the script scheduler reports its load."""
+    response = client.get("/scripts/stats")
+    assert response.status_code == HTTPStatus.OK.value
+    stats = response.json()
+    assert stats["running"] == stats["queued"] == 0
+    assert stats["max_concurrent"] == app.server.config["scripts"]["max_concurrent"]
+
+
+def test_script_arguments_are_validated_before_spawning(tmp_path: Path, monkeypatch: Any) -> None:
+    """Test that script arguments come from the query string and are checked against the script header."""
+    (tmp_path / "markdown").mkdir()
+    (tmp_path / "bash").mkdir()
+    marker = tmp_path / "ran"
+    (tmp_path / "bash" / "greet.sh").write_text(
+        "#!/bin/bash\n# mcp-param: name: string, required\n# mcp-param: loud: boolean\n"
+        f'touch {marker}\necho "hello $*"\n'
+    )
+    monkeypatch.setenv("AGENTS_LIBRARY_PATH", str(tmp_path))
+    monkeypatch.setitem(app.server.config["mcp_server"], "stateless_http", True)
+    app.server.agents_data.clear()
+
+    def read(client: TestClient, uri: str) -> dict:
+        response = client.post(
+            "/",
+            json={"jsonrpc": "2.0", "id": 1, "method": "resources/read", "params": {"uri": uri}},
+            headers={"Accept": "application/json, text/event-stream"},
+        )
+        assert response.status_code == HTTPStatus.OK.value
+        return response.json()
+
+    invalid = SCRIPT_RUNS.value("greet", "invalid")
+    with TestClient(app.server.create_app()) as client:
+        schema = client.get("/scripts").json()["greet"]
+        assert schema["required"] == ["name"]
+        assert schema["properties"]["loud"] == {"type": "boolean"}
+
+        for uri in ("resource://scripts/greet", "resource://scripts/greet?name=a&loud=maybe"):
+            assert "Invalid arguments for greet" in read(client, uri)["error"]["message"]
+        assert "given more than once" in read(client, "resource://scripts/greet?name=a&name=b")["error"]["message"]
+        assert not marker.exists()
+        assert SCRIPT_RUNS.value("greet", "invalid") == invalid + len(["missing name", "bad loud"])
+
+        contents = read(client, "resource://scripts/greet?name=Ada%20L&loud=yes")["result"]["contents"]
+        assert contents[0]["text"] == "hello --name Ada L --loud true"
+
+
+def test_metrics(client: TestClient) -> None:
+    """Test that tool calls and the library show up in the metrics."""
+    client.post(
+        "/test/call_tool",
+        json={"tool_call_request": {"tool_name": "list_agents_instructions", "args": {}}},
+    )
+    response = client.get("/metrics")
+    assert response.status_code == HTTPStatus.OK.value
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert any(line.startswith('mcp_tool_calls_total{tool="list_agents_instructions",outcome="ok"}') for line in lines)
+    assert f"mcp_library_documents {len(app.server.agents_data)}" in lines
+    assert any(line.startswith("mcp_library_refresh_seconds_count") for line in lines)
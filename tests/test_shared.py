@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import pytest
+
+import app.shared
+from app.library import AgentsLibrary
+from app.shared import SharedGeneration, SharedStateMiddleware
+
+
+def test_publish_and_collect(tmp_path: Path) -> None:
+    """Test that a worker sees the documents another worker published."""
+    first = SharedGeneration(tmp_path)
+    second = SharedGeneration(tmp_path)
+    assert not first.changed()
+    assert not second.changed()
+
+    first.publish(["git"])
+    first.publish(["python", "git"])
+    assert not first.changed()
+    assert second.changed()
+    assert second.collect() == ["git", "python"]
+    assert not second.changed()
+    assert second.collect() == []
+
+    second.publish(["docker"])
+    assert first.collect() == ["docker"]
+
+
+def test_truncated_journal_asks_for_a_full_reload(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a worker reloads everything when the journal was cut back."""
+    monkeypatch.setattr(app.shared, "MAX_JOURNAL_SIZE", 8)
+    first = SharedGeneration(tmp_path)
+    second = SharedGeneration(tmp_path)
+    first.publish(["a_long_document_name"])
+    assert second.collect() == ["a_long_document_name"]
+    first.publish(["one"])
+    first.publish(["two"])
+    assert second.collect() is None
+    first.publish(["three"])
+    assert second.collect() == ["three"]
+
+
+@pytest.mark.asyncio
+async def test_middleware_applies_updates_from_other_workers(tmp_path: Path) -> None:
+    """Test that a request to one worker sees an update made through another."""
+    markdown_dir = tmp_path / "library" / "markdown"
+    markdown_dir.mkdir(parents=True)
+    (markdown_dir / "git.agents.md").write_text("## Git")
+    writer_documents: dict[str, str] = {}
+    reader_documents: dict[str, str] = {}
+    writer = AgentsLibrary(writer_documents)
+    reader = AgentsLibrary(reader_documents)
+    await writer.load(tmp_path / "library")
+    await reader.load(tmp_path / "library")
+
+    served: list[str] = []
+
+    async def endpoint(*_args: object) -> None:
+        served.append(reader_documents["git"])
+
+    writer_shared = SharedGeneration(tmp_path / "state")
+    middleware = SharedStateMiddleware(endpoint, reader, SharedGeneration(tmp_path / "state"))
+
+    changes = await writer.write("git", "## Git, updated")
+    writer_shared.publish(changes.changed)
+    await middleware({"type": "http"}, None, None)
+    assert served == ["## Git, updated"]
+    writer.close()
+    reader.close()
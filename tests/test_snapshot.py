@@ -0,0 +1,84 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.cache import DocumentCache
+from app.library import AgentsLibrary
+from app.snapshot import Snapshot, build
+
+
+@pytest.fixture
+def library_root(tmp_path: Path) -> Path:
+    """Creates an agents library with two documents."""
+    markdown_dir = tmp_path / "markdown"
+    markdown_dir.mkdir()
+    (markdown_dir / "git.agents.md").write_text("## Git")
+    (markdown_dir / "python.agents.md").write_text("## Python, ünïcode")
+    return tmp_path
+
+
+def test_build_and_open(library_root: Path) -> None:
+    """Test that a snapshot holds every document with its encoded payload."""
+    assert build(library_root, library_root / "agents.snapshot") == len(["git", "python"])
+    snapshot = Snapshot.open(library_root / "agents.snapshot")
+    assert snapshot is not None
+    assert sorted(snapshot.entries) == ["git", "python"]
+
+    entry = snapshot.entries["python"]
+    documents = {"python": "## Python, ünïcode"}
+    expected = DocumentCache(documents).get("python")
+    assert entry.content == documents["python"]
+    assert entry.digest == expected.digest
+    assert bytes(entry.payload) == expected.body
+
+
+def test_open_ignores_missing_and_invalid_files(tmp_path: Path) -> None:
+    """Test that the server falls back to the directory when there is no usable snapshot."""
+    assert Snapshot.open(tmp_path / "missing.snapshot") is None
+    (tmp_path / "broken.snapshot").write_bytes(b"not a snapshot at all")
+    assert Snapshot.open(tmp_path / "broken.snapshot") is None
+
+
+@pytest.mark.asyncio
+async def test_load_reads_only_files_changed_since_the_snapshot(library_root: Path) -> None:
+    """Test that unchanged documents come from the snapshot and changed ones from disk."""
+    build(library_root, library_root / "agents.snapshot")
+    snapshot = Snapshot.open(library_root / "agents.snapshot")
+    git_path = library_root / "markdown" / "git.agents.md"
+    git_path.write_text("## Git, edited after the build")
+    os.utime(git_path, ns=(0, 0))
+
+    documents: dict[str, str] = {}
+    library = AgentsLibrary(documents)
+    await library.load(library_root, preloaded=snapshot.entries)
+    library.close()
+    assert documents == {"git": "## Git, edited after the build", "python": "## Python, ünïcode"}
+    assert documents["python"] is snapshot.entries["python"].content
+
+    cache = DocumentCache(documents)
+    for entry in snapshot.entries.values():
+        cache.preload(entry.name, entry.content, entry.digest, entry.payload)
+    assert isinstance(cache.get("python").body, memoryview)
+    assert cache.get("git").body == DocumentCache({"git": documents["git"]}).get("git").body
+
+
+def test_close_unmaps_the_snapshot(library_root: Path) -> None:
+    """Test that closing a snapshot unmaps it even while cached documents still hold its payloads."""
+    build(library_root, library_root / "agents.snapshot")
+    snapshot = Snapshot.open(library_root / "agents.snapshot")
+    documents = {name: entry.content for name, entry in snapshot.entries.items()}
+    cache = DocumentCache(documents)
+    for entry in snapshot.entries.values():
+        cache.preload(entry.name, entry.content, entry.digest, entry.payload)
+    assert isinstance(cache.get("git").body, memoryview)
+
+    snapshot.close()
+    assert snapshot.mapping.closed
+    assert snapshot.entries == {}
+    # Decoded documents outlive the mapping, cached payloads have to be rebuilt
+    assert documents["python"] == "## Python, ünïcode"
+    with pytest.raises(ValueError, match="released"):
+        bytes(cache.get("git").body)
+    cache.clear()
+    assert isinstance(cache.get("git").body, bytes)
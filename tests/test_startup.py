@@ -0,0 +1,33 @@
+import subprocess
+import sys
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.server
+from app.startup import StartupProfiler
+
+
+def test_import_has_no_side_effects() -> None:
+    """Test that importing the server neither loads the configuration nor creates the app."""
+    code = "import app.server; assert 'app' not in vars(app.server) and not app.server.get_config.cache_info().currsize"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).parent.parent)
+
+
+def test_profiler_records_startup_phases(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the app reports the phases of its start to the profiler."""
+    (tmp_path / "markdown").mkdir()
+    (tmp_path / "markdown" / "dev_rules.agents.md").write_text("## Development Rules")
+    profiler = StartupProfiler()
+    profiler.import_modules(("json",))
+    monkeypatch.setenv("AGENTS_LIBRARY_PATH", str(tmp_path))
+    app.server.agents_data.clear()
+    with TestClient(app.server.create_app(profiler=profiler)) as client:
+        assert client.get("/health").status_code == HTTPStatus.OK.value
+
+    report = profiler.report()
+    assert set(report["imports_ms"]) == {"json"}
+    assert {"create_app", "logging", "library", "scripts"} <= set(report["phases_ms"])
+    assert report["total_ms"] >= sum(report["phases_ms"].values())
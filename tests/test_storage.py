@@ -0,0 +1,177 @@
+import contextlib
+import sqlite3
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.server
+from app.cache import document_digest
+from app.library import AgentsLibrary
+from app.storage import FileStorage, LibraryStorage, SqliteStorage, import_files
+from app.versions import ConflictError, check_etag
+
+
+@pytest.fixture
+def library_root(tmp_path: Path) -> Path:
+    """Creates an agents library with two AGENTS.md files."""
+    markdown_dir = tmp_path / "markdown"
+    markdown_dir.mkdir()
+    (markdown_dir / "git.agents.md").write_text("## Git\n\nRebase before you push.")
+    (markdown_dir / "python.agents.md").write_text("## Python\n\nUse type hints.\n\n## Tests\n\nRun pytest.")
+    return tmp_path
+
+
+@pytest.mark.parametrize("backend", ["files", "sqlite"])
+def test_storages_list_names_in_pages(tmp_path: Path, backend: str) -> None:
+    """Test that both storages page through the sorted names, optionally with a prefix."""
+    (tmp_path / "markdown").mkdir()
+    storage = FileStorage(tmp_path) if backend == "files" else SqliteStorage(tmp_path / "agents.db")
+    for name in ["b", "a", "ab", "abc", "b_x", "c"]:
+        storage.write(name, f"## {name}")
+    assert storage.list_names(limit=4) == ["a", "ab", "abc", "b"]
+    assert storage.list_names(after="b", limit=4) == ["b_x", "c"]
+    assert storage.list_names(prefix="ab") == ["ab", "abc"]
+    assert storage.list_names(after="ab", prefix="ab") == ["abc"]
+    assert storage.read(["c", "missing"]) == ["## c", None]
+    assert set(storage.scan({"a", "missing"})) == {"a"}
+    storage.close()
+
+
+def test_sqlite_storage_signatures_and_search(tmp_path: Path) -> None:
+    """Test that every write gets a new revision and the full-text index follows the content."""
+    storage = SqliteStorage(tmp_path / "agents.db")
+    first = storage.write("git", "## Git\n\nRebase before you push.")
+    storage.write("python", "## Python\n\nUse type hints.")
+    assert storage.scan()["git"] == first
+    second = storage.write("git", "## Git\n\nMerge, never rebase shared branches.")
+    assert second.rev > first.rev
+
+    assert [name for name, _ in storage.search(["hints"])] == ["python"]
+    assert {name for name, _ in storage.search(["merge", "hints"])} == {"git", "python"}
+    assert storage.search(["push"]) == []
+    # Quotes in terms cannot break out of the query
+    assert storage.search(['"git" OR']) == []
+    storage.close()
+
+
+@pytest.mark.asyncio
+async def test_library_on_sqlite_sees_writes_of_other_processes(library_root: Path, monkeypatch: Any) -> None:
+    """Test that a library on the SQLite storage loads, writes and refreshes by revision."""
+    database = library_root / "agents.db"
+    assert import_files(library_root, database) == len(["git", "python"])
+
+    documents: dict[str, str] = {}
+    library = AgentsLibrary(documents)
+    changes = await library.load(SqliteStorage(database))
+    assert sorted(changes.added) == ["git", "python"]
+    assert library.markdown_dir is None
+
+    changes = await library.write("rust", "## Rust")
+    assert changes.added == ["rust"]
+
+    # Another server writing to the same database
+    other = SqliteStorage(database)
+    other.write("git", "## Git, updated")
+    other.close()
+    changes = await library.refresh()
+    assert changes.changed == ["git"]
+    assert documents == {"git": "## Git, updated", "python": documents["python"], "rust": "## Rust"}
+
+    # Polls do not scan the documents while the revision stays the same
+    storage = library.storage
+    scans = []
+    scan = storage.scan
+    monkeypatch.setattr(storage, "scan", lambda *names: scans.append(names) or scan(*names))
+    assert not await library.refresh()
+    assert scans == []
+    with contextlib.closing(sqlite3.connect(database)) as connection, connection:
+        connection.execute("DELETE FROM documents WHERE name = 'rust'")
+    changes = await library.refresh()
+    assert changes.removed == ["rust"]
+    assert len(scans) == 1
+    library.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["files", "sqlite"])
+async def test_checked_updates_are_atomic_across_libraries(library_root: Path, backend: str) -> None:
+    """Test that of two workers updating against the same content only the first succeeds."""
+    import_files(library_root, library_root / "agents.db")
+
+    def _storage() -> LibraryStorage:
+        return FileStorage(library_root) if backend == "files" else SqliteStorage(library_root / "agents.db")
+
+    first, second = AgentsLibrary({}, storage=_storage()), AgentsLibrary({}, storage=_storage())
+    await first.refresh()
+    await second.refresh()
+    base = document_digest(second.documents["git"])
+
+    def _rewrite(content: str) -> Any:
+        def _change(current: str | None) -> str:
+            check_etag("git", current, base)
+            return content
+
+        return _change
+
+    changes = await first.update("git", _rewrite("## Git, first"))
+    assert changes.changed == ["git"]
+    # The second worker has not seen the first update yet
+    assert document_digest(second.documents["git"]) == base
+    with pytest.raises(ConflictError) as excinfo:
+        await second.update("git", _rewrite("## Git, second"))
+    assert excinfo.value.etag == f'"{document_digest("## Git, first")}"'
+    assert _storage().read(["git"]) == ["## Git, first"]
+    first.close()
+    second.close()
+
+
+def _call(client: TestClient, tool_name: str, **args: Any) -> Any:
+    response = client.post("/test/call_tool", json={"tool_call_request": {"tool_name": tool_name, "args": args}})
+    assert response.status_code == HTTPStatus.OK.value
+    return response.json()["content"]
+
+
+def test_server_on_sqlite(library_root: Path, monkeypatch: Any) -> None:
+    """Test that the server serves, searches and updates documents in a SQLite library."""
+    import_files(library_root, library_root / "agents.db")
+    for path in (library_root / "markdown").iterdir():
+        path.unlink()
+    monkeypatch.setenv("AGENTS_LIBRARY_PATH", str(library_root))
+    monkeypatch.setitem(app.server.config["agents_library"], "backend", "sqlite")
+    app.server.agents_data.clear()
+    with TestClient(app.server.create_app()) as client:
+        assert _call(client, "list_agents_instructions") == {"files": ["git", "python"]}
+        hits = _call(client, "search_agents_instructions", query="pytest")["hits"]
+        assert [(hit["name"], hit["section"]) for hit in hits] == [("python", "Tests")]
+        assert hits[0]["snippet"] == "## Tests Run pytest."
+
+        _call(client, "update_agents_file", file_name="go.agents.md", new_content="## Go\n\nRun gofmt.")
+        assert _call(client, "list_agents_instructions") == {"files": ["git", "go", "python"]}
+
+        # Listings page through the database, which sees the writes of other servers
+        other = SqliteStorage(library_root / "agents.db")
+        other.write("gradle", "## Gradle\n\nUse the wrapper.")
+        other.close()
+        page = _call(client, "list_agents_instructions", limit=2, glob="g*")
+        assert page["files"] == ["git", "go"]
+        page = _call(client, "list_agents_instructions", limit=2, glob="g*", cursor=page["next_cursor"], metadata=True)
+        assert [(entry["name"], entry["headings"]) for entry in page["files"]] == [("gradle", ["Gradle"])]
+        assert "next_cursor" not in page
+        storage = SqliteStorage(library_root / "agents.db")
+        assert storage.read(["go"]) == ["## Go\n\nRun gofmt."]
+        storage.close()
+
+        response = client.post(
+            "/test/call_tool",
+            json={
+                "tool_call_request": {
+                    "tool_name": "update_agents_file",
+                    "args": {"file_name": "../go.agents.md", "new_content": "## Go"},
+                }
+            },
+        )
+        assert response.status_code == HTTPStatus.FORBIDDEN.value
+    assert not list((library_root / "markdown").iterdir())
@@ -0,0 +1,54 @@
+import pytest
+
+from app.library import ChangeSet
+from app.versions import PatchError, VersionStore, apply_patch, make_patch
+
+
+def test_versions_count_up_and_history_is_bounded() -> None:
+    """Test that every change gives a new version and only the last ones are kept."""
+    documents = {"rules": "v1"}
+    store = VersionStore(documents, history=2)
+    store.apply(ChangeSet(added=["rules"]))
+    for content in ("v2", "v3"):
+        documents["rules"] = content
+        store.apply(ChangeSet(changed=["rules"]))
+
+    current = store.current("rules")
+    assert (current.version, current.content) == (3, "v3")
+    assert [v.version for v in store.versions("rules")] == [2, 3]
+    assert store.get("rules", 1) is None
+    assert store.get("rules", 2).content == "v2"
+
+    # A recreated document does not reuse a version
+    del documents["rules"]
+    store.apply(ChangeSet(removed=["rules"]))
+    assert store.current("rules") is None
+    documents["rules"] = "again"
+    store.apply(ChangeSet(added=["rules"]))
+    assert store.current("rules").version == current.version + 1
+
+
+@pytest.mark.parametrize(
+    ("old", "new"),
+    [
+        ("a\nb\nc\n", "a\nB\nc\n"),
+        ("", "first\nsecond\n"),
+        ("a\nb", "a\nb\nc"),
+        ("one\ntwo\n", ""),
+        ("\n".join(f"line {i}" for i in range(50)) + "\n", "head\n" + "\n".join(f"line {i}" for i in range(49))),
+    ],
+)
+def test_make_patch_round_trips(old: str, new: str) -> None:
+    """Test that a generated patch turns the old content into the new one, trailing newlines included."""
+    assert apply_patch(old, make_patch(old, new)) == new
+
+
+def test_apply_patch_rejects_mismatches() -> None:
+    """Test that a patch made against other content is refused."""
+    patch = make_patch("a\nb\nc\n", "a\nB\nc\n")
+    with pytest.raises(PatchError):
+        apply_patch("a\nx\nc\n", patch)
+    with pytest.raises(PatchError):
+        apply_patch("a\nb\nc\n", "not a patch")
+    with pytest.raises(PatchError):
+        apply_patch("a\nb\nc\n", "@@ -1,3 +1,3 @@\n a\n-b\n")
@@ -0,0 +1,111 @@
+import os
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+
+from app.scripts import ScriptResult, SubprocessRunner
+from app.workers import BashWorkerPool
+
+
+@pytest_asyncio.fixture
+async def pool() -> AsyncIterator[BashWorkerPool]:
+    """Starts a pool of two workers that are recycled after three runs."""
+    pool = BashWorkerPool(size=2, max_runs=3)
+    await pool.start()
+    yield pool
+    await pool.close()
+
+
+def _script(tmp_path: Path, name: str, body: str) -> Path:
+    path = tmp_path / name
+    path.write_text(f"#!/bin/bash\n{body}\n")
+    return path
+
+
+@pytest.mark.asyncio
+async def test_pool_matches_subprocess_runner(pool: BashWorkerPool, tmp_path: Path) -> None:
+    """Test that a pooled run returns what a fresh bash process returns."""
+    script = _script(
+        tmp_path,
+        "echo.sh",
+        'set -e\necho "name=$(basename "$0") argc=$#"\nfor arg in "$@"; do echo "[$arg]"; done\necho warn >&2',
+    )
+    args = ["--name", "two words", "--emoji", "é"]
+    expected = await SubprocessRunner().run(script, args, 5)
+    result = await pool.run(script, args, 5)
+    assert result == expected
+    assert result.stdout.decode() == "name=echo.sh argc=4\n[--name]\n[two words]\n[--emoji]\n[é]\n"
+    assert result.stderr == b"warn\n"
+
+
+@pytest.mark.asyncio
+async def test_exit_and_errexit_do_not_kill_the_worker(pool: BashWorkerPool, tmp_path: Path) -> None:
+    """Test that exit and set -e failures end the run but not the worker."""
+    failing = _script(tmp_path, "fail.sh", "set -e\necho partial\nfalse\necho unreachable")
+    exiting = _script(tmp_path, "exit.sh", "exit 3")
+    assert await pool.run(failing, [], 5) == ScriptResult(1, b"partial\n", b"")
+    assert await pool.run(exiting, [], 5) == ScriptResult(3, b"", b"")
+    assert all(worker.alive for worker in pool._idle)
+
+
+@pytest.mark.asyncio
+async def test_timeout_kills_the_worker(pool: BashWorkerPool, tmp_path: Path) -> None:
+    """Test that a timed out script is killed along with its worker."""
+    script = _script(tmp_path, "sleep.sh", "sleep 30")
+    with pytest.raises(TimeoutError):
+        await pool.run(script, [], 0.2)
+    assert len(pool._idle) == 1
+
+    quick = _script(tmp_path, "quick.sh", "echo ok")
+    assert (await pool.run(quick, [], 5)).stdout == b"ok\n"
+
+
+@pytest.mark.asyncio
+async def test_workers_are_recycled(pool: BashWorkerPool, tmp_path: Path) -> None:
+    """Test that a worker is replaced after max_runs runs."""
+    script = _script(tmp_path, "pid.sh", "echo $$")
+    pids = {(await pool.run(script, [], 5)).stdout for _ in range(6)}
+    assert len(pids) > 1
+
+
+@pytest.mark.asyncio
+async def test_changed_script_is_reloaded(pool: BashWorkerPool, tmp_path: Path) -> None:
+    """Test that an edited script is read again on its next run."""
+    script = _script(tmp_path, "version.sh", "echo one")
+    assert (await pool.run(script, [], 5)).stdout == b"one\n"
+    script.write_text("#!/bin/bash\necho two\n")
+    mtime = script.stat().st_mtime + 2
+    os.utime(script, (mtime, mtime))
+    assert (await pool.run(script, [], 5)).stdout == b"two\n"
+
+
+@pytest.mark.asyncio
+async def test_pool_output_is_truncated(tmp_path: Path) -> None:
+    """Test that the pool keeps at most max_output bytes of output."""
+    script = _script(tmp_path, "flood.sh", "head -c 100000 /dev/zero | tr '\\0' x")
+    pool = BashWorkerPool(size=1, max_output=1000)
+    try:
+        result = await pool.run(script, [], 5)
+    finally:
+        await pool.close()
+    assert result.stdout == b"x" * pool.max_output
+    assert result.truncated
+
+
+@pytest.mark.asyncio
+async def test_output_files_stop_growing_at_the_limit(tmp_path: Path) -> None:
+    """Test that a noisy script cannot fill the disk and still runs to the end."""
+    max_output = 1000
+    pool = BashWorkerPool(size=1, max_output=max_output)
+    await pool.start()
+    worker = pool._idle[0]
+    script = _script(tmp_path, "noisy.sh", "head -c 10000000 /dev/zero | tr '\\0' x\necho done >&2")
+    result = await pool.run(script, [], 5)
+    assert (result.returncode, len(result.stdout), result.truncated) == (0, max_output, True)
+    # Writes past the limit fail, the script carries on
+    assert b"File too large" in result.stderr
+    assert result.stderr.endswith(b"done\n")
+    assert (Path(worker.directory) / "stdout").stat().st_size < 2 * max_output + 1024
+    await pool.close()